@@ -10,6 +10,8 @@ from langchain_community.vectorstores import FAISS
 from sec_api import QueryApi
 from unstructured.partition.html import partition_html
 
+from tools.cached_embeddings import CachedEmbeddings
+
 class SECTools():
   @tool("Search 10-Q form")
   def search_10q(data):
@@ -84,7 +86,7 @@ class SECTools():
     )
     docs = text_splitter.create_documents([content])
     retriever = FAISS.from_documents(
-      docs, OpenAIEmbeddings()
+      docs, CachedEmbeddings(OpenAIEmbeddings())
     ).as_retriever()
     answers = retriever.get_relevant_documents(ask, top_k=4)
     answers = "\n\n".join([a.page_content for a in answers])
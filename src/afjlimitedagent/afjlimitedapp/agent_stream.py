@@ -0,0 +1,119 @@
+"""
+Streaming runs of the AFJ data scientist agent on one shared asyncio loop.
+
+The loop lives on a daemon thread for the whole process. Every chat turn is a coroutine on it, so
+sessions interleave while they wait on the LLM, and sync tools are run by LangChain in executor
+threads, so a slow tool call does not hold up the other sessions either. The Streamlit script
+thread reads the events of its turn from a queue as they are produced:
+
+{"type": "token", "text": ...}                         a chunk of model output
+{"type": "tool_start", "name": ..., "input": ...}       a tool call started
+{"type": "tool_end", "name": ..., "output": ...}        a tool call returned
+{"type": "final", "result": ..., "message": ...}        the answer, same shape as run_agent_executor
+{"type": "error", "error": ...}
+
+Every turn records its time to first token and total time.
+"""
+import time
+import queue
+import asyncio
+import threading
+from collections import deque
+import numpy as np
+
+METRICS_WINDOW = 1000
+_DONE = object()
+
+
+class TurnMetrics:
+    """
+    Rolling time to first token and turn duration, plus counters
+    """
+
+    def __init__(self):
+        self.first_token = deque(maxlen=METRICS_WINDOW)
+        self.durations = deque(maxlen=METRICS_WINDOW)
+        self.turns = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def record(self, turn):
+        with self.lock:
+            self.turns += 1
+            self.errors += turn["error"]
+            self.durations.append(turn["total_seconds"])
+            if turn["first_token_seconds"] is not None:
+                self.first_token.append(turn["first_token_seconds"])
+
+    def snapshot(self):
+        with self.lock:
+            first_token = np.array(self.first_token) * 1000
+            durations = np.array(self.durations) * 1000
+            turns, errors = self.turns, self.errors
+
+        def percentile(values, q):
+            return float(np.percentile(values, q)) if len(values) else None
+
+        return {
+            "turns": turns,
+            "errors": errors,
+            "p50_first_token_ms": percentile(first_token, 50),
+            "p99_first_token_ms": percentile(first_token, 99),
+            "p50_turn_ms": percentile(durations, 50),
+            "p99_turn_ms": percentile(durations, 99),
+        }
+
+
+class AgentStreamRunner:
+    """
+    Runs async event streams on a background loop and hands their events to sync callers
+    """
+
+    def __init__(self, stream_turn, max_concurrent_turns=16):
+        self.stream_turn = stream_turn
+        self.metrics = TurnMetrics()
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="agent-stream-loop", daemon=True)
+        self.thread.start()
+        self.slots = asyncio.run_coroutine_threadsafe(self._make_slots(max_concurrent_turns), self.loop).result()
+
+    async def _make_slots(self, count):
+        return asyncio.Semaphore(count)
+
+    async def _produce(self, query, events, turn):
+        start = time.perf_counter()
+        try:
+            async with self.slots:
+                async for event in self.stream_turn(query):
+                    if turn["first_token_seconds"] is None and event["type"] in ("token", "final"):
+                        turn["first_token_seconds"] = time.perf_counter() - start
+                    if event["type"] == "tool_start":
+                        turn["tool_calls"] += 1
+                    events.put(event)
+        except Exception as e:
+            turn["error"] = True
+            events.put({"type": "error", "error": str(e)})
+        finally:
+            turn["total_seconds"] = time.perf_counter() - start
+            self.metrics.record(turn)
+            events.put(_DONE)
+
+    def stream(self, query, turn=None):
+        """
+        Start a turn on the loop and yield its events in the calling thread.
+        turn is filled in with first_token_seconds, total_seconds, tool_calls and error
+        """
+        turn = {} if turn is None else turn
+        turn.update({"first_token_seconds": None, "total_seconds": None, "tool_calls": 0, "error": False})
+        events = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(self._produce(query, events, turn), self.loop)
+        try:
+            while True:
+                event = events.get()
+                if event is _DONE:
+                    return
+                yield event
+        finally:
+            # the reader went away (the page was rerun), nobody needs the rest of the turn
+            if not future.done():
+                future.cancel()
@@ -0,0 +1,127 @@
+"""
+Pre-aggregated cube of the AFJ dataset for the dashboard filters.
+
+For every source x destination x condition x day the cube stores count, sum, sum of squares,
+min and max of the coolant temperature, engine rpm and vehicle speed. It is built per day
+partition while the dataset store ingests and saved next to it, so KPI and histogram queries
+never touch the raw rows.
+"""
+import os
+import numpy as np
+import pandas as pd
+
+CUBE_FILE = "cube.parquet"
+CUBE_KEYS = ["source", "destination", "condition", "date"]
+MEASURES = {
+    "coolant": "Engine Coolant Temperature [°C]",
+    "rpm": "Engine RPM [RPM]",
+    "speed": "Vehicle Speed Sensor [km/h]",
+}
+STATISTICS = ["count", "sum", "sumsq", "min", "max"]
+
+
+def build_cube(df: pd.DataFrame):
+    """
+    Aggregate processed rows into cube cells, one row per source, destination, condition and day
+    """
+    values = {}
+    for name, column in MEASURES.items():
+        values[f"{name}_value"] = df[column].to_numpy(dtype=float)
+        values[f"{name}_square"] = values[f"{name}_value"] ** 2
+    keys = {key: df[key].astype(str).to_numpy() for key in ["source", "destination", "condition"]}
+    keys["date"] = pd.to_datetime(df["date"]).dt.normalize().to_numpy()
+    grouped = pd.DataFrame({**keys, **values}).groupby(CUBE_KEYS, sort=True)
+
+    cube = {}
+    for name in MEASURES:
+        cube[f"{name}_count"] = grouped[f"{name}_value"].count()
+        cube[f"{name}_sum"] = grouped[f"{name}_value"].sum()
+        cube[f"{name}_sumsq"] = grouped[f"{name}_square"].sum()
+        cube[f"{name}_min"] = grouped[f"{name}_value"].min()
+        cube[f"{name}_max"] = grouped[f"{name}_value"].max()
+    cube["rows"] = grouped.size()
+    return pd.DataFrame(cube).reset_index()
+
+
+def write_cube(cube: pd.DataFrame, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    cube.to_parquet(path + ".tmp", index=False)
+    os.replace(path + ".tmp", path)
+
+
+def _combine(cells: pd.DataFrame):
+    combined = {}
+    for name in MEASURES:
+        combined[f"{name}_count"] = cells[f"{name}_count"].sum()
+        combined[f"{name}_sum"] = cells[f"{name}_sum"].sum()
+        combined[f"{name}_sumsq"] = cells[f"{name}_sumsq"].sum()
+        combined[f"{name}_min"] = cells[f"{name}_min"].min()
+        combined[f"{name}_max"] = cells[f"{name}_max"].max()
+    combined["rows"] = cells["rows"].sum()
+    return combined
+
+
+def _kpis(combined):
+    kpis = {}
+    for name in MEASURES:
+        count = combined[f"{name}_count"]
+        mean = combined[f"{name}_sum"] / count if count else np.nan
+        variance = combined[f"{name}_sumsq"] / count - mean ** 2 if count else np.nan
+        kpis[name] = {
+            "count": int(count),
+            "mean": mean,
+            "std": float(np.sqrt(max(variance, 0))) if count else np.nan,
+            "min": combined[f"{name}_min"] if count else np.nan,
+            "max": combined[f"{name}_max"] if count else np.nan,
+        }
+    return kpis
+
+
+class AggregateCube:
+    """
+    Answers route KPIs and condition histograms from the cube.
+    Whole history queries are dictionary lookups precomputed at load time, date range queries
+    only combine the cube cells of the selected days
+    """
+
+    def __init__(self, cube: pd.DataFrame):
+        self.cube = cube
+        self._route_kpis = {}
+        self._route_conditions = {}
+        # None stands for "any" so every filter combination is answered by a lookup
+        for source in [None] + sorted(cube["source"].unique()):
+            for destination in [None] + sorted(cube["destination"].unique()):
+                cells = self._cells(source, destination)
+                self._route_kpis[(source, destination)] = _kpis(_combine(cells))
+                self._route_conditions[(source, destination)] = cells.groupby("condition")["rows"].sum().rename("count")
+
+    def _cells(self, source=None, destination=None, start_date=None, end_date=None):
+        mask = np.ones(len(self.cube), dtype=bool)
+        if source is not None:
+            mask &= (self.cube["source"] == source).to_numpy()
+        if destination is not None:
+            mask &= (self.cube["destination"] == destination).to_numpy()
+        if start_date is not None:
+            mask &= (self.cube["date"] >= pd.Timestamp(start_date)).to_numpy()
+        if end_date is not None:
+            mask &= (self.cube["date"] <= pd.Timestamp(end_date)).to_numpy()
+        return self.cube[mask]
+
+    def kpis(self, source=None, destination=None, start_date=None, end_date=None):
+        """
+        count, mean, std, min and max of every measure for the route, e.g. kpis("CW", "RT")["speed"]["mean"]
+        """
+        if start_date is None and end_date is None:
+            return self._route_kpis.get((source, destination)) or _kpis(_combine(self.cube.iloc[:0]))
+        return _kpis(_combine(self._cells(source, destination, start_date, end_date)))
+
+    def condition_counts(self, source=None, destination=None, start_date=None, end_date=None):
+        """
+        Number of rows per condition for the route, the data behind the condition histogram
+        """
+        if start_date is None and end_date is None:
+            counts = self._route_conditions.get((source, destination))
+            if counts is None:
+                return pd.Series([], dtype=int, name="count", index=pd.Index([], name="condition"))
+            return counts
+        return self._cells(source, destination, start_date, end_date).groupby("condition")["rows"].sum().rename("count")
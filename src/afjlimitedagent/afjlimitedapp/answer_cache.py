@@ -0,0 +1,186 @@
+"""
+Two tier response cache for the AFJ data scientist agent and its tools.
+
+Tier one matches the normalized query text exactly, tier two matches the nearest cached query
+embedding above a cosine similarity threshold. Entries live in SQLite (embeddings as float32
+blobs) with a TTL and least recently used eviction, and are dropped when the dataset version
+they were answered against changes.
+
+A semantic match is only accepted when both queries mention the same numbers and the same
+location codes in the same order, so "average speed from CW to RT" never answers
+"average speed from RT to CW" however close the embeddings are.
+"""
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+import numpy as np
+from categories import locations
+
+ANSWER_CACHE_PATH = "../answer_cache/answers.sqlite"
+
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+_WORD = re.compile(r"[^\W_]+")
+_POSSESSIVE = re.compile(r"(\w)'s\b")
+LOCATION_CODES = {location.lower() for location in locations}
+_PUNCTUATION = re.compile(r"[^\w\s.]")
+
+
+def normalize_query(query):
+    query = _PUNCTUATION.sub(" ", query.lower())
+    return " ".join(query.split()).strip(" .")
+
+
+def query_signature(query):
+    # numbers and location codes, in any case, have to agree in order for a semantic hit;
+    # "what's" is dropped to "what" so its s is not read as the location S
+    words = _WORD.findall(_POSSESSIVE.sub(r"\1", query.lower()))
+    return json.dumps([_NUMBER.findall(query), [word.upper() for word in words if word in LOCATION_CODES]])
+
+
+class AnswerCache:
+    """
+    Responses are stored per namespace (the agent or a tool name) and per dataset version
+    """
+
+    def __init__(self, path=ANSWER_CACHE_PATH, embed_query=None, ttl_seconds=24 * 3600,
+                 max_entries=5000, similarity_threshold=0.95):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.embed_query = embed_query
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS answers (
+                namespace TEXT NOT NULL,
+                query_key TEXT NOT NULL,
+                signature TEXT NOT NULL,
+                version TEXT NOT NULL,
+                response TEXT NOT NULL,
+                embedding BLOB,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (namespace, query_key)
+            )""")
+        self.connection.commit()
+        # per namespace matrix of normalized embeddings, rebuilt lazily after writes
+        self._matrices = {}
+        self.metrics = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+
+    def _embed(self, query):
+        if self.embed_query is None:
+            return None
+        vector = np.asarray(self.embed_query(query), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _expire(self, namespace, version, now):
+        deleted = self.connection.execute(
+            "DELETE FROM answers WHERE namespace = ? AND (version != ? OR created < ?)",
+            (namespace, version, now - self.ttl_seconds)).rowcount
+        if deleted:
+            self.connection.commit()
+            self._matrices.pop(namespace, None)
+
+    def _matrix(self, namespace):
+        if namespace not in self._matrices:
+            rows = self.connection.execute(
+                "SELECT query_key, signature, embedding FROM answers WHERE namespace = ? AND embedding IS NOT NULL",
+                (namespace,)).fetchall()
+            keys = [row[0] for row in rows]
+            signatures = [row[1] for row in rows]
+            matrix = np.stack([np.frombuffer(row[2], dtype=np.float32) for row in rows]) if rows else None
+            self._matrices[namespace] = (keys, signatures, matrix)
+        return self._matrices[namespace]
+
+    def lookup(self, namespace, query, version=None):
+        """
+        Returns (hit, response, embedding), the embedding is handed back so a miss can be stored without re-embedding
+        """
+        version = str(version)
+        key = normalize_query(query)
+        now = time.time()
+        with self.lock:
+            self._expire(namespace, version, now)
+            row = self.connection.execute(
+                "SELECT response FROM answers WHERE namespace = ? AND query_key = ?", (namespace, key)).fetchone()
+            if row is not None:
+                self._touch(namespace, key, now)
+                self.metrics["exact_hits"] += 1
+                return True, json.loads(row[0]), None
+
+        embedding = self._embed(query)
+        if embedding is not None:
+            signature = query_signature(query)
+            with self.lock:
+                keys, signatures, matrix = self._matrix(namespace)
+                if matrix is not None and matrix.shape[1] == embedding.shape[0]:
+                    similarity = matrix @ embedding
+                    for index in np.argsort(-similarity):
+                        if similarity[index] < self.similarity_threshold:
+                            break
+                        if signatures[index] != signature:
+                            continue
+                        row = self.connection.execute(
+                            "SELECT response FROM answers WHERE namespace = ? AND query_key = ?",
+                            (namespace, keys[index])).fetchone()
+                        if row is None:
+                            continue
+                        self._touch(namespace, keys[index], now)
+                        self.metrics["semantic_hits"] += 1
+                        return True, json.loads(row[0]), embedding
+        with self.lock:
+            self.metrics["misses"] += 1
+        return False, None, embedding
+
+    def _touch(self, namespace, key, now):
+        self.connection.execute(
+            "UPDATE answers SET last_used = ? WHERE namespace = ? AND query_key = ?", (now, namespace, key))
+        self.connection.commit()
+
+    def store(self, namespace, query, response, version=None, embedding=None):
+        version = str(version)
+        now = time.time()
+        if embedding is None:
+            embedding = self._embed(query)
+        blob = embedding.astype(np.float32).tobytes() if embedding is not None else None
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (namespace, normalize_query(query), query_signature(query), version,
+                 json.dumps(response), blob, now, now))
+            # least recently used entries go first once the cache is full
+            self.connection.execute(
+                "DELETE FROM answers WHERE rowid IN (SELECT rowid FROM answers ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,))
+            self.connection.commit()
+            self._matrices.clear()
+
+    def cached_call(self, namespace, query, compute, version=None, cacheable=None):
+        """
+        Return the cached response for the query or compute, store and return it
+        """
+        hit, response, embedding = self.lookup(namespace, query, version)
+        if hit:
+            return response
+        response = compute()
+        if cacheable is None or cacheable(response):
+            self.store(namespace, query, response, version, embedding)
+        return response
+
+    def stats(self):
+        with self.lock:
+            metrics = dict(self.metrics)
+            metrics["entries"] = self.connection.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        lookups = metrics["exact_hits"] + metrics["semantic_hits"] + metrics["misses"]
+        metrics["hit_rate"] = (metrics["exact_hits"] + metrics["semantic_hits"]) / lookups if lookups else 0.0
+        return metrics
+
+    def clear(self):
+        with self.lock:
+            self.connection.execute("DELETE FROM answers")
+            self.connection.commit()
+            self._matrices.clear()
@@ -0,0 +1,188 @@
+"""
+Batch scoring for the AFJ velocity (ARIMA) and condition (random forest) models.
+
+Inputs can be a DataFrame, a dictionary of arrays or an iterator of records, keyed either by the
+dataset column names or by the argument names of the agent tools. Categoricals are encoded with
+precomputed lookups and every micro-batch is scored with a single model call.
+
+python batch_inference.py velocity drives.parquet velocity.parquet --chunk-size 50000
+python batch_inference.py condition drives.csv conditions.csv
+"""
+import os
+import argparse
+import itertools
+import numpy as np
+import pandas as pd
+from categories import locations, conditions
+from tools import get_arima_model, get_random_forest_model
+
+ARIMA_FEATURES = ['Engine Coolant Temperature [°C]', 'Intake Manifold Absolute Pressure [kPa]',
+                  'Engine RPM [RPM]', 'source', 'destination', 'condition']
+FOREST_FEATURES = ['Vehicle Speed Sensor [km/h]', 'source', 'destination', 'hour', 'minute']
+
+# tool argument names mapped onto the dataset column names the models were trained on
+FEATURE_ALIASES = {
+    "engine_coolant_temp": 'Engine Coolant Temperature [°C]',
+    "intake_manifold_pressure": 'Intake Manifold Absolute Pressure [kPa]',
+    "engine_rpm": 'Engine RPM [RPM]',
+    "vehicle_speed": 'Vehicle Speed Sensor [km/h]',
+}
+
+LOCATION_CATEGORIES = pd.Index(locations)
+CONDITION_CATEGORIES = pd.Index(conditions)
+CONDITION_NAMES = np.array(conditions, dtype=object)
+
+
+def _encode(values, categories, name):
+    codes = categories.get_indexer(pd.Index(np.asarray(values, dtype=object)))
+    if (codes < 0).any():
+        unknown = sorted(set(np.asarray(values, dtype=object)[codes < 0]))
+        raise ValueError(f"Unknown {name} values {unknown}, expected one of {list(categories)}")
+    return codes
+
+
+def _as_frame(data):
+    if isinstance(data, pd.DataFrame):
+        df = data
+    else:
+        df = pd.DataFrame(data)
+    return df.rename(columns=FEATURE_ALIASES)
+
+
+def prepare_arima_features(data):
+    df = _as_frame(data)
+    return pd.DataFrame({
+        ARIMA_FEATURES[0]: df[ARIMA_FEATURES[0]].astype(float).to_numpy(),
+        ARIMA_FEATURES[1]: df[ARIMA_FEATURES[1]].astype(float).to_numpy(),
+        ARIMA_FEATURES[2]: df[ARIMA_FEATURES[2]].astype(float).to_numpy(),
+        'source': _encode(df['source'], LOCATION_CATEGORIES, 'source'),
+        'destination': _encode(df['destination'], LOCATION_CATEGORIES, 'destination'),
+        'condition': _encode(df['condition'], CONDITION_CATEGORIES, 'condition'),
+    })
+
+
+def prepare_forest_features(data):
+    df = _as_frame(data)
+    if 'hour' not in df.columns and 'Time' in df.columns:
+        times = pd.to_datetime(df['Time'])
+        df = df.assign(hour=times.dt.hour, minute=times.dt.minute)
+    return pd.DataFrame({
+        FOREST_FEATURES[0]: df[FOREST_FEATURES[0]].astype(float).to_numpy(),
+        'source': _encode(df['source'], LOCATION_CATEGORIES, 'source'),
+        'destination': _encode(df['destination'], LOCATION_CATEGORIES, 'destination'),
+        'hour': df['hour'].astype(int).to_numpy(),
+        'minute': df['minute'].astype(int).to_numpy(),
+    })
+
+
+def _forecast(model, X, row):
+    return float(np.asarray(model.forecast(steps=1, exog=X.iloc[row:row + 1]))[0])
+
+
+def predict_velocity(data):
+    """
+    Predict the vehicle velocity in km/h for every row, scored independently like predict-vehicle-velocity.
+    The model is a regression with ARIMA errors, so its one step forecast is linear in the exogenous
+    row: forecast(x) = forecast(x0) + (x - x0) . beta. One forecast call for the first row and a
+    matrix product give the same numbers as one forecast call per row. The row furthest from the
+    first is forecast as well, when it disagrees (a model with a non-linear transform, or without
+    a coefficient per feature) every row gets its own forecast call
+    """
+    X = prepare_arima_features(data)
+    if len(X) == 0:
+        return np.empty(0)
+    model = get_arima_model()
+    base = _forecast(model, X, 0)
+    values = X.to_numpy(dtype=float)
+    try:
+        beta = np.asarray(model.params[ARIMA_FEATURES], dtype=float)
+    except (KeyError, TypeError, AttributeError):
+        beta = None
+    if beta is not None:
+        predictions = base + (values - values[0]) @ beta
+        probe = int(np.abs(values - values[0]).sum(axis=1).argmax())
+        if probe == 0 or np.isclose(predictions[probe], _forecast(model, X, probe), rtol=1e-6, atol=1e-6):
+            return predictions
+    return np.array([base] + [_forecast(model, X, row) for row in range(1, len(X))])
+
+
+def predict_condition(data):
+    """
+    Predict the vehicle condition name for every row with a single random forest predict call
+    """
+    X = prepare_forest_features(data)
+    if len(X) == 0:
+        return np.empty(0, dtype=object)
+    return CONDITION_NAMES[get_random_forest_model().predict(X)]
+
+
+PREDICTORS = {
+    "velocity": predict_velocity,
+    "condition": predict_condition,
+}
+
+
+def iter_predictions(records, kind, batch_size=1024):
+    """
+    Score an iterator of record dictionaries in micro-batches, yielding one prediction per record
+    """
+    predict = PREDICTORS[kind]
+    records = iter(records)
+    while True:
+        batch = list(itertools.islice(records, batch_size))
+        if not batch:
+            return
+        yield from predict(batch)
+
+
+def _iter_file_chunks(path, chunk_size):
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+
+def score_file(kind, input_path, output_path, chunk_size=50_000):
+    """
+    Score a parquet or csv file chunk by chunk and write the input rows plus a prediction column
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    predict = PREDICTORS[kind]
+    column = f"predicted_{kind}"
+    writer = None
+    rows = 0
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    try:
+        for chunk in _iter_file_chunks(input_path, chunk_size):
+            chunk = chunk.assign(**{column: predict(chunk)})
+            if output_path.endswith(".parquet"):
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(output_path, table.schema)
+                writer.write_table(table)
+            else:
+                chunk.to_csv(output_path, mode="a", header=rows == 0, index=False)
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a telemetry file with the AFJ models")
+    parser.add_argument("kind", choices=sorted(PREDICTORS))
+    parser.add_argument("input_path")
+    parser.add_argument("output_path")
+    parser.add_argument("--chunk-size", type=int, default=50_000)
+    args = parser.parse_args()
+    rows = score_file(args.kind, args.input_path, args.output_path, chunk_size=args.chunk_size)
+    print(f"Scored {rows} rows into {args.output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Benchmark the grouped postprocess_dataset against the original per group loop on synthetic telemetry.
+
+python benchmark_postprocess.py --rows 2000000 --days 30
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from ingest_data import TRANSLATION_MAP, postprocess_dataset, _postprocess_dataset_loop
+
+LOCATIONS = ['CW', 'RT', 'S', 'KA', 'BB']
+CONDITIONS = sorted(set(TRANSLATION_MAP.values()))
+
+
+def make_synthetic_telemetry(rows, days, seed=0):
+    rng = np.random.default_rng(seed)
+    day_index = rng.integers(0, days, rows)
+    dates = pd.date_range("2019-01-01", periods=days, freq="D")
+    seconds = rng.integers(6 * 3600, 20 * 3600, rows)
+    times = dates[day_index] + pd.to_timedelta(seconds, unit="s")
+    source = rng.integers(0, len(LOCATIONS), rows)
+    # never drive to the location we started from
+    destination = (source + rng.integers(1, len(LOCATIONS), rows)) % len(LOCATIONS)
+    df = pd.DataFrame({
+        "Time": times.strftime("%Y-%m-%d %H:%M:%S"),
+        "Engine Coolant Temperature [°C]": rng.normal(90, 3, rows),
+        "Engine Coolant Temperature [Â°C]": rng.normal(90, 3, rows),
+        "Intake Air Temperature [Â°C]": rng.normal(20, 3, rows),
+        "Ambient Air Temperature [Â°C]": rng.normal(10, 3, rows),
+        "Intake Manifold Absolute Pressure [kPa]": rng.normal(100, 5, rows),
+        "Engine RPM [RPM]": rng.normal(2000, 300, rows),
+        "Vehicle Speed Sensor [km/h]": rng.uniform(0, 130, rows),
+        "Accelerator Pedal Position E [%]": np.where(rng.random(rows) < 0.05, np.nan, rng.random(rows)),
+        "date": pd.Categorical(dates[day_index].strftime("%Y%m%d")),
+        "brand": pd.Categorical(["Seat"] * rows),
+        "model": pd.Categorical(["Leon"] * rows),
+        "source": pd.Categorical.from_codes(source, LOCATIONS),
+        "destination": pd.Categorical.from_codes(destination, LOCATIONS),
+        "condition": pd.Categorical.from_codes(rng.integers(0, len(CONDITIONS), rows), CONDITIONS),
+    })
+    return df
+
+
+def timed(function, df):
+    start = time.perf_counter()
+    result = function(df)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--days", type=int, default=30)
+    args = parser.parse_args()
+
+    df = make_synthetic_telemetry(args.rows, args.days)
+    print(f"Synthetic telemetry: {len(df)} rows over {args.days} days")
+
+    old, old_seconds = timed(_postprocess_dataset_loop, df)
+    new, new_seconds = timed(postprocess_dataset, df)
+    pd.testing.assert_frame_equal(old, new)
+
+    print(f"per group loop : {old_seconds:.2f}s")
+    print(f"grouped pass   : {new_seconds:.2f}s")
+    print(f"speedup        : {old_seconds / new_seconds:.1f}x ({len(new)} output rows, identical)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+"""
+Category values of the AFJ dataset, in the order the models' label encodings were trained on.
+
+Kept apart from tools.py so modules that only need the values (the query planner, the answer cache)
+do not import langchain.
+"""
+brands = ['Seat']
+models = ['Leon']
+locations = ['CW', 'RT', 'S', 'KA', 'BB']
+conditions = ['Normal',
+  'Free',
+  'Traffic',
+  'Emergency Braking',
+  'Normal Icy Road',
+  'Free Accelaration',
+  'Traffic Jam Measurement error']
@@ -0,0 +1 @@
+# pytest puts this directory on sys.path, the tests import the app modules the way streamlit run does
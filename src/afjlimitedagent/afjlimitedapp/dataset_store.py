@@ -0,0 +1,243 @@
+"""
+Partitioned parquet cache of the processed AFJ dataset.
+
+Every drive day is stored as its own parquet partition next to a manifest that records the
+mtime, size and sha1 of the csv files it was built from. Refreshing the store only re-ingests
+the days whose csv files were added, changed or removed, and reads prune partitions by
+date, source and destination before any parquet is opened.
+"""
+import os
+import json
+import hashlib
+import pandas as pd
+import pyarrow.dataset as ds
+from ingest_data import DATA_DIRECTORY, list_drive_files, parse_file_keys, load_dataset, postprocess_dataset
+from aggregate_cube import CUBE_FILE, MEASURES, AggregateCube, build_cube, write_cube
+
+CACHE_DIRECTORY = "../dataset_cache/"
+MANIFEST_FILE = "manifest.json"
+INDEX_COLUMN = "RoundedTime"
+
+
+def _file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_manifest(cache_directory):
+    path = os.path.join(cache_directory, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {"version": None, "files": {}, "partitions": {}}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _write_manifest(cache_directory, manifest):
+    # write then rename so a reader never sees a half written manifest
+    path = os.path.join(cache_directory, MANIFEST_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def _manifest_version(manifest):
+    digest = hashlib.sha1()
+    for name in sorted(manifest["files"]):
+        digest.update(f"{name}:{manifest['files'][name]['sha1']}".encode())
+    return digest.hexdigest()[:16]
+
+
+def _partition_path(cache_directory, date):
+    return os.path.join(cache_directory, f"date={date}", "part.parquet")
+
+
+def _partition_cube_path(cache_directory, date):
+    return os.path.join(cache_directory, f"date={date}", CUBE_FILE)
+
+
+def _write_partition(cache_directory, date, df):
+    path = _partition_path(cache_directory, date)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    df.reset_index().to_parquet(path + ".tmp", index=False)
+    os.replace(path + ".tmp", path)
+    # the day's slice of the aggregate cube is built while the rows are still in memory
+    write_cube(build_cube(df), _partition_cube_path(cache_directory, date))
+    return {
+        "path": os.path.relpath(path, cache_directory),
+        "rows": len(df),
+        "sources": sorted(df["source"].astype(str).unique().tolist()),
+        "destinations": sorted(df["destination"].astype(str).unique().tolist()),
+    }
+
+
+def _remove_partition(cache_directory, partitions, date):
+    for path in [_partition_path(cache_directory, date), _partition_cube_path(cache_directory, date)]:
+        if os.path.exists(path):
+            os.remove(path)
+    del partitions[date]
+
+
+def refresh_dataset_cache(data_directory=DATA_DIRECTORY, cache_directory=CACHE_DIRECTORY):
+    """
+    Bring the parquet store in line with the csv files in the data directory.
+    Files are compared by mtime and size first and by sha1 only when those changed,
+    and only the days that own a new, changed or removed file are rebuilt.
+    Returns the manifest
+    """
+    os.makedirs(cache_directory, exist_ok=True)
+    manifest = _read_manifest(cache_directory)
+    known_files = manifest["files"]
+
+    current_files = {}
+    dirty_dates = set()
+    # files that were only touched keep their partition, but their new mtime has to be saved
+    touched = False
+    for file in list_drive_files(data_directory):
+        path = os.path.join(data_directory, file)
+        stat = os.stat(path)
+        entry = known_files.get(file)
+        if entry and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+            current_files[file] = entry
+            continue
+        sha1 = _file_sha1(path)
+        date = parse_file_keys(file)["date"]
+        if entry is None or entry["sha1"] != sha1:
+            dirty_dates.add(date)
+        touched = True
+        current_files[file] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha1": sha1, "date": date}
+
+    # days that lost a file have to be rebuilt (or dropped) as well
+    for file in set(known_files) - set(current_files):
+        dirty_dates.add(known_files[file]["date"])
+
+    if not dirty_dates and manifest["version"] is not None:
+        if not os.path.exists(os.path.join(cache_directory, CUBE_FILE)):
+            _write_combined_cube(cache_directory, manifest["partitions"])
+        if touched:
+            manifest["files"] = current_files
+            _write_manifest(cache_directory, manifest)
+        return manifest
+
+    partitions = manifest["partitions"]
+    files_to_ingest = [file for file, entry in current_files.items() if entry["date"] in dirty_dates]
+    if files_to_ingest:
+        print(f"Rebuilding dataset cache for {len(dirty_dates)} day(s) from {len(files_to_ingest)} file(s)")
+        df = postprocess_dataset(load_dataset(data_directory, files=files_to_ingest))
+        df_dates = df["date"].dt.strftime("%Y%m%d")
+        for date in dirty_dates:
+            day_df = df[df_dates == date]
+            if len(day_df):
+                partitions[date] = _write_partition(cache_directory, date, day_df)
+            elif date in partitions:
+                # the day's files are still there but no rows are left after postprocessing
+                _remove_partition(cache_directory, partitions, date)
+
+    # remove days that have no files left
+    remaining_dates = {entry["date"] for entry in current_files.values()}
+    for date in list(partitions):
+        if date not in remaining_dates:
+            _remove_partition(cache_directory, partitions, date)
+
+    _write_combined_cube(cache_directory, partitions)
+
+    manifest = {"files": current_files, "partitions": partitions}
+    manifest["version"] = _manifest_version(manifest)
+    _write_manifest(cache_directory, manifest)
+    return manifest
+
+
+def _write_combined_cube(cache_directory, partitions):
+    # the combined cube is small, it is rewritten from the per day cubes whenever a day changes
+    cubes = []
+    for date in sorted(partitions):
+        path = _partition_cube_path(cache_directory, date)
+        if not os.path.exists(path):
+            # stores written before the cube existed get their day cube built from the partition
+            df = pd.read_parquet(_partition_path(cache_directory, date))
+            write_cube(build_cube(df), path)
+        cubes.append(pd.read_parquet(path))
+    cube = pd.concat(cubes, ignore_index=True) if cubes else build_cube(pd.DataFrame(
+        columns=["source", "destination", "condition", "date"] + list(MEASURES.values())))
+    write_cube(cube, os.path.join(cache_directory, CUBE_FILE))
+
+
+def load_cube(cache_directory=CACHE_DIRECTORY, data_directory=DATA_DIRECTORY, refresh=True):
+    """
+    Load the aggregate cube saved next to the dataset partitions
+    """
+    if refresh:
+        refresh_dataset_cache(data_directory, cache_directory)
+    return AggregateCube(pd.read_parquet(os.path.join(cache_directory, CUBE_FILE)))
+
+
+def dataset_version(cache_directory=CACHE_DIRECTORY):
+    """
+    Version of the cached dataset, changes whenever a drive file is added, changed or removed
+    """
+    return _read_manifest(cache_directory)["version"]
+
+
+def dataset_partitions(cache_directory=CACHE_DIRECTORY):
+    return _read_manifest(cache_directory)["partitions"]
+
+
+def _as_list(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return [value]
+    return list(value)
+
+
+def _date_key(value):
+    return pd.Timestamp(value).strftime("%Y%m%d")
+
+
+def load_cached_dataset(columns=None, sources=None, destinations=None, start_date=None, end_date=None,
+                        cache_directory=CACHE_DIRECTORY, data_directory=DATA_DIRECTORY, refresh=True):
+    """
+    Load a slice of the processed dataset from the parquet store.
+    Only the requested columns are read, partitions are pruned by date range, source and destination
+    from the manifest, and the source and destination filters are pushed down into the parquet scan.
+    The returned frame is indexed by RoundedTime like the output of postprocess_dataset
+    """
+    if refresh:
+        manifest = refresh_dataset_cache(data_directory, cache_directory)
+    else:
+        manifest = _read_manifest(cache_directory)
+    sources = _as_list(sources)
+    destinations = _as_list(destinations)
+    start = _date_key(start_date) if start_date is not None else None
+    end = _date_key(end_date) if end_date is not None else None
+
+    paths = []
+    for date, partition in sorted(manifest["partitions"].items()):
+        if start is not None and date < start:
+            continue
+        if end is not None and date > end:
+            continue
+        if sources is not None and not set(sources) & set(partition["sources"]):
+            continue
+        if destinations is not None and not set(destinations) & set(partition["destinations"]):
+            continue
+        paths.append(os.path.join(cache_directory, partition["path"]))
+
+    if not paths:
+        return pd.DataFrame(columns=columns).rename_axis(INDEX_COLUMN)
+
+    dataset = ds.dataset(paths, format="parquet")
+    expression = None
+    if sources is not None:
+        expression = ds.field("source").isin(sources)
+    if destinations is not None:
+        destination_expression = ds.field("destination").isin(destinations)
+        expression = destination_expression if expression is None else expression & destination_expression
+
+    read_columns = None
+    if columns is not None:
+        read_columns = [INDEX_COLUMN] + [column for column in columns if column != INDEX_COLUMN]
+    table = dataset.to_table(columns=read_columns, filter=expression)
+    return table.to_pandas().set_index(INDEX_COLUMN)
@@ -0,0 +1,166 @@
+"""
+Disk cache and background rendering for the AFJ diagrams.
+
+Figures are keyed by a hash of their plot spec (the generated plotting code, or a chart
+description) and the version of the data slice they were drawn from, and stored as PNG or
+plotly JSON files with least recently used eviction. Generated matplotlib code is rendered in
+the sandbox worker processes on background threads, so a page can show a placeholder and pick
+the image up when it is ready; a repeated request is served straight from disk.
+"""
+import os
+import re
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+FIGURE_CACHE_DIRECTORY = "../figure_cache/"
+FIGURE_MARKER = re.compile(r"\[figure:([0-9a-f]{64})\]")
+SAVED_MARKER = "__figure_saved__"
+
+
+def figure_key(spec, version=None):
+    if not isinstance(spec, str):
+        spec = json.dumps(spec, sort_keys=True, default=str)
+    return hashlib.sha256(f"{version}\n{spec}".encode()).hexdigest()
+
+
+class FigureCache:
+    """
+    Directory of rendered figures, the least recently used ones are removed past max_entries or max_bytes
+    """
+
+    def __init__(self, directory=FIGURE_CACHE_DIRECTORY, max_entries=500, max_bytes=200 * 1024 * 1024):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+    def path(self, key, extension):
+        return os.path.join(self.directory, f"{key}.{extension}")
+
+    def get(self, key, extension):
+        path = self.path(key, extension)
+        try:
+            # the modification time doubles as the last used time for eviction
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, extension, data):
+        path = self.path(key, extension)
+        mode = "w" if isinstance(data, str) else "wb"
+        with open(path + ".tmp", mode) as f:
+            f.write(data)
+        return self.commit(key, extension)
+
+    def commit(self, key, extension):
+        path = self.path(key, extension)
+        if os.path.exists(path + ".tmp"):
+            os.replace(path + ".tmp", path)
+        self._evict()
+        return path
+
+    def _evict(self):
+        with self.lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            entries.sort()
+            total = sum(size for _, size, _ in entries)
+            while entries and (len(entries) > self.max_entries or total > self.max_bytes):
+                _, size, path = entries.pop(0)
+                total -= size
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def get_or_build_json(self, spec, version, build):
+        """
+        Return the cached JSON figure for (spec, version), building and storing it on a miss
+        """
+        key = figure_key(spec, version)
+        path = self.get(key, "json")
+        if path is not None:
+            with open(path, "r") as f:
+                return f.read()
+        data = build()
+        self.put(key, "json", data)
+        return data
+
+
+def extract_plot_code(response):
+    """
+    Pull the python code out of a model response, fenced or wrapped in quotes
+    """
+    fenced = re.search(r"```(?:python)?\s*\n(.*?)```", response, re.DOTALL)
+    code = fenced.group(1) if fenced else response.strip().strip("'\"`")
+    return code.strip()
+
+
+def _render_script(code, output_path):
+    # drop the streamlit calls, the figure is written to the cache instead of the page
+    lines = [line for line in code.splitlines()
+             if "st.pyplot" not in line and "import streamlit" not in line and "plt.show" not in line]
+    return "\n".join([
+        "import matplotlib",
+        "matplotlib.use('Agg')",
+        "import matplotlib.pyplot as plt",
+        *lines,
+        "_figure = globals().get('fig') or plt.gcf()",
+        f"_figure.savefig({output_path!r}, format='png', dpi=100, bbox_inches='tight')",
+        f"print({SAVED_MARKER!r})",
+    ])
+
+
+class FigureRenderer:
+    """
+    Renders generated matplotlib code to cached PNG files in the sandbox pool, off the calling thread
+    """
+
+    def __init__(self, cache, sandbox_pool, max_concurrent=2):
+        self.cache = cache
+        self.sandbox_pool = sandbox_pool
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="figure-render")
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def submit(self, code, version=None):
+        """
+        Start rendering (unless the figure is cached or already rendering) and return its key
+        """
+        key = figure_key(code, version)
+        with self.lock:
+            if key in self.pending or self.cache.get(key, "png") is not None:
+                return key
+            self.pending[key] = self.executor.submit(self._render, key, code)
+        return key
+
+    def _render(self, key, code):
+        output = self.sandbox_pool.run(_render_script(code, os.path.abspath(self.cache.path(key, "png") + ".tmp")))
+        if SAVED_MARKER not in output:
+            raise RuntimeError(output.strip() or "the plotting code did not produce a figure")
+        return self.cache.commit(key, "png")
+
+    def wait(self, key, timeout=None):
+        """
+        Path of the rendered PNG, blocks until it is ready; raises the rendering error if it failed
+        """
+        path = self.cache.get(key, "png")
+        if path is not None:
+            return path
+        with self.lock:
+            future = self.pending.get(key)
+        if future is None:
+            raise KeyError(f"no figure {key} is cached or rendering")
+        try:
+            return future.result(timeout=timeout)
+        finally:
+            if future.done():
+                with self.lock:
+                    self.pending.pop(key, None)
@@ -0,0 +1,60 @@
+"""
+Thin client for inference_server.py.
+
+The address comes from AFJ_INFERENCE_ADDRESS, either host:port or unix:/path/to/socket.
+When no server is running the records are scored in process with batch_inference instead.
+"""
+import os
+import json
+import socket
+import http.client
+
+DEFAULT_ADDRESS = "127.0.0.1:8765"
+TIMEOUT_SECONDS = 30
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=TIMEOUT_SECONDS):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+def _connection(address):
+    if address.startswith("unix:"):
+        return UnixHTTPConnection(address[len("unix:"):])
+    host, port = address.rsplit(":", 1)
+    return http.client.HTTPConnection(host, int(port), timeout=TIMEOUT_SECONDS)
+
+
+def _request(method, path, payload=None, address=None):
+    connection = _connection(address or os.environ.get("AFJ_INFERENCE_ADDRESS", DEFAULT_ADDRESS))
+    try:
+        body = json.dumps(payload) if payload is not None else None
+        connection.request(method, path, body=body, headers={"Content-Type": "application/json"})
+        response = connection.getresponse()
+        result = json.loads(response.read())
+    finally:
+        connection.close()
+    if response.status != 200:
+        raise ValueError(result.get("error", f"inference server returned {response.status}"))
+    return result
+
+
+def request_predictions(kind, records, address=None):
+    """
+    Score records ("velocity" or "condition") on the shared inference server
+    """
+    try:
+        return _request("POST", f"/predict/{kind}", {"records": records}, address)["predictions"]
+    except (ConnectionRefusedError, FileNotFoundError):
+        from batch_inference import PREDICTORS
+        return list(PREDICTORS[kind](records))
+
+
+def request_metrics(address=None):
+    return _request("GET", "/metrics", address=address)
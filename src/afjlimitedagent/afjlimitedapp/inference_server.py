@@ -0,0 +1,222 @@
+"""
+Local micro-batching inference service for the AFJ velocity (ARIMA) and condition (random forest) models.
+
+One process loads the pickled models once and every Streamlit session talks to it through
+inference_client.py. Concurrent requests are queued per model and coalesced into micro-batches
+(up to --max-batch-size records, waiting at most --max-wait-ms for more to arrive) which are scored
+with batch_inference on a small worker pool.
+
+python inference_server.py --port 8765
+python inference_server.py --unix-socket /tmp/afj-inference.sock
+
+POST /predict/velocity and /predict/condition with {"records": [...]} return {"predictions": [...]},
+GET /metrics returns p50/p99 latency and a batch size histogram per model.
+"""
+import json
+import time
+import asyncio
+import argparse
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from batch_inference import PREDICTORS
+from tools import get_arima_model, get_random_forest_model
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+LATENCY_WINDOW = 10_000
+
+
+class ModelMetrics:
+    """
+    Rolling request latencies and a power of two histogram of micro-batch sizes
+    """
+
+    def __init__(self):
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.batch_sizes = Counter()
+        self.requests = 0
+        self.batches = 0
+
+    def record_batch(self, size):
+        self.batches += 1
+        bucket = 1
+        while bucket < size:
+            bucket *= 2
+        self.batch_sizes[bucket] += 1
+
+    def record_request(self, seconds):
+        self.requests += 1
+        self.latencies.append(seconds)
+
+    def snapshot(self):
+        latencies = np.array(self.latencies) * 1000
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "p50_latency_ms": float(np.percentile(latencies, 50)) if len(latencies) else None,
+            "p99_latency_ms": float(np.percentile(latencies, 99)) if len(latencies) else None,
+            "batch_size_histogram": {f"<={bucket}": count for bucket, count in sorted(self.batch_sizes.items())},
+        }
+
+
+class MicroBatcher:
+    """
+    Queue of pending requests for one model, drained into micro-batches that run on the worker pool
+    """
+
+    def __init__(self, predict, executor, max_batch_size=512, max_wait=0.005, max_in_flight=2):
+        self.predict = predict
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue()
+        self.slots = asyncio.Semaphore(max_in_flight)
+        self.metrics = ModelMetrics()
+
+    async def submit(self, records):
+        start = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((records, future))
+        try:
+            return await future
+        finally:
+            self.metrics.record_request(time.perf_counter() - start)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.slots.acquire()
+            batch = [await self.queue.get()]
+            size = len(batch[0][0])
+            deadline = loop.time() + self.max_wait
+            while size < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                size += len(item[0])
+            loop.create_task(self._score(batch, size))
+
+    async def _score(self, batch, size):
+        loop = asyncio.get_running_loop()
+        try:
+            self.metrics.record_batch(size)
+            records = [record for request_records, _ in batch for record in request_records]
+            try:
+                predictions = await loop.run_in_executor(self.executor, self.predict, records)
+            except Exception:
+                # one bad record must not fail its neighbours, score the requests on their own
+                for request_records, future in batch:
+                    if future.done():
+                        continue
+                    try:
+                        result = await loop.run_in_executor(self.executor, self.predict, request_records)
+                    except Exception as e:
+                        if not future.done():
+                            future.set_exception(e)
+                        continue
+                    if not future.done():
+                        future.set_result(list(result))
+                return
+            offset = 0
+            for request_records, future in batch:
+                # the caller may have been cancelled while the batch was scored
+                if not future.done():
+                    future.set_result(list(predictions[offset:offset + len(request_records)]))
+                offset += len(request_records)
+        finally:
+            self.slots.release()
+
+
+async def _read_request(reader):
+    request_line = (await reader.readline()).decode().strip()
+    if not request_line:
+        return None, None, None
+    method, path, _ = request_line.split(" ", 2)
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode().strip()
+        if not line:
+            break
+        key, value = line.split(":", 1)
+        headers[key.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get("content-length", 0)))
+    return method, path, body
+
+
+async def _write_response(writer, status, payload):
+    body = json.dumps(payload, default=lambda value: value.item() if hasattr(value, "item") else str(value)).encode()
+    reason = {200: "OK", 400: "Bad Request", 404: "Not Found"}[status]
+    writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+    await writer.drain()
+    writer.close()
+
+
+def make_handler(batchers):
+    async def handle(reader, writer):
+        try:
+            method, path, body = await _read_request(reader)
+            if method is None:
+                writer.close()
+                return
+            if method == "GET" and path == "/metrics":
+                await _write_response(writer, 200, {kind: batcher.metrics.snapshot() for kind, batcher in batchers.items()})
+                return
+            kind = path.rsplit("/", 1)[-1]
+            if method != "POST" or not path.startswith("/predict/") or kind not in batchers:
+                await _write_response(writer, 404, {"error": f"unknown endpoint {method} {path}"})
+                return
+            records = json.loads(body)["records"]
+            predictions = await batchers[kind].submit(records)
+            await _write_response(writer, 200, {"predictions": predictions})
+        except Exception as e:
+            await _write_response(writer, 400, {"error": str(e)})
+    return handle
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, unix_socket=None, workers=2, max_batch_size=512, max_wait_ms=5.0):
+    # load both models before accepting connections so the first request does not pay for it
+    get_arima_model()
+    get_random_forest_model()
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="afj-inference")
+    batchers = {
+        kind: MicroBatcher(predict, executor, max_batch_size=max_batch_size,
+                           max_wait=max_wait_ms / 1000, max_in_flight=workers)
+        for kind, predict in PREDICTORS.items()
+    }
+    runners = [asyncio.create_task(batcher.run()) for batcher in batchers.values()]
+    if unix_socket:
+        server = await asyncio.start_unix_server(make_handler(batchers), path=unix_socket)
+        print(f"AFJ inference server listening on unix:{unix_socket}")
+    else:
+        server = await asyncio.start_server(make_handler(batchers), host=host, port=port)
+        print(f"AFJ inference server listening on {host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        for runner in runners:
+            runner.cancel()
+        executor.shutdown(wait=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-batching inference server for the AFJ models")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix-socket", default=None)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--max-batch-size", type=int, default=512)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, args.unix_socket, args.workers, args.max_batch_size, args.max_wait_ms))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Incremental KPI aggregation for the streaming AFJ dashboard.
+
+Each chunk that arrives is reduced to running sums and counts per (source, destination, condition),
+so an update costs O(chunk) and a KPI query only touches the small aggregate table.
+The detail view keeps the latest rows in a bounded ring buffer instead of the whole stream.
+"""
+from collections import deque
+import numpy as np
+import pandas as pd
+
+KEY_COLUMNS = ["source", "destination", "condition"]
+KPI_COLUMNS = ["Engine Coolant Temperature [°C]", "Engine RPM [RPM]", "Vehicle Speed Sensor [km/h]"]
+
+
+class RingBuffer:
+    """
+    Keeps the most recent `capacity` rows of the frames appended to it
+    """
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.frames = deque()
+        self.size = 0
+
+    def append(self, df: pd.DataFrame):
+        if len(df) == 0:
+            return
+        self.frames.append(df.iloc[-self.capacity:])
+        self.size += len(self.frames[-1])
+        # drop whole frames that fall out of the window, the oldest remaining one is trimmed on read
+        while self.size - len(self.frames[0]) >= self.capacity:
+            self.size -= len(self.frames.popleft())
+
+    def to_frame(self):
+        if not self.frames:
+            return pd.DataFrame()
+        return pd.concat(self.frames).iloc[-self.capacity:]
+
+
+class StreamingKPIEngine:
+    """
+    Running sums and counts of the KPI columns per (source, destination, condition)
+    """
+
+    def __init__(self, value_columns=KPI_COLUMNS, key_columns=KEY_COLUMNS):
+        self.value_columns = list(value_columns)
+        self.key_columns = list(key_columns)
+        self.sums = None
+        self.counts = None
+        self.rows = None
+
+    def update(self, chunk: pd.DataFrame):
+        grouped = chunk.groupby(self.key_columns, observed=True)
+        sums = grouped[self.value_columns].sum()
+        counts = grouped[self.value_columns].count()
+        rows = grouped.size()
+        if self.sums is None:
+            self.sums, self.counts, self.rows = sums, counts, rows
+        else:
+            self.sums = self.sums.add(sums, fill_value=0)
+            self.counts = self.counts.add(counts, fill_value=0)
+            self.rows = self.rows.add(rows, fill_value=0)
+
+    def _select(self, table, source=None, destination=None):
+        if table is None:
+            return None
+        mask = np.ones(len(table), dtype=bool)
+        if source is not None:
+            mask &= table.index.get_level_values("source") == source
+        if destination is not None:
+            mask &= table.index.get_level_values("destination") == destination
+        return table[mask]
+
+    def means(self, source=None, destination=None):
+        """
+        Mean of every KPI column over the rows seen so far for the route, NaN when there are none
+        """
+        sums = self._select(self.sums, source, destination)
+        counts = self._select(self.counts, source, destination)
+        if sums is None or len(sums) == 0:
+            return {column: np.nan for column in self.value_columns}
+        totals = sums.sum()
+        rows = counts.sum()
+        return {column: totals[column] / rows[column] if rows[column] else np.nan for column in self.value_columns}
+
+    def condition_counts(self, source=None, destination=None):
+        """
+        Number of rows per condition for the route, the data behind the condition histogram
+        """
+        rows = self._select(self.rows, source, destination)
+        if rows is None or len(rows) == 0:
+            # the same shape as a non-empty result, reset_index() still gives condition and count columns
+            return pd.Series([], dtype=int, name="count", index=pd.Index([], name="condition"))
+        return rows.groupby(level="condition", observed=True).sum().rename("count")
@@ -1,4 +1,9 @@
 import streamlit as st
+import tools  # registers the lazy models, indexes and agents
+from resources import warm_up
+
+# start building the agent resources in the background so the agents page is ready when opened
+warm_up()
 
 st.markdown("# Main page 🚀")
 st.sidebar.markdown("# Main page 🚀")
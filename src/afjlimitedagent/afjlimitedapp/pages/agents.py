@@ -1,6 +1,7 @@
 from openai import OpenAI
 import streamlit as st
-from tools import run_agent_executor
+from tools import stream_agent_executor, get_agent_stream_runner, get_figure_renderer
+from figure_cache import FIGURE_MARKER
 
 
 st.title("AFJ limited datascientist agent")
@@ -13,9 +14,21 @@ if "openai_model" not in st.session_state:
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
+def show_figures(response, timeout=60):
+    # diagrams render in the background, a placeholder holds their spot until the PNG is ready
+    for key in FIGURE_MARKER.findall(str(response)):
+        placeholder = st.empty()
+        placeholder.info("Rendering diagram...")
+        try:
+            placeholder.image(get_figure_renderer().wait(key, timeout=timeout))
+        except Exception as e:
+            placeholder.error(f"failed to draw diagram: {e}")
+
+
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
-        st.markdown(message["content"])
+        st.markdown(FIGURE_MARKER.sub("", message["content"]))
+        show_figures(message["content"])
 
 if prompt := st.chat_input("What is up?"):
     st.session_state.messages.append({"role": "user", "content": prompt})
@@ -23,9 +36,35 @@ if prompt := st.chat_input("What is up?"):
         st.markdown(prompt)
      
     with st.chat_message("assistant"):
-        response, message = run_agent_executor(st.session_state.messages[-1])
+        # tokens and tool calls are shown as the agent produces them
+        steps = st.status("Working...", expanded=False)
+        output = st.empty()
+        streamed = ""
+        response, message = None, ""
+        turn = {}
+        for event in stream_agent_executor(prompt, turn):
+            if event["type"] == "token":
+                streamed += event["text"]
+                output.markdown(streamed + "▌")
+            elif event["type"] == "tool_start":
+                steps.write(f"Calling `{event['name']}` with {event['input']}")
+            elif event["type"] == "tool_end":
+                steps.write(f"`{event['name']}` returned {FIGURE_MARKER.sub('', event['output'])[:500]}")
+            elif event["type"] == "final":
+                response, message = event["result"], event["message"]
+            elif event["type"] == "error":
+                response = f"function call failed with error {event['error']}"
+        steps.update(label=f"Done in {turn['total_seconds']:.1f}s", state="error" if turn["error"] else "complete")
+        output.empty()
         st.divider()
         st.caption(message)
+        if turn["first_token_seconds"] is not None:
+            st.caption(f"first token after {turn['first_token_seconds'] * 1000:.0f} ms, "
+                       f"{turn['tool_calls']} tool call(s)")
         st.divider()
-        st.write(response)
-    st.session_state.messages.append({"role": "assistant", "content": response})
+        st.write(FIGURE_MARKER.sub("", str(response)))
+        show_figures(response)
+    st.session_state.messages.append({"role": "assistant", "content": str(response)})
+
+with st.sidebar.expander("Agent latency"):
+    st.json(get_agent_stream_runner().metrics.snapshot())
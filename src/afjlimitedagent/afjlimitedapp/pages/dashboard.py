@@ -1,76 +1,133 @@
 import time 
+import json
 import streamlit as st 
 import plotly.express as px
 import pandas as pd
 import numpy as np
-from ingest_data import DATA_DIRECTORY, load_dataset, postprocess_dataset
+from dataset_store import load_cached_dataset, load_cube, refresh_dataset_cache
+from kpi_engine import StreamingKPIEngine, RingBuffer
+from figure_cache import FigureCache
 
-# read csv from a URL
+# only the columns the dashboard shows are read from the dataset store
+DASHBOARD_COLUMNS = ["Time", "date", "source", "destination", "condition",
+                     "Engine Coolant Temperature [°C]", "Engine RPM [RPM]", "Vehicle Speed Sensor [km/h]"]
+
+STREAM_CHUNKS = 100
+DETAIL_ROWS = 1000
+
+# cached per dataset version so new drive files show up without a restart
 @st.cache_data
-def get_data() -> pd.DataFrame:
-    df = load_dataset(DATA_DIRECTORY)
-    df = postprocess_dataset(df)
+def get_data(version) -> pd.DataFrame:
+    df = load_cached_dataset(columns=DASHBOARD_COLUMNS, refresh=False)
     sources = pd.unique(df["source"])
     destinations = pd.unique(df["destination"])
-    
-    df = pd.concat([df, df])
-    dfs = np.array_split(df, 100)
-    return dfs, sources, destinations
+    return df, sources, destinations
+
+
+def stream_chunks(df, chunks=STREAM_CHUNKS):
+    # simulate a live feed by replaying the dataset twice in chunks, iloc slices so nothing is copied
+    bounds = np.linspace(0, len(df), chunks // 2 + 1, dtype=int)
+    for _ in range(2):
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            yield df.iloc[start:end]
+
+
+# the cube is shared by every session, route KPIs are lookups so changing a filter costs nothing
+@st.cache_resource
+def get_cube(version):
+    return load_cube(refresh=False)
+
+
+@st.cache_resource
+def get_figure_cache():
+    return FigureCache()
+
 
-dfs, sources, destinations = get_data()
+def condition_counts_chart(spec, counts, version):
+    # a chart of the dataset is fixed by (chart spec, dataset version), its plotly figure JSON is cached
+    # under that key; the live chart (spec None) changes every tick and is built without the cache
+    if counts.empty:
+        st.caption("No readings for this route yet")
+        return
+    counts = counts.reset_index()
+    build = lambda: px.bar(data_frame=counts, x="condition", y="count").to_json()
+    figure = build() if spec is None else get_figure_cache().get_or_build_json(spec, version, build)
+    st.plotly_chart(json.loads(figure))
+
+
+version = refresh_dataset_cache()["version"]
+df, sources, destinations = get_data(version)
+cube = get_cube(version)
 
 
 st.markdown("# Dashboard page 📊")
 st.sidebar.markdown("# Dashboard page 📊")
 
 
-df = dfs[0]
-
  # top-level filters
 source_filter = st.selectbox("Select the Source", sources)
 destination_filter = st.selectbox("Select the Source", destinations)
 
 
+st.markdown("### Route overview")
+route_kpis = cube.kpis(source_filter, destination_filter)
+overview1, overview2, overview3 = st.columns(3)
+for column, name, label in [(overview1, "coolant", "Engine Coolant Temperature"),
+                            (overview2, "rpm", "Engine RPM"),
+                            (overview3, "speed", "Vehicle Speed")]:
+    stats = route_kpis[name]
+    column.metric(label=f"Avg. {label}", value=0 if stats["count"] == 0 else round(stats["mean"]))
+    if stats["count"]:
+        column.caption(f"min {stats['min']:.0f} · max {stats['max']:.0f} · std {stats['std']:.1f} · {stats['count']} readings")
+condition_counts_chart({"chart": "route-condition-counts", "source": source_filter, "destination": destination_filter},
+                       cube.condition_counts(source_filter, destination_filter), version)
+
+st.markdown("### Live feed")
 placeholder = st.empty()
 
-
+# KPIs and the histogram are answered from running aggregates, the detail view from a bounded buffer
+kpi_engine = StreamingKPIEngine()
+detail_buffer = RingBuffer(capacity=DETAIL_ROWS)
 
 old_avg_ect =  0
 old_avg_erpm = 0
 old_avg_vs = 0
 
 
-for i in range(1, 100):
-    df = pd.concat([df, dfs[i]])
+def rounded(value):
+    return 0 if np.isnan(value) else round(value)
+
+
+for chunk in stream_chunks(df):
+    kpi_engine.update(chunk)
+    detail_buffer.append(chunk[(chunk["source"] == source_filter) & (chunk["destination"] == destination_filter)])
     
     with placeholder.container():
         # creating a single-element container
-        df = df[df["source"] == source_filter]
-        df = df[df["destination"] == destination_filter]
-        
-        new_avg_ect = np.mean(df["Engine Coolant Temperature [°C]"])
-        new_avg_erpm  = np.mean(df["Engine RPM [RPM]"])
-        new_avg_vs = np.mean(df["Vehicle Speed Sensor [km/h]"])
+        means = kpi_engine.means(source_filter, destination_filter)
+        new_avg_ect = means["Engine Coolant Temperature [°C]"]
+        new_avg_erpm  = means["Engine RPM [RPM]"]
+        new_avg_vs = means["Vehicle Speed Sensor [km/h]"]
          # create three columns
         kpi1, kpi2, kpi3 = st.columns(3)
 
         # fill in those three columns with respective metrics or KPIs
         kpi1.metric(
             label="Avg. Engine Coolant Temperature",
-            value=round(new_avg_ect),
-            delta=round(new_avg_ect - old_avg_ect),
+            value=rounded(new_avg_ect),
+            delta=rounded(new_avg_ect - old_avg_ect),
         )
         
         kpi2.metric(
             label="Avg. Engine RPM",
-            value=round(new_avg_erpm),
-            delta=-round(new_avg_erpm - old_avg_erpm),
+            value=rounded(new_avg_erpm),
+            delta=-rounded(new_avg_erpm - old_avg_erpm),
         )
         
         kpi3.metric(
             label="Avg. Vehicle Speed",
-            value=round(new_avg_vs),
-            delta=-round(new_avg_vs - old_avg_vs),
+            value=rounded(new_avg_vs),
+            delta=-rounded(new_avg_vs - old_avg_vs),
         )
 
         # create two columns for charts
@@ -84,15 +141,12 @@ for i in range(1, 100):
             
         with fig_col2:
             st.markdown("### Vehicle speed per condition")
-            fig2 = px.histogram(data_frame=df, x="condition")
-            st.write(fig2)
+            condition_counts_chart(None, kpi_engine.condition_counts(source_filter, destination_filter), version)
 
         st.markdown("### Detailed Data View")
-        st.dataframe(df)
+        st.dataframe(detail_buffer.to_frame())
         time.sleep(1)
         
         old_avg_erpm = new_avg_erpm
-        old_avg_ect = old_avg_ect
+        old_avg_ect = new_avg_ect
         old_avg_vs = new_avg_vs
-        
-
@@ -0,0 +1,238 @@
+"""
+Rule based fast path for simple aggregate questions about the AFJ dataset.
+
+Questions such as "what is the average speed from CW to RT" or "maximum engine rpm per condition
+in traffic" map onto a plain filter + groupby + aggregate, so they are answered straight from the
+dataframe. Anything the templates do not fully understand goes to the LLM query engine: every word
+of the question has to be one the templates know, so a qualifier such as a date, a time of day or a
+threshold ("in January", "in the morning", "speed of zero") is never dropped from the answer.
+"""
+import re
+import time
+from categories import locations as LOCATIONS, conditions as CONDITIONS
+
+MEASURES = [
+    (r"speed|velocity", "Vehicle Speed Sensor [km/h]", "vehicle speed", "km/h"),
+    (r"rpm|revolutions", "Engine RPM [RPM]", "engine rpm", "RPM"),
+    (r"coolant|engine temperature|temperature", "Engine Coolant Temperature [°C]", "engine coolant temperature", "°C"),
+    (r"manifold|intake pressure|pressure", "Intake Manifold Absolute Pressure [kPa]", "intake manifold pressure", "kPa"),
+    (r"accelerator|pedal", "Accelerator Pedal Position E [%]", "accelerator pedal position", "%"),
+]
+AGGREGATES = [
+    (r"average|mean|avg", "mean", "average"),
+    (r"median", "median", "median"),
+    (r"maximum|max|highest|top|fastest", "max", "maximum"),
+    (r"minimum|min|lowest|slowest", "min", "minimum"),
+    (r"standard deviation|std|deviation", "std", "standard deviation"),
+    (r"total|sum", "sum", "total"),
+]
+COUNT_PATTERN = re.compile(r"\bhow many (rows|records|readings|measurements|entries|samples)\b|\bnumber of (rows|records|readings|measurements)\b|\bcount\b")
+GROUPS = [
+    (r"condition|conditions", "condition"),
+    (r"source|sources|origin", "source"),
+    (r"destination|destinations", "destination"),
+    (r"day|days|date|dates", "date"),
+]
+GROUP_PATTERN = re.compile(r"\b(?:per|by|for each|for every|each)\s+(\w+)")
+# anything that needs more than filter + groupby + aggregate goes to the LLM
+UNSUPPORTED_PATTERN = re.compile(
+    r"\b(above|below|over|under|greater|less|more than|fewer|between|where|when|while|if|correlat\w*|"
+    r"trend\w*|compare|comparison|why|predict\w*|plot|chart|diagram|graph|percent\w*|ratio|distribution|"
+    r"and (?:the )?(?:average|mean|max|min|total))\b")
+# words that carry no filter, every other word of a question has to be part of a template
+FILLER_WORDS = {
+    "what", "whats", "which", "is", "was", "are", "were", "the", "a", "an", "of", "in", "on", "at", "for",
+    "from", "to", "all", "overall", "show", "me", "give", "tell", "find", "get", "list", "calculate", "compute",
+    "please", "how", "much", "there", "do", "does", "did", "we", "i", "you", "can", "value", "values", "level",
+    "vehicle", "engine", "sensor", "recorded", "measured", "dataset", "data", "route", "routes", "trip", "trips",
+    "km", "h", "kmh", "kph", "c", "kpa",
+}
+
+
+def _vocabulary():
+    words = set(FILLER_WORDS) | {location.lower() for location in LOCATIONS}
+    for condition in CONDITIONS:
+        words.update(re.findall(r"[a-z]+", condition.lower()))
+    for pattern in [COUNT_PATTERN.pattern, GROUP_PATTERN.pattern] + [entry[0] for entry in MEASURES + AGGREGATES + GROUPS]:
+        words.update(re.findall(r"[a-z]+", re.sub(r"\\[a-z]", " ", pattern)))
+    return words
+
+
+VOCABULARY = _vocabulary()
+# words that only mean something as part of a filter or a grouping
+LEFTOVER_WORDS = ({location.lower() for location in LOCATIONS}
+                  | {word for condition in CONDITIONS for word in re.findall(r"[a-z]+", condition.lower())}
+                  | {word for pattern, _ in GROUPS for word in pattern.split("|")})
+
+
+def _find(patterns, text):
+    for pattern, *values in patterns:
+        if re.search(rf"\b(?:{pattern})\b", text):
+            return values
+    return None
+
+
+class QueryPlan:
+    def __init__(self, aggregate, aggregate_label, column=None, measure_label=None, unit="",
+                 source=None, destination=None, condition=None, group_by=None):
+        self.aggregate = aggregate
+        self.aggregate_label = aggregate_label
+        self.column = column
+        self.measure_label = measure_label
+        self.unit = unit
+        self.source = source
+        self.destination = destination
+        self.condition = condition
+        self.group_by = group_by
+
+    def describe_filters(self):
+        parts = []
+        if self.source:
+            parts.append(f"from {self.source}")
+        if self.destination:
+            parts.append(f"to {self.destination}")
+        if self.condition:
+            parts.append(f"in {self.condition} conditions")
+        return (" " + " ".join(parts)) if parts else ""
+
+
+def plan_query(query):
+    """
+    Turn a question into a QueryPlan, or None when no template matches it completely
+    """
+    # "what's" is "what", a lone "s" would read as the location S
+    text = re.sub(r"(\w)'s\b", r"\1", query.lower())
+    if UNSUPPORTED_PATTERN.search(text):
+        return None
+    # numbers, months, times of day and names the templates have no filter for
+    if any(word not in VOCABULARY for word in re.findall(r"[^\W_]+", text)):
+        return None
+
+    plan = None
+    if COUNT_PATTERN.search(text):
+        plan = QueryPlan("count", "number of readings")
+    else:
+        aggregate = _find(AGGREGATES, text)
+        measure = _find(MEASURES, text)
+        if aggregate is None or measure is None:
+            return None
+        plan = QueryPlan(aggregate[0], aggregate[1], measure[0], measure[1], measure[2])
+
+    # the spans a filter or grouping was read from, a location or group word outside them has no template
+    consumed = []
+    route = re.search(r"\bfrom\s+(\w+)\s+to\s+(\w+)\b", text)
+    if route:
+        plan.source, plan.destination = route.group(1).upper(), route.group(2).upper()
+        if plan.source not in LOCATIONS or plan.destination not in LOCATIONS:
+            return None
+        consumed.append(route.span())
+    else:
+        source = re.search(r"\b(?:from|source)\s+(\w+)\b", text)
+        destination = re.search(r"\b(?:to|destination)\s+(\w+)\b", text)
+        if source and source.group(1).upper() in LOCATIONS:
+            plan.source = source.group(1).upper()
+            consumed.append(source.span())
+        if destination and destination.group(1).upper() in LOCATIONS:
+            plan.destination = destination.group(1).upper()
+            consumed.append(destination.span())
+
+    # longest names first so "normal icy road" is not read as "normal"
+    for condition in sorted(CONDITIONS, key=len, reverse=True):
+        match = re.search(rf"\b{re.escape(condition.lower())}(?:\s+conditions?)?\b", text)
+        if match:
+            plan.condition = condition
+            consumed.append(match.span())
+            break
+
+    group = GROUP_PATTERN.search(text)
+    if group:
+        plan.group_by = _find(GROUPS, group.group(1))
+        if plan.group_by is None:
+            return None
+        plan.group_by = plan.group_by[0]
+        consumed.append(group.span())
+
+    rest = text
+    for start, end in consumed:
+        rest = rest[:start] + " " * (end - start) + rest[end:]
+    if any(word in LEFTOVER_WORDS for word in re.findall(r"[^\W_]+", rest)):
+        return None
+    return plan
+
+
+def _format_value(value, unit):
+    if isinstance(value, float):
+        value = f"{value:,.2f}"
+    return f"{value} {unit}".strip()
+
+
+def execute_plan(plan, df):
+    rows = df
+    if plan.source:
+        rows = rows[rows["source"] == plan.source]
+    if plan.destination:
+        rows = rows[rows["destination"] == plan.destination]
+    if plan.condition:
+        rows = rows[rows["condition"] == plan.condition]
+
+    subject = f"The {plan.aggregate_label}" + (f" {plan.measure_label}" if plan.measure_label else "")
+    if len(rows) == 0:
+        return f"There are no readings{plan.describe_filters()} in the dataset."
+
+    if plan.group_by is None:
+        value = len(rows) if plan.aggregate == "count" else float(rows[plan.column].agg(plan.aggregate))
+        return f"{subject}{plan.describe_filters()} is {_format_value(value, plan.unit)}."
+
+    keys = rows[plan.group_by]
+    if plan.group_by == "date":
+        keys = keys.dt.strftime("%Y-%m-%d") if hasattr(keys, "dt") else keys
+    grouped = rows.groupby(keys, observed=True)
+    values = grouped.size() if plan.aggregate == "count" else grouped[plan.column].agg(plan.aggregate)
+    lines = [f"- {key}: {_format_value(float(value) if plan.aggregate != 'count' else int(value), plan.unit)}"
+             for key, value in values.items()]
+    return f"{subject}{plan.describe_filters()} per {plan.group_by}:\n" + "\n".join(lines)
+
+
+class DatasetQueryPlanner:
+    """
+    Answers template questions from the dataframe and falls back to the LLM engine for the rest,
+    keeping track of the fast path hit rate and the latency it saved
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self.metrics = {"fast_path": 0, "fallback": 0, "fast_path_seconds": 0.0, "fallback_seconds": 0.0}
+
+    def try_answer(self, query):
+        plan = plan_query(query)
+        if plan is None:
+            return None
+        try:
+            return execute_plan(plan, self.df)
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def answer(self, query, fallback):
+        start = time.perf_counter()
+        response = self.try_answer(query)
+        if response is not None:
+            self.metrics["fast_path"] += 1
+            self.metrics["fast_path_seconds"] += time.perf_counter() - start
+            return response
+        response = fallback(query)
+        self.metrics["fallback"] += 1
+        self.metrics["fallback_seconds"] += time.perf_counter() - start
+        return response
+
+    def stats(self):
+        metrics = dict(self.metrics)
+        questions = metrics["fast_path"] + metrics["fallback"]
+        metrics["hit_rate"] = metrics["fast_path"] / questions if questions else 0.0
+        if metrics["fast_path"] and metrics["fallback"]:
+            # every fast path answer saved roughly one average LLM round trip
+            saved_per_answer = (metrics["fallback_seconds"] / metrics["fallback"]
+                                - metrics["fast_path_seconds"] / metrics["fast_path"])
+            metrics["estimated_seconds_saved"] = metrics["fast_path"] * saved_per_answer
+        else:
+            metrics["estimated_seconds_saved"] = None
+        return metrics
@@ -0,0 +1,75 @@
+"""
+Process wide registry of lazily built heavy resources (models, indexes, query engines and agents).
+
+A function decorated with `lazy_resource` is only run the first time it is called, its result is
+memoized for the whole process and later calls return the same object. Streamlit reruns page
+scripts but keeps imported modules, so every session of a worker shares one copy.
+"""
+import time
+import threading
+import functools
+
+_registry = {}
+_warm_up_thread = None
+_warm_up_lock = threading.Lock()
+
+
+def lazy_resource(factory):
+    """
+    Decorator that turns a zero argument factory into a thread safe memoized getter
+    """
+    lock = threading.Lock()
+    state = {}
+
+    @functools.wraps(factory)
+    def get():
+        if "value" in state:
+            return state["value"]
+        with lock:
+            if "value" not in state:
+                state["value"] = factory()
+            return state["value"]
+
+    get.is_built = lambda: "value" in state
+    _registry[factory.__name__] = get
+    return get
+
+
+def registered_resources():
+    return dict(_registry)
+
+
+def build_resources(names=None, verbose=True):
+    """
+    Build the given registered resources (all of them by default) in the calling thread
+    and return how long each one took
+    """
+    timings = {}
+    for name, get in registered_resources().items():
+        if names is not None and name not in names:
+            continue
+        start = time.perf_counter()
+        try:
+            get()
+        except Exception as e:
+            # a resource that fails to warm up is retried, and raises, on first real use
+            print(f"Failed to warm up {name}: {e}")
+            continue
+        timings[name] = time.perf_counter() - start
+        if verbose:
+            print(f"Warmed up {name} in {timings[name]:.2f}s")
+    return timings
+
+
+def warm_up(names=None, verbose=False):
+    """
+    Start building the registered resources on a background daemon thread.
+    Only the first call starts a thread, later calls return the running (or finished) one
+    """
+    global _warm_up_thread
+    with _warm_up_lock:
+        if _warm_up_thread is None:
+            _warm_up_thread = threading.Thread(target=build_resources, args=(names, verbose),
+                                               name="resource-warm-up", daemon=True)
+            _warm_up_thread.start()
+        return _warm_up_thread
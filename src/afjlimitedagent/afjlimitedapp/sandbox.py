@@ -0,0 +1,194 @@
+"""
+Pool of pre-started Python worker processes for running generated code outside the Streamlit process.
+
+Each worker maps the dataset from an Arrow IPC file once at start up, so the columns are shared
+read-only through the page cache and a run pays neither the imports nor the data load.
+Every run gets a fresh namespace with `df`, `pd` and `np`, its stdout is returned, and it is
+limited in CPU time (RLIMIT_CPU), address space (RLIMIT_AS) and wall clock time. Only the soft
+limits are set, a process that lowered its hard limit could never raise it again for the next run;
+going over the CPU budget raises in the running code (SIGXCPU) and the worker carries on. A worker
+that crashes or runs over its wall clock time is killed and replaced.
+"""
+import io
+import os
+import sys
+import time
+import queue
+import signal
+import resource
+import threading
+import traceback
+import contextlib
+import multiprocessing
+
+DEFAULT_CPU_SECONDS = 10
+DEFAULT_WALL_SECONDS = 20
+DEFAULT_MEMORY_MB = 2048
+
+
+def export_dataset(df, path):
+    """
+    Write a dataframe as an uncompressed Arrow IPC file that workers can memory map
+    """
+    import pyarrow as pa
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    table = pa.Table.from_pandas(df)
+    with pa.OSFile(path + ".tmp", "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def _load_shared_dataset(path):
+    import pyarrow as pa
+    table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+    # split_blocks keeps numeric columns as zero copy views of the mapped file
+    return table.to_pandas(split_blocks=True)
+
+
+def _sanitize_code(code):
+    # same clean up as langchain's PythonREPLTool, models like to wrap code in markdown fences
+    code = code.strip().strip("`")
+    if code.startswith("python"):
+        code = code[len("python"):]
+    return code.strip()
+
+
+class CPULimitExceeded(BaseException):
+    pass
+
+
+def _raise_cpu_limit(signum, frame):
+    raise CPULimitExceeded()
+
+
+def _soft_limit(hard, limit):
+    # the soft limit can go anywhere up to the hard one, which is left alone
+    return limit if hard == resource.RLIM_INFINITY else min(limit, hard)
+
+
+def _worker_main(connection, dataset_path, cpu_seconds, memory_mb):
+    import numpy as np
+    import pandas as pd
+    base_namespace = {"pd": pd, "np": np}
+    if dataset_path:
+        base_namespace["df"] = _load_shared_dataset(dataset_path)
+    # the mapped dataset counts towards the address space, the limit is on top of it
+    dataset_bytes = os.path.getsize(dataset_path) if dataset_path else 0
+    limit = dataset_bytes + memory_mb * 1024 * 1024
+    try:
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        resource.setrlimit(resource.RLIMIT_AS, (_soft_limit(hard, limit), hard))
+    except (ValueError, OSError):
+        pass  # not every platform enforces RLIMIT_AS (macOS)
+    cpu_soft, cpu_hard = resource.getrlimit(resource.RLIMIT_CPU)
+    signal.signal(signal.SIGXCPU, _raise_cpu_limit)
+    connection.send("ready")
+
+    while True:
+        code = connection.recv()
+        if code is None:
+            return
+        used = resource.getrusage(resource.RUSAGE_SELF)
+        cpu_limit = int(used.ru_utime + used.ru_stime) + cpu_seconds
+        output = io.StringIO()
+        try:
+            resource.setrlimit(resource.RLIMIT_CPU, (_soft_limit(cpu_hard, cpu_limit), cpu_hard))
+            with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+                exec(_sanitize_code(code), dict(base_namespace))
+        except CPULimitExceeded:
+            output.write(f"The code was stopped, it used more than {cpu_seconds}s of CPU time\n")
+        except MemoryError:
+            output.write("MemoryError: the code ran out of its memory limit\n")
+        except BaseException:
+            output.write(traceback.format_exc(limit=-3))
+        finally:
+            # no SIGXCPU between runs
+            resource.setrlimit(resource.RLIMIT_CPU, (cpu_soft, cpu_hard))
+        connection.send(output.getvalue())
+
+
+class SandboxWorker:
+    def __init__(self, context, dataset_path, cpu_seconds, memory_mb):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(target=_worker_main, daemon=True,
+                                       args=(child_connection, dataset_path, cpu_seconds, memory_mb))
+        self.process.start()
+        child_connection.close()
+        self.ready = False
+
+    def wait_ready(self, timeout=None):
+        if not self.ready:
+            if not self.connection.poll(timeout) or self.connection.recv() != "ready":
+                raise RuntimeError("sandbox worker failed to start")
+            self.ready = True
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(1)
+        self.connection.close()
+
+
+class SandboxPool:
+    """
+    Fixed size pool of sandbox workers, run() blocks until a worker is free
+    """
+
+    def __init__(self, workers=2, dataset_path=None, cpu_seconds=DEFAULT_CPU_SECONDS,
+                 wall_seconds=DEFAULT_WALL_SECONDS, memory_mb=DEFAULT_MEMORY_MB, start_method=None):
+        self.context = multiprocessing.get_context(start_method)
+        self.dataset_path = dataset_path
+        self.cpu_seconds = cpu_seconds
+        self.wall_seconds = wall_seconds
+        self.memory_mb = memory_mb
+        self.idle = queue.Queue()
+        self.lock = threading.Lock()
+        self.closed = False
+        for _ in range(workers):
+            self.idle.put(self._start_worker())
+
+    def _start_worker(self):
+        return SandboxWorker(self.context, self.dataset_path, self.cpu_seconds, self.memory_mb)
+
+    def run(self, code):
+        """
+        Run code in a free worker and return everything it printed
+        """
+        worker = self.idle.get()
+        replace = False
+        try:
+            worker.wait_ready(timeout=60)
+            start = time.monotonic()
+            worker.connection.send(code)
+            if not worker.connection.poll(self.wall_seconds):
+                replace = True
+                return f"TimeoutError: the code ran for more than {self.wall_seconds} seconds and was stopped"
+            try:
+                return worker.connection.recv()
+            except EOFError:
+                # killed by the kernel, e.g. past the hard CPU limit or out of memory
+                replace = True
+                elapsed = time.monotonic() - start
+                return f"The code was stopped after {elapsed:.1f}s, it exceeded its CPU or memory limit"
+        except (BrokenPipeError, EOFError, RuntimeError) as e:
+            replace = True
+            return f"Sandbox worker failed: {e}"
+        finally:
+            if replace:
+                worker.kill()
+                worker = self._start_worker()
+            self.idle.put(worker)
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+        while not self.idle.empty():
+            worker = self.idle.get()
+            try:
+                worker.connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            worker.kill()
@@ -0,0 +1,12 @@
+from answer_cache import query_signature
+
+
+def test_routes_in_any_case_keep_their_order():
+    assert query_signature("average speed from cw to rt") == query_signature("Average speed from CW to RT")
+    assert query_signature("average speed from cw to rt") != query_signature("average speed from rt to cw")
+    assert query_signature("average speed from cw to rt") != query_signature("average speed from cw to ka")
+
+
+def test_words_that_are_not_locations_are_ignored():
+    assert query_signature("What's the average RPM from CW") == query_signature("what is the average rpm from cw")
+    assert query_signature("average speed in 2019") != query_signature("average speed in 2020")
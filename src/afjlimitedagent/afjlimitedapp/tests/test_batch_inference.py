@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+# batch_inference takes the model getters from tools, which needs langchain
+pytest.importorskip("langchain")
+import batch_inference
+from batch_inference import ARIMA_FEATURES, predict_velocity, prepare_arima_features
+
+
+def _records(rows, seed):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "engine_coolant_temp": rng.normal(90, 3, rows),
+        "intake_manifold_pressure": rng.normal(100, 5, rows),
+        "engine_rpm": rng.normal(2000, 300, rows),
+        "source": rng.choice(["CW", "RT", "KA"], rows),
+        "destination": rng.choice(["CW", "RT", "BB"], rows),
+        "condition": rng.choice(["Normal", "Traffic", "Free"], rows),
+    })
+
+
+def _per_row(model, records):
+    X = prepare_arima_features(records)
+    return np.array([float(np.asarray(model.forecast(steps=1, exog=X.iloc[i:i + 1]))[0]) for i in range(len(X))])
+
+
+def test_batched_velocity_matches_per_row_forecasts(monkeypatch):
+    sm = pytest.importorskip("statsmodels.api")
+    # the same model as the experiments notebook, fitted on synthetic drives
+    X = prepare_arima_features(_records(300, seed=0))
+    speed = X.to_numpy(dtype=float) @ np.array([0.2, 0.1, 0.01, 1.0, -1.0, 2.0]) + np.random.default_rng(1).normal(0, 1, 300).cumsum()
+    model = sm.tsa.ARIMA(pd.Series(speed), order=(1, 1, 1), exog=X[ARIMA_FEATURES]).fit()
+    monkeypatch.setattr(batch_inference, "get_arima_model", lambda: model)
+    records = _records(50, seed=2)
+    np.testing.assert_allclose(predict_velocity(records), _per_row(model, records), rtol=1e-8)
+
+
+class SquaredForecastModel:
+    # a coefficient per feature, but a forecast that is not linear in them
+    params = pd.Series(1.0, index=ARIMA_FEATURES)
+
+    def forecast(self, steps, exog):
+        return np.asarray([float((exog.to_numpy(dtype=float) ** 2).sum())])
+
+
+def test_non_linear_model_is_scored_row_by_row(monkeypatch):
+    model = SquaredForecastModel()
+    monkeypatch.setattr(batch_inference, "get_arima_model", lambda: model)
+    records = _records(20, seed=3)
+    np.testing.assert_allclose(predict_velocity(records), _per_row(model, records))
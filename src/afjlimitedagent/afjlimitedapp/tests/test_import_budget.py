@@ -0,0 +1,12 @@
+import pytest
+from warm_up import IMPORT_BUDGET_SECONDS, import_report
+
+# tools.py needs langchain for its @tool decorator
+pytest.importorskip("langchain")
+
+
+def test_importing_tools_is_cheap():
+    report = import_report("tools")
+    assert report["seconds"] < IMPORT_BUDGET_SECONDS
+    assert report["built"] == []
+    assert report["heavy_modules"] == []
@@ -0,0 +1,39 @@
+import pandas as pd
+from aggregate_cube import AggregateCube, build_cube
+from kpi_engine import KPI_COLUMNS, StreamingKPIEngine
+
+
+def _rows(routes):
+    return pd.DataFrame([{"Time": 0, "date": "2019-01-19", "source": source, "destination": destination,
+                          "condition": condition, **{column: 1.0 for column in KPI_COLUMNS}}
+                         for source, destination, condition in routes])
+
+
+def _assert_chart_frame(counts):
+    # the dashboard draws px.bar(x="condition", y="count") from counts.reset_index()
+    assert list(counts.reset_index().columns) == ["condition", "count"]
+
+
+def test_condition_counts_of_a_route_without_rows():
+    engine = StreamingKPIEngine()
+    _assert_chart_frame(engine.condition_counts("CW", "CW"))
+    engine.update(_rows([("CW", "RT", "Normal"), ("CW", "RT", "Normal"), ("RT", "CW", "Slow")]))
+    counts = engine.condition_counts("CW", "CW")
+    assert counts.empty
+    _assert_chart_frame(counts)
+
+
+def test_condition_counts_of_a_route_with_rows():
+    engine = StreamingKPIEngine()
+    engine.update(_rows([("CW", "RT", "Normal"), ("CW", "RT", "Normal"), ("RT", "CW", "Slow")]))
+    counts = engine.condition_counts("CW", "RT")
+    assert counts.to_dict() == {"Normal": 2}
+    _assert_chart_frame(counts)
+
+
+def test_cube_condition_counts_of_a_route_without_rows():
+    cube = AggregateCube(build_cube(_rows([("CW", "RT", "Normal"), ("RT", "CW", "Slow")])))
+    for source, destination in [("CW", "CW"), ("XX", "CW")]:
+        counts = cube.condition_counts(source, destination)
+        assert counts.empty
+        _assert_chart_frame(counts)
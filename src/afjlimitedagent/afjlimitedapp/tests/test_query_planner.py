@@ -0,0 +1,44 @@
+import pytest
+from query_planner import plan_query
+
+
+@pytest.mark.parametrize("question", [
+    "what is the average speed on 2019-01-19",
+    "average speed from CW to RT in January",
+    "maximum engine rpm in the morning",
+    "what was the average speed yesterday",
+    "how many readings have a speed of zero",
+    "what is the average ambient air temperature",
+    "average speed from Berlin",
+    # locations and group words that no filter or grouping reads
+    "average speed at CW",
+    "average speed in CW",
+    "what is the average speed of CW",
+    "average speed CW to RT",
+    "maximum speed for the day",
+    "average speed in traffic normal",
+])
+def test_questions_with_unknown_qualifiers_fall_back(question):
+    assert plan_query(question) is None
+
+
+def test_route_question():
+    plan = plan_query("What is the average speed from CW to RT?")
+    assert (plan.aggregate, plan.column) == ("mean", "Vehicle Speed Sensor [km/h]")
+    assert (plan.source, plan.destination, plan.condition, plan.group_by) == ("CW", "RT", None, None)
+
+
+def test_grouped_question_with_condition():
+    plan = plan_query("maximum engine rpm per condition in traffic")
+    assert (plan.aggregate, plan.column) == ("max", "Engine RPM [RPM]")
+    assert (plan.condition, plan.group_by) == ("Traffic", "condition")
+
+
+def test_count_question():
+    plan = plan_query("how many readings are there from KA")
+    assert (plan.aggregate, plan.source, plan.destination) == ("count", "KA", None)
+
+
+def test_condition_question_with_apostrophe():
+    plan = plan_query("What's the mean coolant temperature in Normal conditions?")
+    assert (plan.source, plan.destination, plan.condition) == (None, None, "Normal")
@@ -0,0 +1,22 @@
+from sandbox import SandboxPool
+
+
+def test_worker_keeps_running_after_a_cpu_heavy_snippet():
+    pool = SandboxPool(workers=1, cpu_seconds=1, wall_seconds=10)
+    try:
+        outputs = [pool.run(code) for code in [
+            "print(1 + 1)",
+            "while True:\n    pass",
+            "print(np.arange(3).sum())",
+            "print('ok')",
+            "x = 0\nwhile True:\n    x += 1",
+            "print(pd.Series([1, 2]).max())",
+        ]]
+    finally:
+        pool.close()
+    assert outputs[0] == "2\n"
+    assert "more than 1s of CPU time" in outputs[1]
+    assert outputs[2] == "3\n"
+    assert outputs[3] == "ok\n"
+    assert "more than 1s of CPU time" in outputs[4]
+    assert outputs[5] == "2\n"
@@ -1,138 +1,127 @@
 import pickle
-import pandas as pd
-from llama_index.llms.openai import OpenAI
-from llama_index.service_context import ServiceContext
-from llama_index.query_engine.pandas import PandasQueryEngine
-from ingest_data import DATA_DIRECTORY, load_dataset, postprocess_dataset
-from langchain import hub
 from textwrap import dedent
-from langchain.agents import AgentExecutor
-from langchain.agents.openai_functions_agent.base import create_openai_functions_agent
-from langchain_experimental.agents import create_pandas_dataframe_agent
-from langchain_openai.chat_models import ChatOpenAI
-from langchain_experimental.tools import PythonREPLTool
-from langchain_core.prompts.chat import ChatPromptTemplate
 from pydantic.v1 import BaseModel, Field
-from llama_index.indices.vector_store import VectorStoreIndex
-from llama_index.indices.list.base import SummaryIndex
-from llama_index.storage import StorageContext
-from llama_index.indices.loading import load_index_from_storage
 from langchain.tools import tool
+from resources import lazy_resource
+from inference_client import request_predictions
 import json
 import os
+import asyncio
 from json import JSONDecodeError
 
-brands = ['Seat']
-models = ['Leon']
-locations = ['CW', 'RT', 'S', 'KA', 'BB']
-conditions = ['Normal',
-  'Free',
-  'Traffic',
-  'Emergency Braking',
-  'Normal Icy Road',
-  'Free Accelaration',
-  'Traffic Jam Measurement error']
+# Models, indexes, query engines and agents are built on first use by the lazy_resource getters below,
+# llama index and the heavier langchain modules are imported inside them so importing this module stays cheap
+
+from categories import brands, models, locations, conditions
+
+# precomputed label encodings, same codes as the list positions the models were trained on
+BRAND_CODES = {brand: code for code, brand in enumerate(brands)}
+MODEL_CODES = {model: code for code, model in enumerate(models)}
+LOCATION_CODES = {location: code for code, location in enumerate(locations)}
+CONDITION_CODES = {condition: code for code, condition in enumerate(conditions)}
+
+def _code(codes, value):
+    # unknown values raise ValueError like the list.index lookup these replaced
+    try:
+        return codes[value]
+    except (KeyError, TypeError):
+        raise ValueError(f"{value!r} is not in list") from None
 
 # transform brand
 def transform_brand(brand):
-    return brands.index(brand)
+    return _code(BRAND_CODES, brand)
 
 def transform_model(model):
-    return models.index(model)
+    return _code(MODEL_CODES, model)
 
 def transform_location(location):
-    return locations.index(location)
+    return _code(LOCATION_CODES, location)
 
 def transform_condition(condition):
-    return conditions.index(condition)
+    return _code(CONDITION_CODES, condition)
 
+@lazy_resource
 def get_arima_model():
     with open('../arima_model.pkl', 'rb') as f:
         fit_model = pickle.load(f)
         return fit_model
     
+@lazy_resource
 def get_random_forest_model():
     with open('../random_forest_model.pkl', 'rb') as f:
         rf_classifier = pickle.load(f)
         return rf_classifier
     
     
-def get_data_for_arima_model(engine_coolant_temp, intake_manifold_pressure, engine_rpm, source, destination, condition):
-    # Create a dictionary with the data for the single entry
-    data = {
-        'Engine Coolant Temperature [°C]': [engine_coolant_temp],
-        'Intake Manifold Absolute Pressure [kPa]': [intake_manifold_pressure],
-        'Engine RPM [RPM]': [engine_rpm],
-        'source': [source],
-        'destination': [destination],
-        'condition': [condition],
-    }
-
-    # Create the DataFrame
-    df = pd.DataFrame(data)
-    return df
-
-
-def get_data_for_categorical_model(vehicle_speed, source, destination, hour, minute):
-    # Create a DataFrame with a single row and specified columns
-    data = {
-        'Vehicle Speed Sensor [km/h]': [vehicle_speed],
-        'source': [source],
-        'destination': [destination],
-        'hour': [hour],
-        'minute': [minute]
-    }
-
-    df = pd.DataFrame(data)
-    return df
-
-ARIMA_MODEL = get_arima_model()
-RANDOM_FOREST_MODEL = get_random_forest_model()
-
-
-def infer_arima_model(X):
-    forcast = ARIMA_MODEL.forecast(steps=len(X), exog=X[['Engine Coolant Temperature [°C]',
-                                        'Intake Manifold Absolute Pressure [kPa]', 'Engine RPM [RPM]', 'source',
-                                        'destination', 'condition']])
-    return forcast.iloc[0]
-
-
-def infer_forest_model(X):
-    # Make predictions on the testing data
-    y_pred = RANDOM_FOREST_MODEL.predict(X)
-    return y_pred[0]
-
 # get llm context
-li_llm = OpenAI(model="togethercomputer/CodeLlama-34b-Instruct")
-lc_llm = ChatOpenAI(model="togethercomputer/CodeLlama-34b-Instruct", temperature=0.1)
-
-service_context = ServiceContext.from_defaults(llm=li_llm)
-
-# load dataset 
+@lazy_resource
+def get_li_llm():
+    from llama_index.llms.openai import OpenAI
+    return OpenAI(model="togethercomputer/CodeLlama-34b-Instruct")
+
+@lazy_resource
+def get_lc_llm():
+    from langchain_openai.chat_models import ChatOpenAI
+    return ChatOpenAI(model="togethercomputer/CodeLlama-34b-Instruct", temperature=0.1)
+
+@lazy_resource
+def get_service_context():
+    from llama_index.service_context import ServiceContext
+    return ServiceContext.from_defaults(llm=get_li_llm())
+
+# load dataset from the parquet store, only days with new or changed drive files are re-ingested
+@lazy_resource
 def get_dataset():
-    if os.path.exists("full_dataframe.pkl"):
-        print("Loading dataset")
-        with open("full_dataframe.pkl", "rb") as f:
-            df = pickle.load(f)
-            return df
-    else:
-        print("creating dataset")
-        df = load_dataset(DATA_DIRECTORY)
-        df = postprocess_dataset(df)
-        with open("full_dataframe.pkl", "wb") as f:
-            pickle.dump(df, f)
-        return df
-
-df = get_dataset()
+    from dataset_store import load_cached_dataset
+    return load_cached_dataset()
+
 # get dataset query engine
-query_engine_with_sythesis =  PandasQueryEngine(df=df, 
-                                                service_context=service_context, 
-                                                verbose=True, 
-                                                synthesize_response=True)
-
-diagraming_agent = create_pandas_dataframe_agent(llm=lc_llm,
-                                                 df=df,
-                                                 verbose=False)
+@lazy_resource
+def get_query_engine_with_sythesis():
+    from llama_index.query_engine.pandas import PandasQueryEngine
+    return PandasQueryEngine(df=get_dataset(), 
+                             service_context=get_service_context(), 
+                             verbose=True, 
+                             synthesize_response=True)
+
+# answers simple aggregate questions straight from the dataframe, without the LLM
+@lazy_resource
+def get_query_planner():
+    from query_planner import DatasetQueryPlanner
+    return DatasetQueryPlanner(get_dataset())
+
+# generated code runs in pre-started sandbox processes that map the dataset read-only,
+# never inside the streamlit process
+SANDBOX_DATASET_PATH = "../dataset_cache/dataset.arrow"
+
+@lazy_resource
+def get_sandbox_pool():
+    from sandbox import SandboxPool, export_dataset
+    export_dataset(get_dataset(), SANDBOX_DATASET_PATH)
+    return SandboxPool(workers=2, dataset_path=SANDBOX_DATASET_PATH)
+
+# diagrams are rendered to PNG in the sandbox on a background thread and cached on disk by (code, dataset version)
+@lazy_resource
+def get_figure_renderer():
+    from figure_cache import FigureCache, FigureRenderer
+    return FigureRenderer(FigureCache(), get_sandbox_pool())
+
+@lazy_resource
+def get_diagraming_agent():
+    # same setup as create_pandas_dataframe_agent, but its python tool is the sandboxed one
+    from langchain.agents import AgentExecutor
+    from langchain.agents.openai_functions_agent.base import create_openai_functions_agent
+    from langchain_core.prompts.chat import ChatPromptTemplate, MessagesPlaceholder
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", "You are working with a pandas dataframe in Python. The name of the dataframe is `df`.\n"
+                   "You should use the python-repl tool to answer the question posed of you, `df`, `pd` and `np` are already defined there.\n"
+                   "This is the result of `print(df.head())`:\n{df_head}"),
+        ("user", "{input}"),
+        MessagesPlaceholder(variable_name="agent_scratchpad"),
+    ]).partial(df_head=get_dataset().head().to_string())
+    agent = create_openai_functions_agent(get_lc_llm(), [python_repl], prompt)
+    return AgentExecutor(agent=agent, tools=[python_repl], verbose=False)
+
 def query_diagraming_agent(query):
     prompt = dedent(
         """
@@ -159,16 +148,37 @@ def query_diagraming_agent(query):
     )
 
     # Run the prompt through the agent.
-    response = diagraming_agent.run(prompt)
+    response = get_diagraming_agent().run(prompt)
     return response.__str__()
 
 
-storage_context = StorageContext.from_defaults(persist_dir="../afjlimitedweb")
-index = load_index_from_storage(storage_context)
+@lazy_resource
+def get_company_query_engine():
+    from llama_index.storage import StorageContext
+    from llama_index.indices.loading import load_index_from_storage
+    storage_context = StorageContext.from_defaults(persist_dir="../afjlimitedweb")
+    index = load_index_from_storage(storage_context)
+    return index.as_query_engine(service_context=get_service_context())
+
+# local sentence-transformers model, embedding a query for the answer cache costs no remote call
+@lazy_resource
+def get_query_embeddings():
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings()
+
+@lazy_resource
+def get_answer_cache():
+    from answer_cache import AnswerCache
+    return AnswerCache(embed_query=get_query_embeddings().embed_query)
 
-company_query_engine = index.as_query_engine(service_context=service_context)
+def current_dataset_version():
+    from dataset_store import dataset_version
+    return dataset_version()
 
-openai_fn_agent_prompt: ChatPromptTemplate = hub.pull("hwchase17/openai-functions-agent")
+@lazy_resource
+def get_openai_fn_agent_prompt():
+    from langchain import hub
+    return hub.pull("hwchase17/openai-functions-agent")
 
 class DataSetQuestionAnswerSchema(BaseModel):
     """ 
@@ -183,10 +193,12 @@ def dataset_question_answer(query:str):
     Provides answer to any question asked about the dataset. 
     It takes a natural language question about the dataset and provides a natural language response.
     """
-    response = query_engine_with_sythesis.query(query)
-    # response = query_engine_with_sythesis.query(query)
-    # return str(response.response)
-    return response.response
+    # template questions skip both LLM round trips, everything else goes through the cached query engine
+    return get_query_planner().answer(query, lambda query: get_answer_cache().cached_call(
+        "dataset-question-answer", query,
+        lambda: get_query_engine_with_sythesis().query(query).response,
+        version=current_dataset_version(),
+    ))
 
 
 class DataSetDiagramRequestSchema(BaseModel):
@@ -202,13 +214,24 @@ def dataset_diagram_request(query: str):
     Draws diagram for information about the dataset
     It takes a natural language diagram request and draws the diagram
     """
-    # response = query_diagraming_agent(query)
-    # return response
+    # the plotting code is cached per query and the figure per code, so a repeated request skips the
+    # agent and the rendering; code is only cached once it has rendered, a failure reaches the agent
+    from figure_cache import extract_plot_code
     try:
-        response = query_diagraming_agent(query)
-        return "diagram drawn"
+        version = current_dataset_version()
+        renderer = get_figure_renderer()
+
+        def draw():
+            code = extract_plot_code(query_diagraming_agent(query))
+            renderer.wait(renderer.submit(code, version), timeout=60)
+            return code
+
+        code = get_answer_cache().cached_call("dataset-diagram-code", query, draw, version=version)
+        # a cached figure may have been evicted since, the page waits for it to render again
+        key = renderer.submit(code, version)
+        return f"diagram drawn [figure:{key}]"
     except Exception as e:
-        return "failed to draw diagram"
+        return f"failed to draw diagram: {e}"
     
     
 
@@ -227,14 +250,16 @@ def predict_vehicle_velocity(engine_coolant_temp, intake_manifold_pressure, engi
     The function allows for predicting the vehicle velocity given the following fields:
     engine coolant temperature, intake manifold pressure, engine rpm, source, destination and condition
     """
-    source = transform_location(source)
-    destination = transform_location(destination)
-    condition = transform_condition(condition)
-    engine_coolant_temp = float(engine_coolant_temp)
-    intake_manifold_pressure = float(intake_manifold_pressure)
-    engine_rpm = float(engine_rpm)
-    input_df = get_data_for_arima_model(engine_coolant_temp, intake_manifold_pressure, engine_rpm, source, destination, condition)
-    result = infer_arima_model(input_df)
+    # scored on the shared inference server, the encoding happens there
+    record = {
+        "engine_coolant_temp": float(engine_coolant_temp),
+        "intake_manifold_pressure": float(intake_manifold_pressure),
+        "engine_rpm": float(engine_rpm),
+        "source": source,
+        "destination": destination,
+        "condition": condition,
+    }
+    result = request_predictions("velocity", [record])[0]
     return str(result) + " Km/h"
 
 
@@ -254,14 +279,16 @@ def predict_vehicle_condition(vehicle_speed, source, destination, hour, minute):
     be one of the following:
     Normal,Free,Traffic,Emergency Braking,Normal Icy Road,Free Accelaration,Traffic Jam Measurement error
     """
-    source = transform_location(source)
-    destination = transform_location(destination)
-    hour = int(hour)
-    minute = int(minute)
-    vehicle_speed = float(vehicle_speed)
-    input_df = get_data_for_categorical_model(vehicle_speed, source, destination, hour, minute)
-    prediction = infer_forest_model(input_df)
-    return f"The predicted condition is {conditions[prediction]}"
+    # scored on the shared inference server, the encoding happens there
+    record = {
+        "vehicle_speed": float(vehicle_speed),
+        "source": source,
+        "destination": destination,
+        "hour": int(hour),
+        "minute": int(minute),
+    }
+    prediction = request_predictions("condition", [record])[0]
+    return f"The predicted condition is {prediction}"
 
 
 class AFJLimitedQASchema(BaseModel):
@@ -273,42 +300,147 @@ def afj_limited_qa(query):
     Answers questions related to AFJ Limited. Receives a query related to AFJ limited and 
     provides a natural language response
     """
-    response = company_query_engine.query(query)
-    return response.response
-
-
-# create python repl tool
-python_repl = PythonREPLTool(name="python-repl")
+    # company answers do not depend on the dataset, so they are not versioned
+    return get_answer_cache().cached_call(
+        "afj-limited-qa", query,
+        lambda: get_company_query_engine().query(query).response,
+    )
 
 
-tools = [python_repl,
-         dataset_question_answer, 
-         dataset_diagram_request, 
-         predict_vehicle_velocity,
-         predict_vehicle_condition, 
-         afj_limited_qa]
+class PythonCodeSchema(BaseModel):
+    query: str = Field(description="valid python code to run, print the values you want to see")
 
-openai_agent = create_openai_functions_agent(lc_llm, tools, openai_fn_agent_prompt)
-agent_executor = AgentExecutor(agent=openai_agent, tools=tools, verbose=True)
 
-tool_map = { tool.name: tool for tool in tools }
+# create python repl tool
+@tool("python-repl", args_schema=PythonCodeSchema, return_direct=False)
+def python_repl(query: str):
+    """
+    A Python shell. Use this to execute python commands. Input should be a valid python command.
+    The dataset is already loaded as a pandas dataframe named df.
+    If you want to see the output of a value, you should print it out with `print(...)`.
+    """
+    return get_sandbox_pool().run(query)
+
+
+@lazy_resource
+def get_tools():
+    return [python_repl,
+            dataset_question_answer, 
+            dataset_diagram_request, 
+            predict_vehicle_velocity,
+            predict_vehicle_condition, 
+            afj_limited_qa]
+
+@lazy_resource
+def get_agent_executor():
+    from langchain.agents import AgentExecutor
+    from langchain.agents.openai_functions_agent.base import create_openai_functions_agent
+    tools = get_tools()
+    openai_agent = create_openai_functions_agent(get_lc_llm(), tools, get_openai_fn_agent_prompt())
+    return AgentExecutor(agent=openai_agent, tools=tools, verbose=True)
+
+@lazy_resource
+def get_tool_map():
+    return { tool.name: tool for tool in get_tools() }
+
+# answers from these tools (or without a function call) can be replayed, diagrams and repl runs can not
+CACHEABLE_FUNCTIONS = {"dataset-question-answer", "afj-limited-qa", "predict-vehicle-velocity", "predict-vehicle-condition"}
+
+def _is_cacheable_agent_response(response):
+    result, message = response
+    if str(result).startswith("function call failed"):
+        return False
+    return message == "No function call" or any(f"function name : {name}" in message for name in CACHEABLE_FUNCTIONS)
 
 def run_agent_executor(query):
-    response = agent_executor.invoke({"input": query})
+    result, message = get_answer_cache().cached_call(
+        "agent", query,
+        lambda: _run_agent_executor(query),
+        version=current_dataset_version(),
+        cacheable=_is_cacheable_agent_response,
+    )
+    return result, message
+
+def _parse_function_call(output):
     try:
-        output = json.loads(response["output"])
+        output = json.loads(output)
     except JSONDecodeError as e:
-        return response["output"], "No function call"
+        return None, "No function call"
     
     function_call = output[0]
     message = dedent(f"""
        function name : {function_call["name"]}
        function arguments : {function_call["arguments"]}
     """)
+    return function_call, message
+
+def _run_agent_executor(query):
+    response = get_agent_executor().invoke({"input": query})
+    function_call, message = _parse_function_call(response["output"])
+    if function_call is None:
+        return response["output"], message
     
     try:
-        fnc = tool_map[function_call["name"]]
+        fnc = get_tool_map()[function_call["name"]]
         result = fnc.run(tool_input=function_call["arguments"])
         return result, message
     except Exception as e:
         return f"function call failed with error {e}", message
+
+async def astream_agent_turn(query):
+    """
+    Async version of run_agent_executor that yields tokens and tool calls as they happen,
+    see agent_stream.py for the events
+    """
+    cache = get_answer_cache()
+    version = await asyncio.to_thread(current_dataset_version)
+    hit, response, embedding = await asyncio.to_thread(cache.lookup, "agent", query, version)
+    if hit:
+        result, message = response
+        yield {"type": "final", "result": result, "message": message, "cached": True}
+        return
+
+    # building the executor can take a while the first time, it must not stall the shared loop
+    executor = await asyncio.to_thread(get_agent_executor)
+    output = None
+    async for event in executor.astream_events({"input": query}, version="v1"):
+        kind = event["event"]
+        if kind == "on_chat_model_stream":
+            text = event["data"]["chunk"].content
+            if text:
+                yield {"type": "token", "text": text}
+        elif kind == "on_tool_start":
+            yield {"type": "tool_start", "name": event["name"], "input": event["data"].get("input")}
+        elif kind == "on_tool_end":
+            yield {"type": "tool_end", "name": event["name"], "output": str(event["data"].get("output"))}
+        elif kind == "on_chain_end" and event["name"] == "AgentExecutor":
+            # the outermost executor finishes last
+            output = event["data"]["output"]["output"]
+
+    if output is None:
+        # the runner turns this into an error event, nothing is cached
+        raise RuntimeError("the agent stream ended without a final answer from the AgentExecutor")
+    function_call, message = _parse_function_call(output)
+    if function_call is None:
+        result = output
+    else:
+        yield {"type": "tool_start", "name": function_call["name"], "input": function_call["arguments"]}
+        try:
+            fnc = get_tool_map()[function_call["name"]]
+            result = await fnc.arun(tool_input=function_call["arguments"])
+        except Exception as e:
+            result = f"function call failed with error {e}"
+        yield {"type": "tool_end", "name": function_call["name"], "output": str(result)}
+
+    if _is_cacheable_agent_response((result, message)):
+        await asyncio.to_thread(cache.store, "agent", query, (result, message), version, embedding)
+    yield {"type": "final", "result": result, "message": message, "cached": False}
+
+# one event loop thread per process runs the streamed turns of every session
+@lazy_resource
+def get_agent_stream_runner():
+    from agent_stream import AgentStreamRunner
+    return AgentStreamRunner(astream_agent_turn)
+
+def stream_agent_executor(query, turn=None):
+    return get_agent_stream_runner().stream(query, turn)
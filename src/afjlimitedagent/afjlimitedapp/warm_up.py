@@ -0,0 +1,67 @@
+"""
+Pre-build the lazy resources of tools.py so the first agent request does not pay for them.
+
+python warm_up.py                      # build every model, index and agent and print the timings
+python warm_up.py --import-budget 2.0  # fail when importing tools.py takes longer than 2 seconds
+
+tests/test_import_budget.py runs the same check with IMPORT_BUDGET_SECONDS.
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+IMPORT_BUDGET_SECONDS = 2.0
+# none of these may be imported by importing tools.py, they belong inside the lazy_resource getters
+HEAVY_MODULES = ["pandas", "sklearn", "statsmodels", "torch", "llama_index", "langchain_openai",
+                 "langchain_community.embeddings", "sentence_transformers", "faiss"]
+
+_IMPORT_REPORT = """
+import sys, json, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+from resources import registered_resources
+print(json.dumps({{
+    "seconds": seconds,
+    "built": [name for name, get in registered_resources().items() if get.is_built()],
+    "heavy_modules": [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+
+def import_report(module="tools"):
+    """
+    Seconds it takes to import module, the lazy resources it built and the heavy modules it pulled in
+    """
+    # import in a fresh interpreter so nothing is already cached in sys.modules
+    code = _IMPORT_REPORT.format(module=module, heavy=HEAVY_MODULES)
+    output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def measure_import_time(module="tools"):
+    return import_report(module)["seconds"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--import-budget", type=float, default=None,
+                        help=f"only check that importing tools.py stays under this many seconds (e.g. {IMPORT_BUDGET_SECONDS})")
+    args = parser.parse_args()
+
+    if args.import_budget is not None:
+        seconds = measure_import_time()
+        print(f"Importing tools took {seconds:.2f}s (budget {args.import_budget:.2f}s)")
+        sys.exit(0 if seconds <= args.import_budget else 1)
+
+    import tools
+    from resources import build_resources
+    timings = build_resources(verbose=True)
+    print(f"Warmed up {len(timings)} resources in {sum(timings.values()):.2f}s")
+
+
+if __name__ == "__main__":
+    main()
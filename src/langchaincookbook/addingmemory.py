@@ -1,5 +1,5 @@
 from operator import itemgetter
-from langchain.memory import ConversationBufferMemory
+from summary_memory import BoundedSummaryMemory
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.runnables import RunnableLambda, RunnablePassthrough
 from langchain_openai import ChatOpenAI 
@@ -15,7 +15,8 @@ prompt = ChatPromptTemplate.from_messages([
     ("human","{input}")
 ])
 
-memory = ConversationBufferMemory(return_messages=True)
+# last turns verbatim, older ones folded into a summary in the background, the prompt stays the same size
+memory = BoundedSummaryMemory(llm=ChatOpenAI(temperature=0), return_messages=True, max_turns=4)
 memory.load_memory_variables({})
 
 chain = RunnablePassthrough.assign(
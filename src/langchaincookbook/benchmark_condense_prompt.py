@@ -0,0 +1,88 @@
+"""
+Benchmark the prompt condenser against the original condense_prompt loop.
+
+Builds agent scratchpads of --sizes function messages (a function call and a Wikipedia style result
+per step) and condenses each the way the agent does: once per agent iteration, on a scratchpad that
+grew by one step. The old loop re-tokenizes the whole prompt for every dropped pair, the condenser
+tokenizes each message once. Both count with the same tokenizer.
+
+python benchmark_condense_prompt.py --sizes 50 100 250 500 --max-tokens 4000
+"""
+import json
+import time
+import argparse
+import numpy as np
+from langchain_core.messages import AIMessage, FunctionMessage, HumanMessage, SystemMessage
+from prompt_condenser import PromptCondenser, message_text
+
+WORDS = ("president state bird species capital river population history election governor "
+         "north american cardinal county founded university senate museum").split()
+
+
+def make_steps(count, rng):
+    steps = []
+    for step in range(count // 2):
+        query = " ".join(rng.choice(WORDS, size=3))
+        pages = []
+        for page in range(3):
+            sentences = [" ".join(rng.choice(WORDS, size=12)).capitalize() + "." for _ in range(8)]
+            pages.append(f"Page: {query.title()} {page}\nSummary: " + " ".join(sentences))
+        steps.append(AIMessage(content="", additional_kwargs={
+            "function_call": {"name": "wikipedia", "arguments": json.dumps({"query": query})}}))
+        steps.append(FunctionMessage(name="wikipedia", content="\n\n".join(pages)))
+    return steps
+
+
+def make_counter():
+    # get_num_tokens_from_messages without any caching, like ChatOpenAI's
+    count_text = PromptCondenser().count_text._count
+
+    def count_messages(messages):
+        return sum(count_text(message_text(message)) + 4 for message in messages) + 3
+    return count_messages
+
+
+def condense_prompt_loop(messages, count_messages, max_tokens):
+    num_tokens = count_messages(messages)
+    ai_function_messages = messages[2:]
+    while num_tokens > max_tokens and ai_function_messages:
+        ai_function_messages = ai_function_messages[2:]
+        num_tokens = count_messages(messages[:2] + ai_function_messages)
+    return messages[:2] + ai_function_messages
+
+
+def run_agent(condense, prefix, steps):
+    # the agent condenses the prompt before every llm call, with one more step each time
+    start = time.perf_counter()
+    for end in range(2, len(steps) + 1, 2):
+        condensed = condense(prefix + steps[:end])
+    return time.perf_counter() - start, condensed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 100, 250, 500])
+    parser.add_argument("--max-tokens", type=int, default=4000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    prefix = [SystemMessage(content="You are a helpful assistant"),
+              HumanMessage(content="Who is the current US president? What's their home state's bird?")]
+    count_messages = make_counter()
+    print(f"{'messages':>9} {'loop s':>8} {'condenser s':>12} {'speedup':>8} {'summarized s':>13} {'same':>5}")
+    for size in args.sizes:
+        steps = make_steps(size, np.random.default_rng(args.seed))
+        loop_seconds, expected = run_agent(lambda m: condense_prompt_loop(m, count_messages, args.max_tokens),
+                                           prefix, steps)
+        condenser = PromptCondenser(max_tokens=args.max_tokens, count_messages=count_messages)
+        seconds, condensed = run_agent(condenser.condense, prefix, steps)
+        summarizing = PromptCondenser(max_tokens=args.max_tokens, count_messages=count_messages,
+                                      summarize_observations=True)
+        summary_seconds, summarized = run_agent(summarizing.condense, prefix, steps)
+        assert count_messages(summarized) <= args.max_tokens
+        print(f"{size:>9} {loop_seconds:>8.3f} {seconds:>12.3f} {loop_seconds / seconds:>7.1f}x "
+              f"{summary_seconds:>13.3f} {str(condensed == expected):>5}")
+
+
+if __name__ == "__main__":
+    main()
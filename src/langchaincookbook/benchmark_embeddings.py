@@ -0,0 +1,106 @@
+"""
+Benchmark the batching embedding client against a local stand-in embeddings server.
+
+The server answers POST /embeddings like the OpenAI API with deterministic vectors after a simulated
+latency of --request-ms per request plus --text-ms per text, and rejects requests with a 429 once
+more than --server-concurrency are in flight. Batch size 1 with concurrency 1 is the old one request
+per text loop.
+
+python benchmark_embeddings.py --texts 2000 --batch-sizes 1 16 64 256 --concurrency 1 4 8
+"""
+import json
+import time
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+from embedding_client import CustomEmbeddingClass
+
+DIMENSIONS = 64
+
+
+def fake_embedding(text):
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:4], "little")
+    return np.random.default_rng(seed).standard_normal(DIMENSIONS).astype(np.float32).tolist()
+
+
+def make_handler(request_ms, text_ms, server_concurrency):
+    in_flight = threading.BoundedSemaphore(server_concurrency)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+            if not in_flight.acquire(blocking=False):
+                self._send(429, {"error": "rate limited"}, {"Retry-After": "0.05"})
+                return
+            try:
+                time.sleep((request_ms + text_ms * len(texts)) / 1000)
+                data = [{"object": "embedding", "index": i, "embedding": fake_embedding(text)}
+                        for i, text in enumerate(texts)]
+            finally:
+                in_flight.release()
+            self._send(200, {"object": "list", "data": data, "model": body["model"]})
+
+        def _send(self, status, payload, headers=None):
+            content = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(content)
+
+    return Handler
+
+
+def start_server(request_ms, text_ms, server_concurrency):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(request_ms, text_ms, server_concurrency))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 16, 64, 256])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--request-ms", type=float, default=20.0)
+    parser.add_argument("--text-ms", type=float, default=0.2)
+    parser.add_argument("--server-concurrency", type=int, default=6)
+    parser.add_argument("--baseline-texts", type=int, default=200,
+                        help="texts embedded with batch size 1, concurrency 1 (it is slow)")
+    args = parser.parse_args()
+
+    server = start_server(args.request_ms, args.text_ms, args.server_concurrency)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    texts = [f"document chunk number {i} " + "lorem ipsum " * (i % 20) for i in range(args.texts)]
+    expected = np.array([fake_embedding(text) for text in texts], dtype=np.float32)
+
+    print(f"{'batch size':>10} {'concurrency':>11} {'texts':>6} {'seconds':>8} {'texts/sec':>10} {'retries':>8}")
+    for batch_size in args.batch_sizes:
+        for concurrency in args.concurrency:
+            sample = texts if batch_size > 1 or concurrency > 1 else texts[:args.baseline_texts]
+            client = CustomEmbeddingClass(model="stand-in", base_url=base_url, api_key="test",
+                                          max_batch_size=batch_size, max_concurrency=concurrency)
+            start = time.perf_counter()
+            vectors = client.embed_documents(sample)
+            elapsed = time.perf_counter() - start
+            client.close()
+            # order has to survive batching, concurrency and retries
+            assert np.array_equal(np.array(vectors, dtype=np.float32), expected[:len(sample)])
+            print(f"{batch_size:>10} {concurrency:>11} {len(sample):>6} {elapsed:>8.2f} "
+                  f"{len(sample) / elapsed:>10.0f} {client.backoff.retries:>8}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Benchmark the SQL QA engine against the chain in queryingsqldb.py, without calling a model.
+
+Each question comes with the SQL a model would write for it, and the two model calls of the chain
+are replaced by a sleep of --llm-ms. The old chain reflects the whole schema twice per question and
+runs every query. The engine builds the schema once, prompts with the tables relevant to the
+question and answers repeated queries from the result cache, first one question at a time and then
+with --concurrency questions in flight. Every question is asked --rounds times.
+
+When --database does not exist a stand-in with the Chinook tables and columns and generated rows
+is written there first.
+
+python benchmark_sql_engine.py --database Chinook.db --llm-ms 300 --concurrency 8
+"""
+import os
+import time
+import sqlite3
+import argparse
+import numpy as np
+from langchain_core.runnables import RunnableLambda
+from langchain_community.utilities.sql_database import SQLDatabase
+from token_counter import TokenCounter
+from sql_engine import SQLQAEngine
+
+QUESTIONS = [
+    ("How many employees are there?", "SELECT COUNT(*) FROM Employee;"),
+    ("How many customers are there in each country?",
+     "SELECT Country, COUNT(*) FROM Customer GROUP BY Country ORDER BY 2 DESC;"),
+    ("Which 5 artists have the most albums?",
+     "SELECT Artist.Name, COUNT(*) FROM Album JOIN Artist ON Album.ArtistId = Artist.ArtistId "
+     "GROUP BY Artist.ArtistId ORDER BY 2 DESC LIMIT 5;"),
+    ("What is the total invoice amount per billing country?",
+     "SELECT BillingCountry, SUM(Total) FROM Invoice GROUP BY BillingCountry ORDER BY 2 DESC;"),
+    ("Which genre has the most tracks?",
+     "SELECT Genre.Name, COUNT(*) FROM Track JOIN Genre ON Track.GenreId = Genre.GenreId "
+     "GROUP BY Genre.GenreId ORDER BY 2 DESC LIMIT 1;"),
+    ("What is the average track length in milliseconds per media type?",
+     "SELECT MediaType.Name, AVG(Milliseconds) FROM Track JOIN MediaType ON Track.MediaTypeId = MediaType.MediaTypeId "
+     "GROUP BY MediaType.MediaTypeId;"),
+    ("Which playlists have more than 100 tracks?",
+     "SELECT Playlist.Name, COUNT(*) FROM PlaylistTrack JOIN Playlist ON PlaylistTrack.PlaylistId = Playlist.PlaylistId "
+     "GROUP BY Playlist.PlaylistId HAVING COUNT(*) > 100;"),
+    ("Which sales support agent has the highest invoice total?",
+     "SELECT Employee.LastName, SUM(Invoice.Total) FROM Invoice JOIN Customer ON Invoice.CustomerId = Customer.CustomerId "
+     "JOIN Employee ON Customer.SupportRepId = Employee.EmployeeId GROUP BY Employee.EmployeeId ORDER BY 2 DESC LIMIT 1;"),
+    ("What are the 10 best selling tracks?",
+     "SELECT Track.Name, SUM(InvoiceLine.Quantity) FROM InvoiceLine JOIN Track ON InvoiceLine.TrackId = Track.TrackId "
+     "GROUP BY Track.TrackId ORDER BY 2 DESC LIMIT 10;"),
+    ("How many invoices were issued per year?",
+     "SELECT strftime('%Y', InvoiceDate), COUNT(*) FROM Invoice GROUP BY 1;"),
+]
+
+CHINOOK_TABLES = """
+CREATE TABLE Artist (ArtistId INTEGER PRIMARY KEY, Name NVARCHAR(120));
+CREATE TABLE Album (AlbumId INTEGER PRIMARY KEY, Title NVARCHAR(160) NOT NULL,
+    ArtistId INTEGER NOT NULL REFERENCES Artist (ArtistId));
+CREATE TABLE Genre (GenreId INTEGER PRIMARY KEY, Name NVARCHAR(120));
+CREATE TABLE MediaType (MediaTypeId INTEGER PRIMARY KEY, Name NVARCHAR(120));
+CREATE TABLE Track (TrackId INTEGER PRIMARY KEY, Name NVARCHAR(200) NOT NULL,
+    AlbumId INTEGER REFERENCES Album (AlbumId), MediaTypeId INTEGER NOT NULL REFERENCES MediaType (MediaTypeId),
+    GenreId INTEGER REFERENCES Genre (GenreId), Composer NVARCHAR(220), Milliseconds INTEGER NOT NULL,
+    Bytes INTEGER, UnitPrice NUMERIC(10,2) NOT NULL);
+CREATE TABLE Playlist (PlaylistId INTEGER PRIMARY KEY, Name NVARCHAR(120));
+CREATE TABLE PlaylistTrack (PlaylistId INTEGER NOT NULL REFERENCES Playlist (PlaylistId),
+    TrackId INTEGER NOT NULL REFERENCES Track (TrackId), PRIMARY KEY (PlaylistId, TrackId));
+CREATE TABLE Employee (EmployeeId INTEGER PRIMARY KEY, LastName NVARCHAR(20) NOT NULL,
+    FirstName NVARCHAR(20) NOT NULL, Title NVARCHAR(30), ReportsTo INTEGER REFERENCES Employee (EmployeeId),
+    BirthDate DATETIME, HireDate DATETIME, City NVARCHAR(40), Country NVARCHAR(40), Email NVARCHAR(60));
+CREATE TABLE Customer (CustomerId INTEGER PRIMARY KEY, FirstName NVARCHAR(40) NOT NULL,
+    LastName NVARCHAR(20) NOT NULL, Company NVARCHAR(80), City NVARCHAR(40), Country NVARCHAR(40),
+    Email NVARCHAR(60) NOT NULL, SupportRepId INTEGER REFERENCES Employee (EmployeeId));
+CREATE TABLE Invoice (InvoiceId INTEGER PRIMARY KEY, CustomerId INTEGER NOT NULL REFERENCES Customer (CustomerId),
+    InvoiceDate DATETIME NOT NULL, BillingCity NVARCHAR(40), BillingCountry NVARCHAR(40), Total NUMERIC(10,2) NOT NULL);
+CREATE TABLE InvoiceLine (InvoiceLineId INTEGER PRIMARY KEY, InvoiceId INTEGER NOT NULL REFERENCES Invoice (InvoiceId),
+    TrackId INTEGER NOT NULL REFERENCES Track (TrackId), UnitPrice NUMERIC(10,2) NOT NULL, Quantity INTEGER NOT NULL);
+"""
+
+
+def build_chinook(path, scale, rng):
+    """
+    Chinook tables and columns with generated rows, scale 1 is about the size of the real database
+    """
+    countries = ["USA", "Canada", "Brazil", "France", "Germany", "United Kingdom", "India", "Portugal"]
+    connection = sqlite3.connect(path)
+    connection.executescript(CHINOOK_TABLES)
+    count = lambda n: max(1, int(n * scale))
+    artists, albums, tracks = count(275), count(347), count(3503)
+    customers, invoices, lines = count(59), count(412), count(2240)
+    rows = {
+        "Artist": [(i, f"Artist {i}") for i in range(1, artists + 1)],
+        "Album": [(i, f"Album {i}", int(rng.integers(1, artists + 1))) for i in range(1, albums + 1)],
+        "Genre": [(i, name) for i, name in enumerate(["Rock", "Jazz", "Metal", "Blues", "Latin", "Pop"], 1)],
+        "MediaType": [(i, name) for i, name in enumerate(["MPEG audio file", "AAC audio file", "Protected AAC"], 1)],
+        "Track": [(i, f"Track {i}", int(rng.integers(1, albums + 1)), int(rng.integers(1, 4)), int(rng.integers(1, 7)),
+                   None, int(rng.integers(60_000, 600_000)), int(rng.integers(1_000_000, 10_000_000)), 0.99)
+                  for i in range(1, tracks + 1)],
+        "Playlist": [(i, f"Playlist {i}") for i in range(1, 19)],
+        "PlaylistTrack": sorted({(int(rng.integers(1, 19)), int(rng.integers(1, tracks + 1))) for _ in range(count(8715))}),
+        "Employee": [(i, f"Last{i}", f"First{i}", "Sales Support Agent", 1 if i > 1 else None, "1970-01-01",
+                      "2002-05-01", "Calgary", "Canada", f"employee{i}@chinookcorp.com") for i in range(1, 9)],
+        "Customer": [(i, f"First{i}", f"Last{i}", None, "City", countries[i % len(countries)], f"customer{i}@mail.com",
+                      int(rng.integers(3, 6))) for i in range(1, customers + 1)],
+        "Invoice": [(i, int(rng.integers(1, customers + 1)), f"{2009 + i % 5}-{1 + i % 12:02d}-01", "City",
+                     countries[i % len(countries)], round(float(rng.uniform(1, 25)), 2)) for i in range(1, invoices + 1)],
+        "InvoiceLine": [(i, int(rng.integers(1, invoices + 1)), int(rng.integers(1, tracks + 1)), 0.99, 1)
+                        for i in range(1, lines + 1)],
+    }
+    for table, values in rows.items():
+        connection.executemany(f"INSERT INTO {table} VALUES ({', '.join('?' * len(values[0]))})", values)
+    connection.commit()
+    connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", default="Chinook.db")
+    parser.add_argument("--scale", type=float, default=1.0, help="size of a generated stand-in database")
+    parser.add_argument("--llm-ms", type=float, default=300)
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.database):
+        print(f"{args.database} not found, writing a generated stand-in with the Chinook schema")
+        build_chinook(args.database, args.scale, np.random.default_rng(0))
+    uri = f"sqlite:///{os.path.abspath(args.database)}"
+    count_tokens = TokenCounter()
+    llm = lambda: time.sleep(args.llm_ms / 1000)
+    questions = QUESTIONS * args.rounds
+
+    db = SQLDatabase.from_uri(uri)
+
+    def old_chain(item):
+        question, sql = item
+        schema = db.get_table_info()
+        llm()
+        schema = db.get_table_info()
+        response = db.run(sql)
+        llm()
+        return count_tokens(schema), response
+
+    start = time.perf_counter()
+    old = [old_chain(item) for item in questions]
+    old_seconds = time.perf_counter() - start
+
+    def engine_chain(engine):
+        def answer(item):
+            question, sql = item
+            schema = engine.schema(question)
+            llm()
+            response = engine.run(sql)
+            llm()
+            return count_tokens(schema), response
+        return RunnableLambda(answer)
+
+    engine = SQLQAEngine(uri)
+    start = time.perf_counter()
+    sequential = engine_chain(engine).batch(questions, config={"max_concurrency": 1})
+    sequential_seconds = time.perf_counter() - start
+
+    batch_engine = SQLQAEngine(uri, pool_size=args.concurrency)
+    start = time.perf_counter()
+    batched = engine_chain(batch_engine).batch(questions, config={"max_concurrency": args.concurrency})
+    batch_seconds = time.perf_counter() - start
+
+    assert [response for _, response in old] == [response for _, response in sequential] == [response for _, response in batched]
+    print(f"{len(questions)} questions, {args.llm_ms:.0f} ms per model call")
+    print(f"{'chain':>22} {'seconds':>8} {'schema tokens':>14}")
+    print(f"{'old':>22} {old_seconds:>8.2f} {np.mean([tokens for tokens, _ in old]):>14.0f}")
+    print(f"{'engine':>22} {sequential_seconds:>8.2f} {np.mean([tokens for tokens, _ in sequential]):>14.0f}")
+    print(f"{f'engine, {args.concurrency} at once':>22} {batch_seconds:>8.2f} {np.mean([tokens for tokens, _ in batched]):>14.0f}")
+    print(f"engine: {engine.metrics}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Embeddings shared by the cookbook, multipdf and pdfchat_v1.
+
+CachedEmbeddings wraps any langchain Embeddings implementation with a persistent cache: vectors
+are stored as float32 blobs in SQLite, keyed by a sha256 of the model identity and the text, so
+the same text is only ever embedded once per model, across runs and across projects. The cache
+counts hits and misses and drops the least recently used vectors past max_entries.
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import List
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables.config import run_in_executor
+
+EMBEDDING_CACHE_PATH = os.environ.get(
+    "EMBEDDING_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "embedding_cache", "embeddings.sqlite"))
+# sqlite limits the number of bound variables per statement
+_LOOKUP_CHUNK = 500
+
+
+def embedding_model_name(embeddings):
+    """
+    Identity of an embeddings implementation, vectors of different models never share cache entries
+    """
+    for attribute in ("model", "model_name", "model_id"):
+        value = getattr(embeddings, attribute, None)
+        if isinstance(value, str) and value:
+            return f"{type(embeddings).__name__}:{value}"
+    return type(embeddings).__name__
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Persistent, size bounded cache in front of another Embeddings implementation
+    """
+
+    def __init__(self, underlying: Embeddings, path=EMBEDDING_CACHE_PATH, namespace=None, max_entries=200_000):
+        self.underlying = underlying
+        self.path = path
+        self.namespace = namespace or embedding_model_name(underlying)
+        self.max_entries = max_entries
+        self.metrics = {"hits": 0, "misses": 0}
+        self._open()
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self.connection.commit()
+
+    # vector stores such as FAISS get pickled with their embeddings, the connection is reopened on load
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state["connection"], state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open()
+
+    def _key(self, kind, text):
+        return hashlib.sha256(f"{self.namespace}\0{kind}\0{text}".encode()).hexdigest()
+
+    def _lookup(self, keys):
+        found = {}
+        now = time.time()
+        with self.lock:
+            for start in range(0, len(keys), _LOOKUP_CHUNK):
+                chunk = keys[start:start + _LOOKUP_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk).fetchall()
+                found.update({key: np.frombuffer(vector, dtype=np.float32).tolist() for key, vector in rows})
+                self.connection.execute(
+                    f"UPDATE embeddings SET last_used = ? WHERE key IN ({placeholders})", [now, *chunk])
+            self.connection.commit()
+        return found
+
+    def _store(self, vectors):
+        now = time.time()
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)",
+                [(key, vector.tobytes(), now) for key, vector in vectors.items()])
+            # least recently used vectors go first once the cache is full
+            self.connection.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,))
+            self.connection.commit()
+
+    def _embed(self, kind, texts, compute):
+        keys = [self._key(kind, text) for text in texts]
+        found = self._lookup(list(set(keys)))
+        # every distinct missing text is embedded once, in one call to the underlying model
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        with self.lock:
+            self.metrics["hits"] += len(keys) - len(missing)
+            self.metrics["misses"] += len(missing)
+        if missing:
+            vectors = np.asarray(compute(list(missing.values())), dtype=np.float32)
+            computed = dict(zip(missing.keys(), vectors))
+            self._store(computed)
+            # returned as float32 values so a fresh vector equals the one read back from the cache later
+            found.update({key: vector.tolist() for key, vector in computed.items()})
+        return [found[key] for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed search docs."""
+        return self._embed("document", texts, self.underlying.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed query text."""
+        return self._embed("query", [text], lambda texts: [self.underlying.embed_query(texts[0])])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Asynchronous Embed search docs."""
+        return await run_in_executor(None, self.embed_documents, texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Asynchronous Embed query text."""
+        return await run_in_executor(None, self.embed_query, text)
+
+    def stats(self):
+        with self.lock:
+            metrics = dict(self.metrics)
+            metrics["entries"] = self.connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        lookups = metrics["hits"] + metrics["misses"]
+        metrics["hit_rate"] = metrics["hits"] / lookups if lookups else 0.0
+        return metrics
+
+    def clear(self):
+        with self.lock:
+            self.connection.execute("DELETE FROM embeddings")
+            self.connection.commit()
@@ -1,10 +1,15 @@
+import os
+import sys
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
 
-from langchain_experimental.utilities import PythonREPL
 from langchain_openai import ChatOpenAI
 from dotenv import load_dotenv
 
+# generated code runs in the sandbox worker pool of the afj app instead of this process
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "afjlimitedagent", "afjlimitedapp"))
+from sandbox import SandboxPool
+
 
 load_dotenv()
 
@@ -31,10 +36,13 @@ def _sanitize_output(text: str):
     _, after = text.split("```python")
     return after.split("```")[0]
 
-chain = prompt | model | StrOutputParser() | _sanitize_output | PythonREPL().run
-
+if __name__ == "__main__":
+    # guarded so sandbox workers started with spawn do not re-run the chain
+    sandbox = SandboxPool(workers=1, cpu_seconds=5, wall_seconds=10, memory_mb=512)
+    chain = prompt | model | StrOutputParser() | _sanitize_output | sandbox.run
 
-print(chain.invoke({"input": "What is 2 plus 2"}))
+    print(chain.invoke({"input": "What is 2 plus 2"}))
+    sandbox.close()
 
 
 
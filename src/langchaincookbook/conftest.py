@@ -0,0 +1 @@
+# pytest puts this directory on sys.path, the tests import the cookbook modules the way the scripts do
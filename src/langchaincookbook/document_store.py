@@ -0,0 +1,131 @@
+"""
+FAISS vector store persisted on disk and updated in place.
+
+Documents are identified by the sha256 of their text, so adding a text that is already stored
+costs nothing and a text can be deleted without rebuilding the index. The index and docstore are
+written with the same files as FAISS.save_local, under a directory named after the embedding
+model, so switching models never mixes vectors of different models. A warm start memory maps
+index.faiss instead of embedding the corpus again; the index is read into memory on the first change.
+"""
+import os
+import re
+import json
+import pickle
+import hashlib
+import faiss
+from langchain_community.vectorstores import FAISS
+from cached_embeddings import embedding_model_name
+
+VECTORSTORE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "vectorstores")
+INDEX_NAME = "index"
+MANIFEST_FILE = "manifest.json"
+
+
+def text_id(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _model_slug(model_name):
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name).strip("_")
+
+
+class PersistentFAISSStore:
+    """
+    vectorstore is None until the first texts are added, as_retriever() raises ValueError before that
+    """
+
+    def __init__(self, name, embeddings, directory=VECTORSTORE_DIRECTORY, model_name=None, mmap=True):
+        self.embeddings = embeddings
+        self.model_name = model_name or getattr(embeddings, "namespace", None) or embedding_model_name(embeddings)
+        self.path = os.path.join(directory, name, _model_slug(self.model_name))
+        self.vectorstore = None
+        self.mapped = False
+        if os.path.exists(os.path.join(self.path, MANIFEST_FILE)):
+            self._load(mmap)
+
+    def _load(self, mmap):
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap else 0
+        index = faiss.read_index(os.path.join(self.path, f"{INDEX_NAME}.faiss"), flags)
+        with open(os.path.join(self.path, f"{INDEX_NAME}.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        self.vectorstore = FAISS(embedding_function=self.embeddings, index=index, docstore=docstore,
+                                 index_to_docstore_id=index_to_docstore_id)
+        self.mapped = mmap
+
+    def _writable(self):
+        # a memory mapped index is read only, it is read into memory before it changes
+        if self.mapped:
+            self._load(mmap=False)
+
+    def ids(self):
+        if self.vectorstore is None:
+            return set()
+        return set(self.vectorstore.index_to_docstore_id.values())
+
+    def add_texts(self, texts, metadatas=None):
+        """
+        Embed and add the texts that are not stored yet, returns how many were added
+        """
+        known = self.ids()
+        metadatas = metadatas or [{} for _ in texts]
+        new_texts, new_metadatas, new_ids = [], [], []
+        for text, metadata in zip(texts, metadatas):
+            identifier = text_id(text)
+            if identifier not in known:
+                known.add(identifier)
+                new_texts.append(text)
+                new_metadatas.append(metadata)
+                new_ids.append(identifier)
+        if not new_texts:
+            return 0
+        if self.vectorstore is None:
+            self.vectorstore = FAISS.from_texts(new_texts, self.embeddings, metadatas=new_metadatas, ids=new_ids)
+        else:
+            self._writable()
+            self.vectorstore.add_texts(new_texts, metadatas=new_metadatas, ids=new_ids)
+        self.save()
+        return len(new_texts)
+
+    def delete_ids(self, ids):
+        ids = list(set(ids) & self.ids())
+        if not ids:
+            return 0
+        self._writable()
+        self.vectorstore.delete(ids)
+        self.save()
+        return len(ids)
+
+    def delete_texts(self, texts):
+        return self.delete_ids([text_id(text) for text in texts])
+
+    def sync(self, texts, metadatas=None):
+        """
+        Make the store hold exactly these texts, only the difference is embedded or deleted
+        """
+        wanted = {text_id(text) for text in texts}
+        deleted = self.delete_ids(self.ids() - wanted)
+        added = self.add_texts(texts, metadatas)
+        return {"added": added, "deleted": deleted, "total": len(self.ids())}
+
+    def save(self):
+        # written next to the store and renamed over it, readers that mapped the old index keep their copy
+        staging = self.path + ".tmp"
+        self.vectorstore.save_local(staging, INDEX_NAME)
+        os.makedirs(self.path, exist_ok=True)
+        for extension in ("faiss", "pkl"):
+            os.replace(os.path.join(staging, f"{INDEX_NAME}.{extension}"), os.path.join(self.path, f"{INDEX_NAME}.{extension}"))
+        os.rmdir(staging)
+        manifest = {
+            "embedding_model": self.model_name,
+            "documents": len(self.vectorstore.index_to_docstore_id),
+            "dimension": self.vectorstore.index.d,
+        }
+        with open(os.path.join(self.path, MANIFEST_FILE + ".tmp"), "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(os.path.join(self.path, MANIFEST_FILE + ".tmp"), os.path.join(self.path, MANIFEST_FILE))
+
+    def as_retriever(self, **kwargs):
+        if self.vectorstore is None:
+            # FAISS needs a first vector to know the embedding dimension, an empty store has no index
+            raise ValueError(f"the document store at {self.path} holds no documents yet, add texts before searching it")
+        return self.vectorstore.as_retriever(**kwargs)
@@ -0,0 +1,218 @@
+"""
+Batching client for OpenAI compatible embedding endpoints.
+
+Texts are packed into batches of at most max_batch_tokens tokens (and max_batch_size texts) and
+every batch is one POST to {OPENAI_API_BASE}/embeddings on a single pooled HTTP client. Up to
+max_concurrency batches are in flight at once. A 429 or 5xx response pauses every batch, for the
+Retry-After time when the server sends one and for an exponentially growing delay otherwise, and
+the pause shrinks again as requests succeed. Vectors are returned in the order of the input texts.
+
+python benchmark_embeddings.py compares batch sizes and concurrency levels against a local stand-in server.
+"""
+import os
+import time
+import random
+import asyncio
+import threading
+import weakref
+from typing import List
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from langchain_core.embeddings import Embeddings
+from token_counter import TokenCounter
+
+DEFAULT_MODEL = "text-embedding-ada-002"
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def _item_embedding(item):
+    embedding = item["embedding"]
+    # some proxies nest the vector in a full embeddings response
+    if isinstance(embedding, dict):
+        embedding = embedding["data"][0]["embedding"]
+    return embedding
+
+
+class RateLimitBackoff:
+    """
+    Pause shared by every batch of a client, grows on rate limits and server errors and shrinks on success
+    """
+
+    def __init__(self, base_delay=0.5, max_delay=30.0):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.delay = 0.0
+        self.resume_at = 0.0
+        self.retries = 0
+        self.lock = threading.Lock()
+
+    def failed(self, retry_after=None):
+        with self.lock:
+            self.retries += 1
+            self.delay = min(self.max_delay, max(self.base_delay, self.delay * 2))
+            wait = retry_after if retry_after is not None else self.delay * random.uniform(0.5, 1.0)
+            self.resume_at = max(self.resume_at, time.monotonic() + wait)
+
+    def succeeded(self):
+        with self.lock:
+            self.delay /= 2
+
+    def wait_time(self):
+        return max(0.0, self.resume_at - time.monotonic())
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers["retry-after"])
+    except (KeyError, ValueError):
+        return None
+
+
+class CustomEmbeddingClass(Embeddings):
+
+    def __init__(self, model=DEFAULT_MODEL, base_url=None, api_key=None, max_batch_tokens=8000,
+                 max_batch_size=256, max_concurrency=4, max_retries=6, timeout=60.0):
+        self.model = model
+        self.base_url = (base_url or os.environ.get("OPENAI_API_BASE") or "https://api.openai.com/v1").rstrip("/")
+        self.api_key = api_key or os.environ.get("OPENAI_API_KEY")
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self._setup()
+
+    def _setup(self):
+        self.backoff = RateLimitBackoff()
+        self.count_tokens = TokenCounter(max_entries=10_000)
+        self._client = None
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    # the clients can not be pickled, a store pickled with its embeddings gets new ones on load
+    def __getstate__(self):
+        return {name: value for name, value in self.__dict__.items()
+                if name not in ("backoff", "count_tokens", "_client", "_async_clients", "_lock")}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._setup()
+
+    def _limits(self):
+        return httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+
+    def _headers(self):
+        return {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = httpx.Client(base_url=self.base_url, headers=self._headers(),
+                                            limits=self._limits(), timeout=self.timeout)
+            return self._client
+
+    def _async_client(self):
+        # an async client belongs to the loop it was first used on
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(base_url=self.base_url, headers=self._headers(),
+                                       limits=self._limits(), timeout=self.timeout)
+            self._async_clients[loop] = client
+        return client
+
+    def batches(self, texts):
+        """
+        Split texts into lists of indices that stay under the token and size limits of one request
+        """
+        batches, batch, batch_tokens = [], [], 0
+        for index, text in enumerate(texts):
+            tokens = self.count_tokens(text)
+            if batch and (batch_tokens + tokens > self.max_batch_tokens or len(batch) >= self.max_batch_size):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(index)
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _parse(self, response):
+        data = sorted(response.json()["data"], key=lambda item: item.get("index", 0))
+        return [_item_embedding(item) for item in data]
+
+    def _check(self, response, attempt):
+        # True when the batch should be retried
+        if response.status_code in RETRY_STATUS and attempt < self.max_retries:
+            self.backoff.failed(_retry_after(response))
+            return True
+        response.raise_for_status()
+        self.backoff.succeeded()
+        return False
+
+    def _embed_batch(self, batch):
+        body = {"input": batch, "model": self.model}
+        for attempt in range(self.max_retries + 1):
+            time.sleep(self.backoff.wait_time())
+            try:
+                response = self.client.post("/embeddings", json=body)
+            except httpx.TransportError:
+                if attempt == self.max_retries:
+                    raise
+                self.backoff.failed()
+                continue
+            if not self._check(response, attempt):
+                return self._parse(response)
+
+    async def _aembed_batch(self, batch, slots):
+        body = {"input": batch, "model": self.model}
+        async with slots:
+            for attempt in range(self.max_retries + 1):
+                await asyncio.sleep(self.backoff.wait_time())
+                try:
+                    response = await self._async_client().post("/embeddings", json=body)
+                except httpx.TransportError:
+                    if attempt == self.max_retries:
+                        raise
+                    self.backoff.failed()
+                    continue
+                if not self._check(response, attempt):
+                    return self._parse(response)
+
+    def _assemble(self, texts, batches, results):
+        embeddings = [None] * len(texts)
+        for batch, vectors in zip(batches, results):
+            for index, vector in zip(batch, vectors):
+                embeddings[index] = vector
+        return embeddings
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed search docs."""
+        batches = self.batches(texts)
+        if len(batches) <= 1:
+            results = [self._embed_batch([texts[i] for i in batch]) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                results = list(executor.map(lambda batch: self._embed_batch([texts[i] for i in batch]), batches))
+        return self._assemble(texts, batches, results)
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed query text."""
+        return self._embed_batch([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Asynchronous Embed search docs."""
+        batches = self.batches(texts)
+        slots = asyncio.Semaphore(self.max_concurrency)
+        results = await asyncio.gather(*[self._aembed_batch([texts[i] for i in batch], slots) for batch in batches])
+        return self._assemble(texts, batches, results)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Asynchronous Embed query text."""
+        return (await self.aembed_documents([text]))[0]
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
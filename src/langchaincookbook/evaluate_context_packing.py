@@ -0,0 +1,137 @@
+"""
+Evaluate the context packer on a local corpus without calling a model.
+
+The corpus (markdown and text files) is split into 1000 character chunks with a 200 character
+overlap, like the cookbook splitters. Each question is a sentence taken from the corpus with a few
+words dropped, the sentence itself is the reference answer. The top k chunks of a TF-IDF retriever
+are packed at several token budgets, and the script reports prompt tokens against answer overlap:
+the share of reference answer words that are still in the context.
+
+python evaluate_context_packing.py --corpus ../.. --questions 200 --budgets 300 600 1000 1500
+"""
+import os
+import re
+import argparse
+import numpy as np
+from langchain_core.documents import Document
+from context_packer import ContextPacker
+from token_counter import TokenCounter
+
+_WORD = re.compile(r"\w+")
+
+
+def load_corpus(directory, extensions=(".md", ".txt")):
+    texts = []
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [name for name in dirs if not name.startswith(".") and name != "node_modules"]
+        for file in sorted(files):
+            if file.endswith(extensions):
+                with open(os.path.join(root, file), encoding="utf-8", errors="ignore") as f:
+                    texts.append(f.read())
+    return texts
+
+
+def split_text(text, chunk_size=1000, chunk_overlap=200):
+    chunks, start = [], 0
+    while start < len(text):
+        end = min(len(text), start + chunk_size)
+        chunks.append(text[start:end])
+        if end == len(text):
+            break
+        start = end - chunk_overlap
+    return chunks
+
+
+class TfidfRetriever:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.vocabulary = {}
+        rows = [self._counts(chunk, grow=True) for chunk in chunks]
+        matrix = np.zeros((len(chunks), len(self.vocabulary)), dtype=np.float32)
+        for row, counts in enumerate(rows):
+            for column, count in counts.items():
+                matrix[row, column] = count
+        self.idf = np.log((1 + len(chunks)) / (1 + (matrix > 0).sum(axis=0))) + 1
+        self.matrix = self._normalize(matrix * self.idf)
+
+    def _counts(self, text, grow=False):
+        counts = {}
+        for word in _WORD.findall(text.lower()):
+            if word not in self.vocabulary:
+                if not grow:
+                    continue
+                self.vocabulary[word] = len(self.vocabulary)
+            column = self.vocabulary[word]
+            counts[column] = counts.get(column, 0) + 1
+        return counts
+
+    @staticmethod
+    def _normalize(matrix):
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        norms[norms == 0] = 1
+        return matrix / norms
+
+    def search(self, query, k):
+        vector = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for column, count in self._counts(query).items():
+            vector[column] = count
+        scores = self.matrix @ self._normalize(vector * self.idf)
+        return [Document(page_content=self.chunks[i], metadata={"chunk": int(i)}) for i in np.argsort(-scores)[:k]]
+
+
+def make_questions(texts, count, rng):
+    sentences = []
+    for text in texts:
+        sentences.extend(sentence.strip() for sentence in re.split(r"(?<=[.!?])\s+|\n{2,}", text)
+                         if 8 <= len(_WORD.findall(sentence)) <= 40)
+    picked = rng.choice(len(sentences), size=min(count, len(sentences)), replace=False)
+    questions = []
+    for index in picked:
+        words = sentences[index].split()
+        # drop a third of the words so the question is not an exact copy of the answer
+        keep = sorted(rng.choice(len(words), size=max(3, len(words) * 2 // 3), replace=False))
+        questions.append((" ".join(words[i] for i in keep), sentences[index]))
+    return questions
+
+
+def answer_overlap(answer, context):
+    answer_words = set(_WORD.findall(answer.lower()))
+    context_words = set(_WORD.findall(context.lower()))
+    return len(answer_words & context_words) / len(answer_words) if answer_words else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--budgets", type=int, nargs="+", default=[300, 600, 1000, 1500])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    texts = load_corpus(args.corpus)
+    chunks = [chunk for text in texts for chunk in split_text(text)]
+    retriever = TfidfRetriever(chunks)
+    questions = make_questions(texts, args.questions, np.random.default_rng(args.seed))
+    count_tokens = TokenCounter()
+    print(f"{len(texts)} files, {len(chunks)} chunks, {len(questions)} questions, top {args.k} chunks")
+
+    retrieved = [(retriever.search(question, args.k), answer) for question, answer in questions]
+    full_tokens = np.mean([sum(count_tokens(doc.page_content) for doc in docs) for docs, _ in retrieved])
+    full_overlap = np.mean([answer_overlap(answer, "\n\n".join(doc.page_content for doc in docs))
+                            for docs, answer in retrieved])
+    print(f"{'budget':>8} {'tokens':>8} {'reduction':>10} {'answer overlap':>15}")
+    print(f"{'none':>8} {full_tokens:>8.0f} {'':>10} {full_overlap:>15.3f}")
+    for budget in args.budgets:
+        packer = ContextPacker(token_budget=budget, count_tokens=count_tokens)
+        tokens, overlaps = [], []
+        for docs, answer in retrieved:
+            packed = packer.pack(docs)
+            tokens.append(sum(count_tokens(doc.page_content) for doc in packed))
+            overlaps.append(answer_overlap(answer, "\n\n".join(doc.page_content for doc in packed)))
+        print(f"{budget:>8} {np.mean(tokens):>8.0f} {1 - np.mean(tokens) / full_tokens:>10.1%} {np.mean(overlaps):>15.3f}")
+    print(f"token count cache: {count_tokens.metrics}")
+
+
+if __name__ == "__main__":
+    main()
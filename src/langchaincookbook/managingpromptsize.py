@@ -11,12 +11,15 @@ from langchain_community.utilities import WikipediaAPIWrapper
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_openai import ChatOpenAI
 from operator import itemgetter
+from prompt_condenser import PromptCondenser
+from wikipedia_cache import CachedWikipediaQueryRun
 
 
 load_dotenv()
 
-wiki = WikipediaQueryRun(
+wiki = CachedWikipediaQueryRun(
     api_wrapper=WikipediaAPIWrapper(top_k_results=5, doc_content_chars_max=10_000),
+    max_observation_tokens=600,
 )
 tools = [wiki]
 
@@ -35,17 +38,12 @@ model = ChatOpenAI()
 
 
 
+condenser = PromptCondenser(max_tokens=4_000, count_messages=model.get_num_tokens_from_messages,
+                            summarize_observations=True)
+
+
 def condense_prompt(prompt: ChatPromptValue) -> ChatPromptValue:
-    messages = prompt.to_messages()
-    num_tokens = model.get_num_tokens_from_messages(messages)
-    ai_function_messages = messages[2:]
-    while num_tokens > 4_000:
-        ai_function_messages = ai_function_messages[2:]
-        num_tokens = model.get_num_tokens_from_messages(
-            messages[:2] + ai_function_messages
-        )
-    messages = messages[:2] + ai_function_messages
-    return ChatPromptValue(messages=messages)
+    return condenser(prompt)
     
 agent = (
     {
@@ -57,6 +55,10 @@ agent = (
 
 
 agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True)
+question = "Who is the current US president? What's their home state? What's their home state's bird? What's that bird's scientific name?"
+# observations are ranked against the whole question, not only the search query
+wiki.question = question
 print(agent_executor.invoke({
-    "input": "Who is the current US president? What's their home state? What's their home state's bird? What's that bird's scientific name?"
-}))
\ No newline at end of file
+    "input": question
+}))
+print(f"wikipedia cache: {wiki.cache.metrics}, observation tokens: {wiki.metrics}")
\ No newline at end of file
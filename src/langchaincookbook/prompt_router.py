@@ -0,0 +1,196 @@
+"""
+Routes queries to the most similar of many prompt templates.
+
+The template embeddings are kept as one L2 normalized float32 matrix, so scoring a query is a
+single matrix-vector product (a matrix-matrix product for a batch of queries). Templates are
+embedded with embed_documents and queries always with embed_query, whatever the batch size. Above
+faiss_threshold templates the matrix goes into a FAISS HNSW index instead. Decisions are kept in
+an LRU cache keyed by the normalized query text, so a repeated query costs no embedding call.
+
+HybridRouter puts a local BM25 stage in front of it: queries whose keywords clearly point at one
+template are routed in microseconds, only the uncertain ones pay for the query embedding.
+"""
+import re
+import time
+from collections import Counter, OrderedDict
+import numpy as np
+
+
+def _normalize_rows(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _cache_key(query):
+    return " ".join(query.lower().split())
+
+
+class PromptRouter:
+    """
+    Nearest template by cosine similarity, route() returns (index, score)
+    """
+
+    def __init__(self, embeddings, templates, faiss_threshold=1000, cache_size=4096, hnsw_neighbors=32):
+        self.embeddings = embeddings
+        self.templates = list(templates)
+        self.matrix = _normalize_rows(embeddings.embed_documents(self.templates))
+        self.index = None
+        if len(self.templates) > faiss_threshold:
+            import faiss
+            self.index = faiss.IndexHNSWFlat(self.matrix.shape[1], hnsw_neighbors, faiss.METRIC_INNER_PRODUCT)
+            self.index.add(self.matrix)
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.metrics = {"routed": 0, "cache_hits": 0}
+
+    def score(self, query_vectors):
+        """
+        Best template index and cosine similarity for each row of query_vectors
+        """
+        queries = _normalize_rows(query_vectors)
+        if self.index is not None:
+            scores, indices = self.index.search(queries, 1)
+            return indices[:, 0], scores[:, 0]
+        similarity = queries @ self.matrix.T
+        indices = similarity.argmax(axis=1)
+        return indices, similarity[np.arange(len(indices)), indices]
+
+    def route_batch(self, queries):
+        """
+        Route many queries at once, each uncached one is embedded once
+        """
+        keys = [_cache_key(query) for query in queries]
+        decisions = {}
+        missing = {}
+        for key, query in zip(keys, queries):
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                decisions[key] = self.cache[key]
+                self.metrics["cache_hits"] += 1
+            elif key not in missing:
+                missing[key] = query
+        if missing:
+            # always as a query, some providers embed documents differently and the route must not
+            # depend on the size of the batch a query came in
+            vectors = [self.embeddings.embed_query(query) for query in missing.values()]
+            indices, scores = self.score(vectors)
+            for key, index, score in zip(missing, indices, scores):
+                decisions[key] = (int(index), float(score))
+                self._remember(key, decisions[key])
+        self.metrics["routed"] += len(queries)
+        return [decisions[key] for key in keys]
+
+    def route(self, query):
+        return self.route_batch([query])[0]
+
+    def template(self, query):
+        return self.templates[self.route(query)[0]]
+
+    def _remember(self, key, decision):
+        self.cache[key] = decision
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {"a", "an", "the", "is", "are", "was", "what", "whats", "s", "how", "why", "do", "does", "of", "to",
+              "in", "on", "and", "or", "for", "me", "i", "you", "it", "this", "that", "can", "with", "about"}
+
+
+def _tokens(text):
+    return [token for token in _TOKEN.findall(text.lower()) if token not in _STOPWORDS]
+
+
+class LexicalRouter:
+    """
+    BM25 over one document per route: its description plus the queries routed to it so far.
+    route() returns (index, confidence), the confidence is the relative margin of the best score
+    over the runner up, 0 when no query term is known
+    """
+
+    def __init__(self, descriptions, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_counts = [Counter() for _ in descriptions]
+        self.lengths = np.zeros(len(descriptions), dtype=np.float64)
+        self.postings = {}
+        for index, description in enumerate(descriptions):
+            self.learn(description, index)
+
+    def learn(self, text, index):
+        tokens = _tokens(text)
+        self.term_counts[index].update(tokens)
+        self.lengths[index] += len(tokens)
+        for token in set(tokens):
+            self.postings.setdefault(token, set()).add(index)
+
+    def scores(self, query):
+        scores = np.zeros(len(self.term_counts))
+        routes = len(self.term_counts)
+        average_length = self.lengths.mean() or 1.0
+        for token in set(_tokens(query)):
+            indices = self.postings.get(token)
+            if not indices:
+                continue
+            idf = np.log(1 + (routes - len(indices) + 0.5) / (len(indices) + 0.5))
+            for index in indices:
+                tf = self.term_counts[index][token]
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[index] / average_length)
+                scores[index] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+    def route(self, query):
+        scores = self.scores(query)
+        if len(scores) == 1:
+            return 0, 1.0 if scores[0] > 0 else 0.0
+        second, best = np.argpartition(scores, -2)[-2:]
+        if scores[best] <= 0:
+            return int(best), 0.0
+        return int(best), float((scores[best] - scores[second]) / scores[best])
+
+
+class HybridRouter:
+    """
+    Routes with the lexical router when it is confident enough and with the embedding router otherwise.
+    Queries decided by embeddings are added to the lexical route documents, so the share of queries
+    routed locally grows with use
+    """
+
+    def __init__(self, lexical, semantic, confidence_threshold=0.5, learn=True):
+        self.lexical = lexical
+        self.semantic = semantic
+        self.confidence_threshold = confidence_threshold
+        self.learn = learn
+        self.metrics = {"local": 0, "embedded": 0, "local_seconds": 0.0, "embedded_seconds": 0.0}
+
+    def route(self, query):
+        start = time.perf_counter()
+        index, confidence = self.lexical.route(query)
+        if confidence >= self.confidence_threshold:
+            self.metrics["local"] += 1
+            self.metrics["local_seconds"] += time.perf_counter() - start
+            return index
+        index, _ = self.semantic.route(query)
+        if self.learn:
+            self.lexical.learn(query, index)
+        self.metrics["embedded"] += 1
+        self.metrics["embedded_seconds"] += time.perf_counter() - start
+        return index
+
+    def template(self, query):
+        return self.semantic.templates[self.route(query)]
+
+    def stats(self):
+        metrics = dict(self.metrics)
+        routed = metrics["local"] + metrics["embedded"]
+        metrics["local_share"] = metrics["local"] / routed if routed else 0.0
+        if metrics["local"] and metrics["embedded"]:
+            # every local decision saved roughly one average embedding round trip
+            saved_per_query = (metrics["embedded_seconds"] / metrics["embedded"]
+                               - metrics["local_seconds"] / metrics["local"])
+            metrics["estimated_seconds_saved"] = metrics["local"] * saved_per_query
+        else:
+            metrics["estimated_seconds_saved"] = None
+        return metrics
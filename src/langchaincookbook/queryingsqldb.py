@@ -2,9 +2,10 @@ import os
 from operator import itemgetter
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_openai.chat_models import ChatOpenAI
-from langchain_community.utilities.sql_database import SQLDatabase
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
+from sql_engine import SQLQAEngine
+from sql_guard import QueryGuard, QueryRejected
 
 
 
@@ -18,19 +19,24 @@ SQL Query:
 
 prompt  = ChatPromptTemplate.from_template(template)
 
-db = SQLDatabase.from_uri("sqlite://///Chinook.db")
+engine = SQLQAEngine("sqlite://///Chinook.db", guard=QueryGuard(max_scan_rows=1_000_000, on_full_scan="limit",
+                                                                timeout_seconds=10))
 
-def get_schema(_):
-    return db.get_table_info()
+def get_schema(x):
+    return engine.schema(x["question"])
 
 def run_query(query):
-    return db.run(query)
+    # the answer prompt explains a rejected query instead of the chain failing
+    try:
+        return engine.run(query)
+    except QueryRejected as e:
+        return f"The query was not run: {e}"
 
 model = ChatOpenAI()
 
+# expects the schema to be assigned already, full_chain builds it once per question
 sql_response = (
-    RunnablePassthrough.assign(schema=get_schema)
-    | prompt
+    prompt
     | model.bind(stop=["\nSQLResult:"])
     | StrOutputParser()
 )
@@ -47,13 +53,23 @@ prompt_response = ChatPromptTemplate.from_template(template)
 
 
 full_chain = (
-    RunnablePassthrough.assign(query=sql_response).assign(
-        schema=get_schema,
-        response=lambda x: db.run(x["query"])
-    )
+    RunnablePassthrough.assign(schema=get_schema)
+    | RunnablePassthrough.assign(query=sql_response)
+    | RunnablePassthrough.assign(response=lambda x: run_query(x["query"]))
     | prompt_response
     | model | StrOutputParser()
 )
 
 print(full_chain.invoke({"question": "How many employees are there?"}))
 
+# batch mode, the questions share the engine's connection pool and schema cache
+questions = [
+    "How many customers are there in each country?",
+    "Which 5 artists have the most albums?",
+    "Which genre has the most tracks?",
+    "How many employees are there?",
+]
+for question, answer in zip(questions, full_chain.batch([{"question": q} for q in questions], config={"max_concurrency": 8})):
+    print(f"{question}\n{answer}\n")
+print(engine.metrics, engine.guard.metrics)
+
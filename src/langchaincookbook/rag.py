@@ -1,4 +1,6 @@
 import os
+import re
+import time
 from operator import itemgetter
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain_core.output_parsers import StrOutputParser
@@ -6,66 +8,30 @@ from langchain_community.vectorstores.faiss import FAISS
 from langchain_core.prompts import ChatPromptTemplate
 from dotenv import load_dotenv
 from langchain_core.runnables import RunnableLambda, RunnablePassthrough, RunnableParallel, Runnable
-from langchain_core.embeddings import Embeddings
-from typing import List
-from langchain_core.runnables.config import run_in_executor
+from cached_embeddings import CachedEmbeddings
+from embedding_client import CustomEmbeddingClass
+from document_store import PersistentFAISSStore
+from context_packer import ContextPacker
 from langchain.schema import format_document
 from langchain_core.messages import AIMessage, HumanMessage, get_buffer_string
 from langchain.prompts.prompt import PromptTemplate
-from langchain.memory import ConversationBufferMemory
+from summary_memory import BoundedSummaryMemory
 
 
 
 load_dotenv()
 
-class CustomEmbeddingClass(Embeddings):
-    
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        """Embed search docs."""
-        from openai import OpenAI
-        client = OpenAI(base_url=os.environ.get("OPENAI_API_BASE"), 
-                        api_key=os.environ.get("OPENAI_API_KEY"))
-        embeddings = []
-        for txt in texts:
-            response = client.embeddings.create(
-                input=txt,
-                model="text-embedding-ada-002"
-            )
-            embedding = response.data[0].embedding["data"][0]["embedding"]
-            embeddings.append(embedding)
-        return embeddings
-
-    def embed_query(self, text: str) -> List[float]:
-        """Embed query text."""
-        from openai import OpenAI
-        client = OpenAI(base_url=os.environ.get("OPENAI_API_BASE"), 
-                        api_key=os.environ.get("OPENAI_API_KEY"))
-        response = client.embeddings.create(
-                input=text,
-                model="text-embedding-ada-002"
-            )
-        embedding = response.data[0].embedding["data"][0]["embedding"]
-        return embedding
-        
-    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
-        """Asynchronous Embed search docs."""
-        return await run_in_executor(None, self.embed_documents, texts)
-
-    async def aembed_query(self, text: str) -> List[float]:
-        """Asynchronous Embed query text."""
-        return await run_in_executor(None, self.embed_query, text)
-
-
-# build the vector store
-vectorstore = FAISS.from_texts(
-    ["harrison worked at kensho"], embedding=CustomEmbeddingClass()
-)
+# load the vector store from disk, only texts it does not hold yet are embedded
+document_store = PersistentFAISSStore("rag", CachedEmbeddings(CustomEmbeddingClass()))
+document_store.sync(["harrison worked at kensho"])
+vectorstore = document_store.vectorstore
 
 # build retreiver from the vector store
 retreiver = vectorstore.as_retriever()
 
-memory = ConversationBufferMemory(
-    return_messages=True, output_key="answer", input_key="question"
+# bounded memory, the condense step and the prompt do not grow with the conversation
+memory = BoundedSummaryMemory(
+    llm=ChatOpenAI(temperature=0), return_messages=True, output_key="answer", input_key="question"
 )
 
 loaded_memory = RunnablePassthrough.assign(
@@ -97,10 +63,14 @@ ANSWER_PROMPT = ChatPromptTemplate.from_template(template)
 DEFAULT_DOCUMENT_PROMPT = PromptTemplate.from_template(template="{page_content}")
 
 
+# retrieved chunks are deduplicated and cut to a token budget before they go into the prompt
+context_packer = ContextPacker(token_budget=int(os.environ.get("CONTEXT_TOKEN_BUDGET", "1500")))
+
+
 def _combine_documents(
     docs, document_prompt=DEFAULT_DOCUMENT_PROMPT, document_separator="\n\n"
 ):
-    doc_strings = [format_document(doc, document_prompt) for doc in docs]
+    doc_strings = [format_document(doc, document_prompt) for doc in context_packer.pack(docs)]
     return document_separator.join(doc_strings)
 
 
@@ -130,13 +100,77 @@ answer = {
     "docs": itemgetter("docs")
 }
 
-final_chain = loaded_memory | standalone_question | retreived_documents | answer
+# the plain sequential chain, kept for comparison
+sequential_chain = loaded_memory | standalone_question | retreived_documents | answer
+
+
+# the optimized chain condenses the question and speculatively retrieves on the raw question at
+# the same time, condensing is skipped without history and the speculative documents are reused
+# when the condensed question barely differs from the raw one
+REUSE_SIMILARITY = 0.8
+stage_latency = {}
+
+condense_question_chain = CONDENSE_QUESTION_PROMPT | ChatOpenAI(temperature=0) | StrOutputParser()
+
+
+def timed(stage, fn):
+    def run(x):
+        start = time.perf_counter()
+        result = fn(x)
+        stage_latency[stage] = time.perf_counter() - start
+        return result
+    return RunnableLambda(run)
+
+
+def _words(text):
+    return set(re.findall(r"\w+", text.lower()))
+
+
+def question_similarity(a, b):
+    a, b = _words(a), _words(b)
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+
+def condense_question(x):
+    if not x["chat_history"]:
+        return x["question"]
+    return condense_question_chain.invoke({
+        "question": x["question"],
+        "chat_history": get_buffer_string(x["chat_history"]),
+    })
+
+
+def retrieve_documents(x):
+    if question_similarity(x["standalone_question"], x["question"]) >= REUSE_SIMILARITY:
+        return x["speculative_docs"]
+    return retreiver.invoke(x["standalone_question"])
+
+
+condense_and_retrieve = RunnableParallel(
+    standalone_question=timed("condense", condense_question),
+    speculative_docs=timed("speculative_retrieval", lambda x: retreiver.invoke(x["question"])),
+    question=itemgetter("question"),
+)
+
+optimized_retreived_documents = {
+    "docs": timed("retrieval", retrieve_documents),
+    "question": itemgetter("standalone_question"),
+}
+
+final_chain = (
+    RunnableLambda(lambda x: stage_latency.clear() or x)
+    | timed("memory", loaded_memory.invoke)
+    | condense_and_retrieve
+    | optimized_retreived_documents
+    | timed("answer", RunnableParallel(answer).invoke)
+)
 
 
 inputs = {"question": "Where did harrison work?"}
 result = final_chain.invoke(inputs)
 
 print(result)
+print({stage: f"{seconds * 1000:.0f} ms" for stage, seconds in stage_latency.items()})
 
 memory.save_context(inputs, {"answer": result["answer"].content})
 
@@ -146,6 +180,7 @@ inputs  = {"question": "but where did he really work?"}
 result = final_chain.invoke(inputs)
 
 print(result)
+print({stage: f"{seconds * 1000:.0f} ms" for stage, seconds in stage_latency.items()})
 
 
 # _inputs = RunnableParallel(
@@ -0,0 +1,201 @@
+"""
+Schema and result caching for the question to SQL chain.
+
+get_table_info() reflects every table and samples rows from each, and the chain asked for it twice
+per question. SQLQAEngine does it once per table per schema version: the table info is cached
+under a fingerprint of the schema (the CREATE statements in sqlite_master for SQLite, the table and
+column names elsewhere), which is checked at most every schema_check_seconds, so a migration is
+picked up without restarting. schema(question) only returns the tables whose names and columns
+match the question (BM25, the same as the prompt router) plus the tables they reference directly through foreign keys,
+which keeps the prompt small on wide databases.
+
+Query results are cached by normalized SQL (whitespace, case outside string literals and a trailing
+semicolon do not matter) for result_ttl_seconds. Queries go through one SQLAlchemy engine with a
+pool of pool_size connections, so chain.batch(..., config={"max_concurrency": n}) answers n
+questions at once. Every query goes through a QueryGuard (sql_guard.py) first, which rejects
+expensive plans, stops slow statements and caps the rows put in the prompt.
+
+python benchmark_sql_engine.py --database Chinook.db compares it with the uncached chain.
+"""
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from sqlalchemy import create_engine, inspect, text
+from langchain_community.utilities.sql_database import SQLDatabase
+from prompt_router import LexicalRouter
+from sql_guard import QueryGuard
+
+_LITERAL = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+_FENCE = re.compile(r"^```(?:sql)?\s*|\s*```$", re.IGNORECASE)
+_CAMEL = re.compile(r"(?<=[a-z])(?=[A-Z])")
+_WORD = re.compile(r"[A-Za-z]+")
+
+
+def normalize_sql(sql):
+    """
+    Cache key form of a query, string literals are kept as they are
+    """
+    parts = _LITERAL.split(sql.strip().rstrip(";").strip())
+    return "".join(part if i % 2 else " ".join(part.lower().split()) for i, part in enumerate(parts))
+
+
+def clean_sql(sql):
+    # models sometimes wrap the query in a markdown fence
+    return _FENCE.sub("", sql.strip()).strip()
+
+
+def _singulars(question):
+    # table names are mostly singular, "employees" should match Employee
+    words = []
+    for word in _WORD.findall(question.lower()):
+        if word.endswith("ies"):
+            words.append(word[:-3] + "y")
+        elif word.endswith("s") and not word.endswith("ss"):
+            words.append(word[:-1])
+    return " ".join([question] + words)
+
+
+def schema_fingerprint(engine):
+    with engine.connect() as connection:
+        if engine.dialect.name == "sqlite":
+            rows = connection.execute(text("SELECT type, name, sql FROM sqlite_master ORDER BY type, name")).fetchall()
+        else:
+            inspector = inspect(connection)
+            rows = [(table, [column["name"] for column in inspector.get_columns(table)])
+                    for table in sorted(inspector.get_table_names())]
+    return hashlib.sha256(repr(rows).encode()).hexdigest()
+
+
+class SQLQAEngine:
+    """
+    Cached, pruned schema text and cached query results over a pooled SQLAlchemy engine
+    """
+
+    def __init__(self, uri, pool_size=8, max_tables=4, min_relative_score=0.5, sample_rows=3,
+                 schema_check_seconds=5.0, result_ttl_seconds=300.0, result_cache_size=1024, guard=None):
+        # an in memory SQLite database lives in a single connection, it has no pool to size
+        memory = uri in ("sqlite://", "sqlite:///:memory:")
+        self.engine = create_engine(uri, **({} if memory else {"pool_size": pool_size, "max_overflow": 0}))
+        self.sample_rows = sample_rows
+        self.db = SQLDatabase(self.engine, sample_rows_in_table_info=sample_rows)
+        self.max_tables = max_tables
+        self.min_relative_score = min_relative_score
+        self.schema_check_seconds = schema_check_seconds
+        self.result_ttl_seconds = result_ttl_seconds
+        self.result_cache_size = result_cache_size
+        self.guard = guard or QueryGuard()
+        self.lock = threading.Lock()
+        self.fingerprint = None
+        self.checked_at = 0.0
+        self.tables = []
+        self.table_info = {}
+        self.related = {}
+        self.router = None
+        self.results = OrderedDict()
+        self.metrics = {"schema_builds": 0, "result_hits": 0, "result_misses": 0, "query_seconds": 0.0}
+
+    def _refresh(self):
+        # called with the lock held
+        now = time.monotonic()
+        if self.fingerprint is not None and now - self.checked_at < self.schema_check_seconds:
+            return
+        self.checked_at = now
+        fingerprint = schema_fingerprint(self.engine)
+        if fingerprint == self.fingerprint:
+            return
+        if self.fingerprint is not None:
+            self.db = SQLDatabase(self.engine, sample_rows_in_table_info=self.sample_rows)
+        inspector = inspect(self.engine)
+        self.tables = sorted(self.db.get_usable_table_names())
+        self.table_info = {}
+        # a key can point at a table outside get_usable_table_names(), e.g. one excluded by include_tables
+        usable = set(self.tables)
+        self.related = {table: {key["referred_table"] for key in inspector.get_foreign_keys(table)} & usable
+                        for table in self.tables}
+        documents = []
+        for table in self.tables:
+            columns = [column["name"] for column in inspector.get_columns(table)]
+            words = [_CAMEL.sub(" ", name).replace("_", " ") for name in [table] + columns]
+            documents.append(" ".join([table] + columns + words))
+        self.router = LexicalRouter(documents)
+        self.results.clear()
+        self.fingerprint = fingerprint
+        self.metrics["schema_builds"] += 1
+
+    def relevant_tables(self, question):
+        with self.lock:
+            self._refresh()
+            return self._relevant_tables(question)
+
+    def _relevant_tables(self, question):
+        # called with the lock held
+        scores = self.router.scores(_singulars(question))
+        tables = self.tables
+        related = self.related
+        # tables that only share a key column with the question score far below the ones it names
+        cutoff = max(scores.max() * self.min_relative_score, 1e-9) if len(scores) else 1e-9
+        picked = [tables[i] for i in scores.argsort()[::-1][:self.max_tables] if scores[i] >= cutoff]
+        if not picked:
+            return list(tables)
+        # and the tables they reference directly, at most max_tables more; following keys further would
+        # pull in most of the schema from any fact table
+        referenced = []
+        for table in picked:
+            referenced.extend(other for other in sorted(related[table]) if other not in picked and other not in referenced)
+        return picked + referenced[:self.max_tables]
+
+    def schema(self, question=None):
+        """
+        CREATE statements and sample rows of the tables relevant to question, of every table without one
+        """
+        with self.lock:
+            self._refresh()
+            fingerprint, db = self.fingerprint, self.db
+            tables = list(self.tables) if question is None else self._relevant_tables(question)
+            cached = {table: self.table_info.get(table) for table in tables}
+        parts = []
+        for table in tables:
+            info = cached[table]
+            if info is None:
+                # read outside the lock, it samples rows; kept only if the schema has not changed meanwhile
+                info = db.get_table_info(table_names=[table])
+                with self.lock:
+                    if self.fingerprint == fingerprint:
+                        self.table_info[table] = info
+            parts.append(info)
+        return "\n\n".join(parts)
+
+    def _execute(self, sql):
+        return self.guard.run(self.engine, sql)
+
+    def pages(self, sql):
+        """
+        Every row of a checked query, a page at a time, for results too big for a prompt
+        """
+        return self.guard.pages(self.engine, clean_sql(sql))
+
+    def run(self, sql):
+        sql = clean_sql(sql)
+        key = normalize_sql(sql)
+        if not key.startswith(("select", "with")):
+            # never cached, the guard rejects statements that change data
+            return self._execute(sql)
+        with self.lock:
+            self._refresh()
+            cached = self.results.get(key)
+            if cached is not None and time.monotonic() - cached[1] < self.result_ttl_seconds:
+                self.results.move_to_end(key)
+                self.metrics["result_hits"] += 1
+                return cached[0]
+            self.metrics["result_misses"] += 1
+        start = time.perf_counter()
+        result = self._execute(sql)
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.metrics["query_seconds"] += elapsed
+            self.results[key] = (result, time.monotonic())
+            if len(self.results) > self.result_cache_size:
+                self.results.popitem(last=False)
+        return result
@@ -0,0 +1,260 @@
+"""
+Checks generated SQL before it runs and keeps what it returns small.
+
+Only a single SELECT (or WITH) statement that reads and writes nothing is accepted: a WITH whose
+main statement changes data is rejected, and so are plans that write (a Transaction or OpenWrite
+opcode in SQLite's EXPLAIN, a ModifyTable or LockRows node on PostgreSQL). Identifiers that happen to
+be keywords (lock, copy, call, ...) are fine, only the plan decides whether a statement writes.
+The statement then runs on a read-only connection (PRAGMA query_only on SQLite, SET TRANSACTION READ
+ONLY on PostgreSQL) whose transaction is always rolled back. Its plan is read first, EXPLAIN QUERY PLAN
+on SQLite and EXPLAIN (FORMAT JSON) on PostgreSQL: the rows a plan examines are estimated from the
+full table scans in it (multiplied, a nested scan is a cartesian product) and the size of each
+scanned table. Above max_scan_rows the query is rejected, or with on_full_scan="limit" wrapped in
+a LIMIT when that stops the scan early. A sort, grouping or aggregate (SELECT COUNT(*) FROM Track)
+has to see every row before its first result, a LIMIT cannot make it cheaper, so such a query is
+rejected as one that cannot be limited whatever on_full_scan says.
+Statements are stopped after timeout_seconds, with a progress handler on SQLite and
+statement_timeout on PostgreSQL; other databases only get the plan independent checks.
+
+Results are read in pages of page_size rows. run() puts at most max_prompt_rows of them in the
+string for the prompt and says when there were more, pages() hands every page to the caller.
+"""
+import re
+import json
+import time
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, OperationalError, ResourceClosedError
+
+_LITERAL = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)")
+_FROM = re.compile(r"(?:\bfrom|\bjoin|,)\s+[\"`\[]?(\w+)[\"`\]]?(?:\s+(?:as\s+)?(\w+))?", re.IGNORECASE)
+_NOT_ALIAS = {"where", "join", "inner", "left", "right", "full", "cross", "natural", "on", "using", "group", "order",
+              "limit", "union", "except", "intersect", "having", "window", "outer"}
+_LIMIT = re.compile(r"\blimit\s+\d+(\s*(offset|,)\s*\d+)?\s*$", re.IGNORECASE)
+_AGGREGATE = re.compile(r"\b(count|sum|avg|min|max|total|group_concat|string_agg|array_agg)\s*\(|\b(group|order)\s+by\b|\bdistinct\b",
+                        re.IGNORECASE)
+# the main statement of a WITH, right after the last common table expression
+_WITH_WRITE = re.compile(r"\)\s*(insert|update|delete|merge|replace)\b", re.IGNORECASE)
+_WRITE_OPCODES = {"OpenWrite", "VUpdate", "CreateBtree", "Destroy", "Clear", "ParseSchema", "DropTable", "DropIndex",
+                  "DropTrigger", "Vacuum"}
+_WRITE_NODES = {"ModifyTable", "LockRows"}
+MAX_STRING_LENGTH = 300
+
+
+class QueryRejected(ValueError):
+    pass
+
+
+def _outside_literals(sql):
+    return " ".join(part for i, part in enumerate(_LITERAL.split(sql)) if not i % 2)
+
+
+def _aliases(sql):
+    # newer SQLite names a scanned table by its alias in the plan
+    aliases = {}
+    for table, alias in _FROM.findall(_outside_literals(sql)):
+        aliases[table] = table
+        if alias and alias.lower() not in _NOT_ALIAS:
+            aliases[alias] = table
+    return aliases
+
+
+def _truncate(value):
+    if isinstance(value, str) and len(value) > MAX_STRING_LENGTH:
+        return value[:MAX_STRING_LENGTH] + "..."
+    return value
+
+
+class QueryGuard:
+    """
+    check() returns the statement to run or raises QueryRejected
+    """
+
+    def __init__(self, max_scan_rows=1_000_000, on_full_scan="reject", auto_limit=1000, timeout_seconds=10.0,
+                 page_size=500, max_prompt_rows=50, row_count_seconds=300.0):
+        if on_full_scan not in ("reject", "limit"):
+            raise ValueError(f"on_full_scan must be 'reject' or 'limit', got {on_full_scan!r}")
+        self.max_scan_rows = max_scan_rows
+        self.on_full_scan = on_full_scan
+        self.auto_limit = auto_limit
+        self.timeout_seconds = timeout_seconds
+        self.page_size = page_size
+        self.max_prompt_rows = max_prompt_rows
+        self.row_count_seconds = row_count_seconds
+        self.row_counts = {}
+        self.metrics = {"checked": 0, "rejected": 0, "limited": 0, "timed_out": 0}
+
+    def _statement(self, sql):
+        sql = sql.strip().rstrip(";").strip()
+        outside = _outside_literals(sql)
+        if ";" in outside:
+            raise QueryRejected("only a single statement can be run")
+        if not re.match(r"^\s*(select|with)\b", outside, re.IGNORECASE):
+            raise QueryRejected("only SELECT statements can be run")
+        write = _WITH_WRITE.search(outside) if re.match(r"^\s*with\b", outside, re.IGNORECASE) else None
+        if write:
+            raise QueryRejected(f"only statements that read can be run, the query is a {write.group(1).upper()}")
+        return sql
+
+    def _sqlite_writes(self, connection, sql):
+        # the bytecode shows every write, including ones in a CTE; Transaction with P2 set opens a write transaction
+        program = connection.execute(text(f"EXPLAIN {sql}")).fetchall()
+        return any(row[1] in _WRITE_OPCODES or (row[1] == "Transaction" and row[3]) for row in program)
+
+    def _table_rows(self, connection, table):
+        # MAX(rowid) reads one index page, COUNT(*) would scan the table this is meant to protect
+        cached = self.row_counts.get(table)
+        if cached is not None and time.monotonic() - cached[1] < self.row_count_seconds:
+            return cached[0]
+        try:
+            rows = connection.execute(text(f'SELECT MAX(rowid) FROM "{table}"')).scalar() or 0
+        except OperationalError:
+            # a WITHOUT ROWID table
+            rows = connection.execute(text(f'SELECT COUNT(*) FROM "{table}"')).scalar() or 0
+        self.row_counts[table] = (rows, time.monotonic())
+        return rows
+
+    def _sqlite_plan(self, connection, sql):
+        plan = connection.execute(text(f"EXPLAIN QUERY PLAN {sql}")).fetchall()
+        details = [row[-1] for row in plan]
+        aliases = _aliases(sql)
+        scanned = 1
+        scans = []
+        for detail in details:
+            match = _SCAN.match(detail)
+            # CTEs and subqueries are costed by the scans of the tables inside them
+            if match and match.group(1) in aliases:
+                table = aliases[match.group(1)]
+                try:
+                    rows = self._table_rows(connection, table)
+                except OperationalError:
+                    # a CTE name, not a table
+                    continue
+                scans.append(f"{table} ({rows} rows)")
+                scanned *= max(rows, 1)
+        sorts = any("TEMP B-TREE" in detail for detail in details)
+        return (scanned if scans else 0), scans, sorts
+
+    def _postgresql_plan(self, connection, sql):
+        plan = connection.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+        plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+        scanned, scans, sorts, nodes = 1, [], False, [plan]
+        while nodes:
+            node = nodes.pop()
+            if node["Node Type"] in _WRITE_NODES:
+                raise QueryRejected(f"only statements that read can be run, the plan has a {node['Node Type']} step")
+            if node["Node Type"] == "Seq Scan":
+                scans.append(f"{node['Relation Name']} ({node['Plan Rows']} rows)")
+                scanned *= max(node["Plan Rows"], 1)
+            sorts = sorts or node["Node Type"] in ("Sort", "Aggregate", "HashAggregate", "GroupAggregate")
+            nodes.extend(node.get("Plans", []))
+        return (scanned if scans else 0), scans, sorts
+
+    def check(self, connection, sql):
+        self.metrics["checked"] += 1
+        try:
+            sql = self._statement(sql)
+            dialect = connection.dialect.name
+            if dialect == "sqlite":
+                if self._sqlite_writes(connection, sql):
+                    raise QueryRejected("only statements that read can be run, the query writes to the database")
+                scanned, scans, sorts = self._sqlite_plan(connection, sql)
+            elif dialect == "postgresql":
+                scanned, scans, sorts = self._postgresql_plan(connection, sql)
+            else:
+                return sql
+            aggregates = sorts or bool(_AGGREGATE.search(_outside_literals(sql)))
+            # a LIMIT stops a scan early unless every row has to be seen for sorting or grouping first
+            if scanned <= self.max_scan_rows or (_LIMIT.search(sql) and not aggregates):
+                return sql
+            reason = f"the query scans about {scanned} rows, more than {self.max_scan_rows}: full scans of {', '.join(scans)}"
+            if aggregates:
+                raise QueryRejected(reason + ", and it cannot be limited: it sorts, groups or aggregates every row "
+                                             "first. Add a WHERE clause on an indexed column")
+            if self.on_full_scan == "limit":
+                self.metrics["limited"] += 1
+                return f"SELECT * FROM ({sql}) AS guarded LIMIT {self.auto_limit}"
+            raise QueryRejected(reason + ", add a WHERE clause on an indexed column or a LIMIT")
+        except QueryRejected:
+            self.metrics["rejected"] += 1
+            raise
+
+    def _read_only(self, connection):
+        # returns a function that makes the pooled connection writable again
+        dialect = connection.dialect.name
+        if dialect == "sqlite":
+            connection.exec_driver_sql("PRAGMA query_only = ON")
+            return lambda: connection.exec_driver_sql("PRAGMA query_only = OFF")
+        if dialect == "postgresql":
+            # has to come before any other statement of the transaction
+            connection.execute(text("SET TRANSACTION READ ONLY"))
+        return lambda: None
+
+    def _set_timeout(self, connection):
+        # returns a function that removes the timeout again
+        dialect = connection.dialect.name
+        if dialect == "sqlite":
+            raw = connection.connection.driver_connection
+            deadline = time.monotonic() + self.timeout_seconds
+            raw.set_progress_handler(lambda: int(time.monotonic() > deadline), 10_000)
+            return lambda: raw.set_progress_handler(None, 0)
+        if dialect == "postgresql":
+            connection.execute(text(f"SET LOCAL statement_timeout = {int(self.timeout_seconds * 1000)}"))
+        return lambda: None
+
+    def pages(self, engine, sql):
+        """
+        Checks sql and yields its rows page_size at a time, the connection is held until the last page
+        """
+        with engine.connect() as connection:
+            writable = self._read_only(connection)
+            clear_timeout = lambda: None
+            try:
+                statement = self.check(connection, sql)
+                clear_timeout = self._set_timeout(connection)
+                result = connection.execution_options(stream_results=True).execute(text(statement))
+                if not result.returns_rows:
+                    self.metrics["rejected"] += 1
+                    raise QueryRejected("the statement returned no rows, only queries can be run")
+                while True:
+                    page = result.fetchmany(self.page_size)
+                    if not page:
+                        return
+                    yield [tuple(_truncate(value) for value in row) for row in page]
+            except ResourceClosedError as e:
+                self.metrics["rejected"] += 1
+                raise QueryRejected("the statement returned no rows, only queries can be run") from e
+            except DBAPIError as e:
+                if "interrupted" in str(e) or "statement timeout" in str(e):
+                    self.metrics["timed_out"] += 1
+                    raise QueryRejected(f"the query was stopped after {self.timeout_seconds} seconds") from e
+                if "readonly database" in str(e) or "read-only transaction" in str(e):
+                    self.metrics["rejected"] += 1
+                    raise QueryRejected("only statements that read can be run, the query tried to write") from e
+                raise
+            finally:
+                clear_timeout()
+                # nothing a checked query did is ever committed
+                connection.rollback()
+                writable()
+
+    def run(self, engine, sql):
+        """
+        Result as a string for the prompt, the first max_prompt_rows rows
+        """
+        rows, more = [], False
+        pages = self.pages(engine, sql)
+        try:
+            for page in pages:
+                rows.extend(page)
+                if len(rows) > self.max_prompt_rows:
+                    more = True
+                    break
+        finally:
+            pages.close()
+        if not rows:
+            return ""
+        shown = str(rows[:self.max_prompt_rows])
+        if more:
+            shown += f"\n(only the first {self.max_prompt_rows} rows are shown, the query returned more)"
+        return shown
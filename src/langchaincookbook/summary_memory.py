@@ -0,0 +1,143 @@
+"""
+Conversation memory with a bounded prompt footprint, a drop in for ConversationBufferMemory.
+
+The last max_turns turns are kept verbatim (fewer when they go over max_recent_tokens) and the
+turns that fall out of that window are folded into a rolling summary by the llm. Summarizing runs
+on a background thread, so save_context returns straight away and the response path never waits
+for it; a turn that is still being folded in is kept verbatim until its summary is ready. While
+the llm keeps failing at most max_folding_turns such turns are kept, the oldest go first. Token
+counts are cached per message, so keeping the window within budget costs nothing per turn.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from pydantic import ConfigDict, PrivateAttr
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, get_buffer_string
+try:
+    from langchain_core.memory import BaseMemory
+except ImportError:
+    # langchain-core 1.x moved the legacy memory classes to langchain-classic
+    from langchain_classic.base_memory import BaseMemory
+from token_counter import TokenCounter
+
+SUMMARY_PROMPT = """Progressively summarize the lines of conversation provided, adding onto the previous summary and returning a new summary.
+Keep names, facts and decisions, drop small talk. Answer with the new summary only.
+
+Current summary:
+{summary}
+
+New lines of conversation:
+{new_lines}
+
+New summary:"""
+
+
+class BoundedSummaryMemory(BaseMemory):
+    """
+    llm is any chat model or runnable that turns a prompt into a message or a string, without one
+    the turns that fall out of the window are dropped
+    """
+
+    llm: Any = None
+    memory_key: str = "history"
+    input_key: Optional[str] = None
+    output_key: Optional[str] = None
+    return_messages: bool = True
+    max_turns: int = 4
+    max_recent_tokens: int = 1000
+    max_folding_turns: int = 4
+    summary: str = ""
+
+    _turns: List[Any] = PrivateAttr(default_factory=list)
+    _folding: List[Any] = PrivateAttr(default_factory=list)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _executor: Any = PrivateAttr(default=None)
+    _pending: Any = PrivateAttr(default=None)
+    _count_tokens: Any = PrivateAttr(default_factory=TokenCounter)
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    def _turn_tokens(self, turn):
+        return sum(self._count_tokens(message.content) for message in turn)
+
+    def messages(self):
+        with self._lock:
+            messages = [SystemMessage(content=f"Summary of the earlier conversation: {self.summary}")] if self.summary else []
+            for turn in self._folding + self._turns:
+                messages.extend(turn)
+        return messages
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        messages = self.messages()
+        return {self.memory_key: messages if self.return_messages else get_buffer_string(messages)}
+
+    def _key(self, values, key, exclude=()):
+        if key is not None:
+            return key
+        keys = [name for name in values if name not in exclude and name != self.memory_key]
+        if len(keys) != 1:
+            raise ValueError(f"set input_key/output_key, got more than one candidate: {keys}")
+        return keys[0]
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        question = inputs[self._key(inputs, self.input_key)]
+        answer = outputs[self._key(outputs, self.output_key, exclude=("source_documents", "generated_question"))]
+        with self._lock:
+            self._turns.append([HumanMessage(content=str(question)), AIMessage(content=str(answer))])
+            evicted = []
+            while len(self._turns) > self.max_turns or (
+                    len(self._turns) > 1 and sum(map(self._turn_tokens, self._turns)) > self.max_recent_tokens):
+                evicted.append(self._turns.pop(0))
+            if not evicted:
+                return
+            if self.llm is None:
+                return
+            self._folding.extend(evicted)
+            # turns only leave the queue once summarized, a failing llm must not let it grow without bound
+            del self._folding[:max(0, len(self._folding) - self.max_folding_turns)]
+            # one worker, so passes never overlap; a pass that finds nothing left to fold returns at once
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory-summary")
+            self._pending = self._executor.submit(self._summarize)
+
+    def _summarize(self):
+        # folds everything queued so far, turns queued while the llm runs get the next pass
+        while True:
+            with self._lock:
+                folding = list(self._folding)
+                summary = self.summary
+            if not folding:
+                return
+            new_lines = get_buffer_string([message for turn in folding for message in turn])
+            try:
+                response = self.llm.invoke(SUMMARY_PROMPT.format(summary=summary or "(none)", new_lines=new_lines))
+            except Exception as e:
+                print(f"Failed to update the conversation summary: {e}")
+                return
+            with self._lock:
+                self.summary = getattr(response, "content", response).strip()
+                # the queue may have been trimmed meanwhile, only the turns folded in this pass leave it
+                folded = {id(turn) for turn in folding}
+                self._folding[:] = [turn for turn in self._folding if id(turn) not in folded]
+
+    def wait(self, timeout=None):
+        """
+        Block until the background summary is up to date
+        """
+        pending = self._pending
+        if pending is not None:
+            pending.result(timeout)
+
+    def prompt_tokens(self):
+        return sum(self._count_tokens(message.content) for message in self.messages())
+
+    def clear(self) -> None:
+        self.wait()
+        with self._lock:
+            self._turns.clear()
+            self._folding.clear()
+            self.summary = ""
@@ -0,0 +1,18 @@
+from langchain_core.embeddings import Embeddings
+from prompt_router import PromptRouter
+
+
+class AsymmetricEmbeddings(Embeddings):
+    # like providers with separate query and document models: the same text gets different vectors
+    def embed_documents(self, texts):
+        return [[1.0, 0.0] if "physics" in text else [0.0, 1.0] for text in texts]
+
+    def embed_query(self, text):
+        return [0.0, 1.0] if "physics" in text else [1.0, 0.0]
+
+
+def test_route_does_not_depend_on_the_batch_size():
+    router = PromptRouter(AsymmetricEmbeddings(), ["math template", "physics template"])
+    alone = PromptRouter(AsymmetricEmbeddings(), ["math template", "physics template"])
+    batch = router.route_batch(["what is physics", "what is a sum"])
+    assert batch == [alone.route("what is physics"), alone.route("what is a sum")]
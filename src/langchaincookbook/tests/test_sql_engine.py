@@ -0,0 +1,32 @@
+import sqlite3
+from sql_engine import SQLQAEngine
+
+
+def _chain_database(path):
+    # each table references the next one: Order -> Customer -> Region -> Country -> Continent
+    connection = sqlite3.connect(path)
+    connection.executescript("""
+        CREATE TABLE Continent (ContinentId INTEGER PRIMARY KEY, Name TEXT);
+        CREATE TABLE Country (CountryId INTEGER PRIMARY KEY, Name TEXT,
+                              ContinentId INTEGER REFERENCES Continent (ContinentId));
+        CREATE TABLE Region (RegionId INTEGER PRIMARY KEY, Name TEXT, CountryId INTEGER REFERENCES Country (CountryId));
+        CREATE TABLE Customer (CustomerId INTEGER PRIMARY KEY, Name TEXT, RegionId INTEGER REFERENCES Region (RegionId));
+        CREATE TABLE Purchase (PurchaseId INTEGER PRIMARY KEY, Total REAL,
+                               CustomerId INTEGER REFERENCES Customer (CustomerId));
+        CREATE TABLE Supplier (SupplierId INTEGER PRIMARY KEY, Name TEXT);
+    """)
+    connection.close()
+    return f"sqlite:///{path}"
+
+
+def test_one_table_question_does_not_return_the_whole_schema(tmp_path):
+    engine = SQLQAEngine(_chain_database(tmp_path / "chain.db"), max_tables=2)
+    assert engine.relevant_tables("what is the total of every purchase") == ["Purchase", "Customer"]
+    schema = engine.schema("what is the total of every purchase")
+    assert "CREATE TABLE" in schema and "Continent" not in schema and "Supplier" not in schema
+
+
+def test_referenced_tables_are_capped_at_max_tables(tmp_path):
+    engine = SQLQAEngine(_chain_database(tmp_path / "chain.db"), max_tables=1)
+    tables = engine.relevant_tables("purchase totals per customer region and country")
+    assert len(tables) <= 2
@@ -0,0 +1,53 @@
+import sqlite3
+import pytest
+from sqlalchemy import create_engine
+from sql_guard import QueryGuard, QueryRejected
+
+
+@pytest.fixture
+def engine(tmp_path):
+    path = tmp_path / "guard.db"
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE Track (TrackId INTEGER PRIMARY KEY, lock INTEGER, copy TEXT, call TEXT, analyze REAL)")
+    connection.executemany("INSERT INTO Track VALUES (?, ?, ?, ?, ?)", [(i, i % 2, "c", "x", 0.5) for i in range(1, 51)])
+    connection.commit()
+    connection.close()
+    return create_engine(f"sqlite:///{path}")
+
+
+def _rows(engine):
+    with engine.connect() as connection:
+        return connection.exec_driver_sql("SELECT COUNT(*) FROM Track").scalar()
+
+
+def test_identifiers_that_are_keywords_can_be_read(engine):
+    assert QueryGuard().run(engine, "SELECT lock, copy, call, analyze FROM Track WHERE TrackId = 1") == "[(1, 'c', 'x', 0.5)]"
+
+
+@pytest.mark.parametrize("sql", [
+    "WITH a AS (SELECT 1) DELETE FROM Track RETURNING TrackId",
+    "WITH a AS (SELECT 1) DELETE FROM Track",
+    "WITH a AS (SELECT 1) UPDATE Track SET lock = 2",
+])
+def test_writes_are_rejected_and_rolled_back(engine, sql):
+    with pytest.raises(QueryRejected):
+        QueryGuard().run(engine, sql)
+    assert _rows(engine) == 50
+
+
+def test_writes_are_caught_by_the_plan_and_the_connection(engine):
+    guard = QueryGuard()
+    guard._statement = lambda sql: sql
+    with pytest.raises(QueryRejected, match="writes to the database"):
+        guard.run(engine, "WITH a AS (SELECT 1) DELETE FROM Track RETURNING TrackId")
+    guard._sqlite_writes = lambda connection, sql: False
+    with pytest.raises(QueryRejected, match="tried to write"):
+        guard.run(engine, "WITH a AS (SELECT 1) DELETE FROM Track")
+    assert _rows(engine) == 50
+
+
+def test_full_scans_are_limited_but_aggregates_cannot_be(engine):
+    guard = QueryGuard(max_scan_rows=10, on_full_scan="limit", auto_limit=5, max_prompt_rows=100)
+    assert guard.run(engine, "SELECT TrackId FROM Track").count("(") == 5
+    with pytest.raises(QueryRejected, match="cannot be limited"):
+        guard.run(engine, "SELECT COUNT(*) FROM Track")
@@ -0,0 +1,68 @@
+import pytest
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.language_models.fake import FakeListLLM
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.retrievers import BaseRetriever
+
+try:
+    from langchain.chains import ConversationalRetrievalChain
+except ImportError:
+    # langchain-core 1.x keeps the chain, and BaseMemory, in langchain-classic
+    ConversationalRetrievalChain = pytest.importorskip("langchain_classic.chains").ConversationalRetrievalChain
+from summary_memory import BoundedSummaryMemory
+
+
+class StaticRetriever(BaseRetriever):
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun):
+        return [Document(page_content="Harrison worked at Kensho.")]
+
+
+def _memory(**kwargs):
+    # the keys multipdf uses with ConversationalRetrievalChain
+    return BoundedSummaryMemory(memory_key="chat_history", return_messages=True, output_key="answer", **kwargs)
+
+
+def test_save_and_load_with_chain_keys():
+    memory = _memory()
+    memory.save_context({"question": "Where did Harrison work?", "chat_history": []},
+                        {"answer": "At Kensho.", "source_documents": [], "generated_question": "Where did Harrison work?"})
+    assert memory.load_memory_variables({"question": "And before?"}) == {
+        "chat_history": [HumanMessage(content="Where did Harrison work?"), AIMessage(content="At Kensho.")]}
+
+
+def test_evicted_turns_are_summarized():
+    memory = _memory(llm=FakeListLLM(responses=["Harrison worked at Kensho."]), max_turns=1)
+    memory.save_context({"question": "Where did Harrison work?"}, {"answer": "At Kensho."})
+    memory.save_context({"question": "What is Kensho?"}, {"answer": "A company."})
+    memory.wait(timeout=10)
+    assert memory.load_memory_variables({})["chat_history"] == [
+        SystemMessage(content="Summary of the earlier conversation: Harrison worked at Kensho."),
+        HumanMessage(content="What is Kensho?"), AIMessage(content="A company.")]
+
+
+def test_conversational_retrieval_chain():
+    llm = FakeListLLM(responses=["At Kensho.", "Where else did Harrison work?", "Nowhere else."])
+    memory = _memory(llm=llm, max_turns=4)
+    chain = ConversationalRetrievalChain.from_llm(llm=llm, retriever=StaticRetriever(), memory=memory)
+    assert chain.invoke({"question": "Where did Harrison work?"})["answer"] == "At Kensho."
+    response = chain.invoke({"question": "Anywhere else?"})
+    assert response["answer"] == "Nowhere else."
+    assert [message.content for message in response["chat_history"]] == ["Where did Harrison work?", "At Kensho."]
+    assert len(memory.load_memory_variables({})["chat_history"]) == 4
+
+
+class FailingLLM:
+    def invoke(self, prompt):
+        raise RuntimeError("the summary model is down")
+
+
+def test_failing_summaries_keep_the_memory_bounded():
+    memory = _memory(llm=FailingLLM(), max_turns=2, max_folding_turns=3)
+    for i in range(20):
+        memory.save_context({"question": f"question {i}"}, {"answer": f"answer {i}"})
+        memory.wait(timeout=10)
+    messages = memory.load_memory_variables({})["chat_history"]
+    # the 3 newest turns that could not be summarized and the 2 recent ones, oldest first
+    assert [message.content for message in messages[::2]] == [f"question {i}" for i in range(15, 20)]
+    assert memory.summary == ""
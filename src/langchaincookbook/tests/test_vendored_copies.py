@@ -0,0 +1,29 @@
+import ast
+from pathlib import Path
+
+COOKBOOK = Path(__file__).resolve().parents[1]
+REPOSITORY = COOKBOOK.parents[1]
+# (cookbook module, vendored copy, the changes the copy is allowed to make)
+VENDORED = [
+    (COOKBOOK / "cached_embeddings.py", REPOSITORY / "crewaiexamples" / "stock_analysis" / "tools" / "cached_embeddings.py", [
+        ("from langchain_core.runnables.config import run_in_executor\n", ""),
+        ("import time\n", "import time\nimport asyncio\n"),
+        ('"..", "embedding_cache"', '"..", ".embedding_cache"'),
+        ("await run_in_executor(", "await asyncio.get_running_loop().run_in_executor("),
+    ]),
+]
+
+
+def _without_docstring(source):
+    docstring = ast.get_docstring(ast.parse(source), clean=False)
+    return source.replace(f'"""{docstring}"""', "", 1)
+
+
+def test_vendored_copies_match_the_cookbook():
+    for original, copy, changes in VENDORED:
+        expected = _without_docstring(original.read_text(encoding="utf-8"))
+        for old, new in changes:
+            assert old in expected, f"{original.name} no longer contains {old!r}, update VENDORED"
+            expected = expected.replace(old, new)
+        assert _without_docstring(copy.read_text(encoding="utf-8")) == expected, \
+            f"{copy} has drifted from {original}, apply the same change to both"
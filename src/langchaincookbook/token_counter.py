@@ -0,0 +1,40 @@
+"""
+Token counting shared by the cookbook modules that budget tokens.
+
+tiktoken is used when it is installed and its encoding can be loaded; the encoding is downloaded on
+first use, so an offline machine falls back to an estimate of four characters per token, like a
+machine without tiktoken. Counts are cached by the sha1 of the text, so a text is counted once.
+"""
+import hashlib
+from collections import OrderedDict
+
+
+class TokenCounter:
+    """
+    Token counts cached by the sha1 of the text, the least recently used counts go first past max_entries
+    """
+
+    def __init__(self, encoding="cl100k_base", max_entries=100_000):
+        try:
+            import tiktoken
+            tokenizer = tiktoken.get_encoding(encoding)
+            self._count = lambda text: len(tokenizer.encode(text, disallowed_special=()))
+        except Exception:
+            self._count = lambda text: len(text) // 4 + 1
+        self.max_entries = max_entries
+        self.cache = OrderedDict()
+        self.metrics = {"hits": 0, "misses": 0}
+
+    def __call__(self, text):
+        key = hashlib.sha1(text.encode()).digest()
+        count = self.cache.get(key)
+        if count is not None:
+            self.cache.move_to_end(key)
+            self.metrics["hits"] += 1
+            return count
+        count = self._count(text)
+        self.metrics["misses"] += 1
+        self.cache[key] = count
+        if len(self.cache) > self.max_entries:
+            self.cache.popitem(last=False)
+        return count
@@ -0,0 +1,157 @@
+"""
+Wikipedia tool with a disk cache and observations cut down to what the question needs.
+
+Search results are stored in SQLite keyed by the normalized query and reused until they are older
+than ttl_seconds, so an agent that repeats a search, in the same run or a later one, does not go
+back to the network. The pages are split into passages of a few sentences, the passages are ranked
+with BM25 against the tool query and the agent's question, and the best ones are kept up to
+max_observation_tokens tokens, in page order. The model then sees a few hundred tokens per call
+instead of up to top_k_results full page summaries.
+"""
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Optional
+from langchain_community.tools import WikipediaQueryRun
+from token_counter import TokenCounter
+from prompt_router import LexicalRouter
+
+TOOL_CACHE_PATH = os.environ.get(
+    "TOOL_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tool_cache", "wikipedia.sqlite"))
+NO_RESULT = "No good Wikipedia Search Result was found"
+_PAGE = re.compile(r"^Page: (.*)$", re.MULTILINE)
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+
+
+class ToolResultCache:
+    """
+    Tool results in SQLite with a time to live, the oldest entries go first past max_entries
+    """
+
+    def __init__(self, path=TOOL_CACHE_PATH, namespace="wikipedia", ttl_seconds=7 * 24 * 3600, max_entries=10_000):
+        self.path = path
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.metrics = {"hits": 0, "misses": 0}
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                result TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            )""")
+        self.connection.commit()
+
+    def _key(self, query):
+        normalized = " ".join(query.lower().split())
+        return hashlib.sha256(f"{self.namespace}\0{normalized}".encode()).hexdigest()
+
+    def get(self, query):
+        with self.lock:
+            row = self.connection.execute("SELECT result, fetched_at FROM results WHERE key = ?",
+                                          (self._key(query),)).fetchone()
+            if row is None or time.time() - row[1] > self.ttl_seconds:
+                self.metrics["misses"] += 1
+                return None
+            self.metrics["hits"] += 1
+            return row[0]
+
+    def put(self, query, result):
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                                    (self._key(query), result, time.time()))
+            self.connection.execute(
+                "DELETE FROM results WHERE key IN "
+                "(SELECT key FROM results ORDER BY fetched_at DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+            self.connection.commit()
+
+
+def split_passages(text, sentences_per_passage=3):
+    """
+    (title, passage) pairs of a WikipediaAPIWrapper result
+    """
+    passages = []
+    starts = list(_PAGE.finditer(text)) or [None]
+    for i, match in enumerate(starts):
+        title = match.group(1).strip() if match else ""
+        start = match.end() if match else 0
+        end = starts[i + 1].start() if i + 1 < len(starts) else len(text)
+        body = text[start:end].strip()
+        if body.startswith("Summary:"):
+            body = body[len("Summary:"):]
+        sentences = [sentence for sentence in _SENTENCE.split(" ".join(body.split())) if sentence]
+        for first in range(0, len(sentences), sentences_per_passage):
+            passages.append((title, " ".join(sentences[first:first + sentences_per_passage])))
+    return passages
+
+
+class CachedWikipediaQueryRun(WikipediaQueryRun):
+    """
+    WikipediaQueryRun with a ToolResultCache and a token cap per observation. Set question to the
+    agent input so passages are ranked against it as well as against the search query
+    """
+
+    cache: Any = None
+    max_observation_tokens: int = 600
+    question: str = ""
+    count_tokens: Any = None
+    metrics: dict = {}
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        if self.cache is None:
+            self.cache = ToolResultCache()
+        if self.count_tokens is None:
+            self.count_tokens = TokenCounter()
+        self.metrics = {"fetch_seconds": 0.0, "raw_tokens": 0, "observation_tokens": 0}
+
+    def fetch(self, query):
+        result = self.cache.get(query)
+        if result is None:
+            start = time.perf_counter()
+            result = self.api_wrapper.run(query)
+            self.metrics["fetch_seconds"] += time.perf_counter() - start
+            # a failed search may succeed later, it is not cached
+            if result != NO_RESULT:
+                self.cache.put(query, result)
+        return result
+
+    def truncate(self, query, result):
+        passages = split_passages(result)
+        if not passages:
+            return result
+        scores = LexicalRouter([f"{title} {passage}" for title, passage in passages]).scores(f"{query} {self.question}")
+        ranked = sorted(range(len(passages)), key=lambda i: (-scores[i], i))
+        picked, used = [], 0
+        for i in ranked:
+            # passages that share no word with the query only fill the budget when nothing matched
+            if scores[i] <= 0 and picked:
+                break
+            tokens = self.count_tokens(passages[i][1])
+            if used + tokens > self.max_observation_tokens:
+                continue
+            picked.append(i)
+            used += tokens
+        pages = {}
+        for i in sorted(picked):
+            title, passage = passages[i]
+            pages.setdefault(title, []).append(passage)
+        return "\n\n".join(f"Page: {title}\n{' ... '.join(texts)}" if title else " ... ".join(texts)
+                           for title, texts in pages.items())
+
+    def _run(self, query: str, run_manager: Optional[Any] = None) -> str:
+        result = self.fetch(query)
+        if result == NO_RESULT:
+            return result
+        observation = self.truncate(query, result)
+        self.metrics["raw_tokens"] += self.count_tokens(result)
+        self.metrics["observation_tokens"] += self.count_tokens(observation)
+        return observation
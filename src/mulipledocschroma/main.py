@@ -13,10 +13,14 @@ from transformers import AutoTokenizer, AutoModelForCausalLM
 from transformers import pipeline 
 from langchain import HuggingFacePipeline 
 from langchain.chains import ConversationalRetrievalChain
-from langchain.memory import ConversationBufferMemory
 from langchain_community.embeddings.openai import OpenAIEmbeddings
 from langchain.chat_models import ChatOpenAI
 
+# retrieved chunks are packed into a token budget by the cookbook's context packer
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "langchaincookbook"))
+from context_packer import ContextPacker, PackedRetriever
+from summary_memory import BoundedSummaryMemory
+
 
 
 def load_documents_from_path(path_name):
@@ -52,13 +56,15 @@ def create_chroma_vector_store(document_chunks, embeddings):
     vectordb.persist()
     return vectordb
 
-def create_memory_store():
-    memory=ConversationBufferMemory(memory_key='chat_history', return_messages=True)
+def create_memory_store(llm=None):
+    # recent turns verbatim plus a rolling summary of the older ones when an llm is given
+    memory=BoundedSummaryMemory(llm=llm, memory_key='chat_history', return_messages=True, output_key='answer')
     return memory
 
 
 def create_pdf_qa(llm, vectordb, memory):
     pdf_qa = ConversationalRetrievalChain(llm=llm,                                        
-                                          retriever=vectordb.as_retriever(search_kwargs={'k':6}),
+                                          retriever=PackedRetriever(retriever=vectordb.as_retriever(search_kwargs={'k':6}),
+                                                                    packer=ContextPacker(token_budget=1500)),
                                           verbose=True, memory=memory
                                         )
\ No newline at end of file
@@ -1,15 +1,23 @@
 import os
+import sys
+import hashlib
 import streamlit as st
 from PyPDF2 import PdfReader
 from dotenv import load_dotenv
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.embeddings import OpenAIEmbeddings, HuggingFaceInstructEmbeddings
 from langchain_community.vectorstores import FAISS
-from langchain.memory import ConversationBufferMemory
 from langchain.chains import ConversationalRetrievalChain
 from langchain_community.chat_models import ChatOpenAI
 from htmlTemplates import css, bot_template, user_template
 
+# embeddings are cached on disk by the cookbook's shared embedding cache
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "langchaincookbook"))
+from cached_embeddings import CachedEmbeddings
+from document_store import PersistentFAISSStore
+from context_packer import ContextPacker, PackedRetriever
+from summary_memory import BoundedSummaryMemory
+
 
 
 def get_pdf_text(pdf_docs):
@@ -34,17 +42,27 @@ def get_text_chunks(raw_text):
     chunks = text_splitter.split_text(raw_text)
     return chunks
 
-def get_vectorstore(text_chunks):
-    embeddings = OpenAIEmbeddings(
+def get_store_name(pdf_docs):
+    # one store per set of uploaded documents, whatever their order, so sessions never search each other's files
+    digest = hashlib.sha256()
+    for file_hash in sorted(hashlib.sha256(pdf.getvalue()).digest() for pdf in pdf_docs):
+        digest.update(file_hash)
+    return f"multipdf-{digest.hexdigest()[:16]}"
+
+
+def get_vectorstore(store_name, text_chunks):
+    embeddings = CachedEmbeddings(OpenAIEmbeddings(
         openai_api_key=os.environ.get('OPENAI_API_KEY'),
         openai_api_base=os.environ.get('OPENAI_API_BASE')
-    )
+    ))
     
     # embeddings = HuggingFaceInstructEmbeddings(
     #     model_name="hkunlp/instructor-xl"
     # )
-    vectorstore = FAISS.from_texts(texts=text_chunks, embedding=embeddings)
-    return vectorstore
+    # the store on disk is brought in line with the uploaded documents, unchanged chunks are not re-embedded
+    document_store = PersistentFAISSStore(store_name, embeddings)
+    document_store.sync(text_chunks)
+    return document_store
 
 
 def get_conversation_chain(vectorstore):
@@ -52,10 +70,13 @@ def get_conversation_chain(vectorstore):
     Create chatbot that uses memory
     """
     llm  = ChatOpenAI()
-    memory = ConversationBufferMemory(memory_key="chat_history",
-                                      return_messages=True)
+    memory = BoundedSummaryMemory(llm=llm, memory_key="chat_history",
+                                  return_messages=True, output_key="answer")
+    # overlapping chunks are deduplicated and the context is kept within a token budget
+    retriever = PackedRetriever(retriever=vectorstore.as_retriever(search_kwargs={"k": 6}),
+                                packer=ContextPacker(token_budget=1500))
     conversation_chain = ConversationalRetrievalChain.from_llm(llm=llm, 
-                                                               retriever=vectorstore,
+                                                               retriever=retriever,
                                                                memory=memory)
     return conversation_chain
                                                             
@@ -105,8 +126,11 @@ def main():
                 raw_text = get_pdf_text(pdf_docs)
                 # break the pdf text chunks
                 text_chunks = get_text_chunks(raw_text)
+                if not text_chunks:
+                    st.warning("No text could be read from the uploaded documents")
+                    return
                 # create embeddings for pdf chunks
-                vectorstore = get_vectorstore(text_chunks)
+                vectorstore = get_vectorstore(get_store_name(pdf_docs), text_chunks)
 
                 # create conversation chain
                 st.session_state.conversation_chain = get_conversation_chain(vectorstore)
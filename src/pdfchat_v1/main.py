@@ -1,4 +1,5 @@
 import os
+import sys
 from dotenv import load_dotenv
 import pickle
 import streamlit as st 
@@ -12,6 +13,10 @@ from langchain.chains.question_answering import load_qa_chain
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
 
+# embeddings are cached on disk by the cookbook's shared embedding cache
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "langchaincookbook"))
+from cached_embeddings import CachedEmbeddings
+
 
 # set sidebar content, why are we using the with keyword to the do the sidebar
 with st.sidebar:
@@ -54,7 +59,7 @@ def handlePdf(pdf):
     # create embeddings using openai embeddings
     else:
         with open(f"{store_name}.pkl", "wb") as f:
-            embeddings = HuggingFaceEmbeddings()
+            embeddings = CachedEmbeddings(HuggingFaceEmbeddings())
             VectorStore = FAISS.from_texts(chunks, embedding=embeddings)
             pickle.dump(VectorStore, f)
             f.close()